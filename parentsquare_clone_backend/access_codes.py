@@ -0,0 +1,30 @@
+import secrets
+import string
+
+CODE_CHARS = string.ascii_uppercase + string.digits
+
+
+def generate_access_code(length=10):
+    """Generates a random alphanumeric code."""
+    return ''.join(secrets.choice(CODE_CHARS) for _ in range(length))
+
+
+def generate_unique_access_codes(cursor, count, length=10):
+    """Generates `count` codes that are distinct and not yet in AccessCodes.
+
+    Candidates are checked against the table in one query per round, so a
+    bulk import pays for a single lookup rather than one per code.
+    """
+    codes = set()
+    while len(codes) < count:
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            code = generate_access_code(length)
+            if code not in codes:
+                candidates.add(code)
+
+        placeholders = ', '.join(['%s'] * len(candidates))
+        cursor.execute(f"SELECT code FROM AccessCodes WHERE code IN ({placeholders})", tuple(candidates))
+        taken = {row['code'] for row in cursor.fetchall()}
+        codes |= candidates - taken
+    return list(codes)
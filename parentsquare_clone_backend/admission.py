@@ -0,0 +1,238 @@
+"""Admission control: shed excess requests before they cost anything.
+
+Two checks run before a request reaches its view. Token buckets limit how
+often one client IP, and one email address, may hit the password routes,
+which blunts credential stuffing and retry storms. Lanes cap how many
+requests of a kind run at once: password work gets a small lane, sized to
+the bcrypt executor, so a login flood queues at most that many hashes and
+is turned away with 429 beyond it, while feed reads run in their own lane
+and keep flowing.
+
+Buckets live in process memory by default. DatabaseBuckets keeps them in
+the RateLimitBuckets table instead, so every worker process shares one
+limit.
+"""
+import hashlib
+import math
+import threading
+import time
+
+# RateLimitBuckets.bucket_key is a VARCHAR(255).
+MAX_KEY_LENGTH = 255
+
+
+def _refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+def _wait(tokens, rate):
+    return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+
+def storage_key(key):
+    """`key`, or its kind and a digest if it is too long for the key column."""
+    if len(key) <= MAX_KEY_LENGTH:
+        return key
+    kind = key.partition(':')[0][:32]
+    return f"{kind}:sha256:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+class MemoryBuckets:
+    """Token buckets in this process's memory; limits are per worker process."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take_all(self, limits):
+        """Takes one token from each (key, rate, burst) bucket, or from none of them.
+
+        Returns each bucket's wait: all 0.0 if the tokens were taken,
+        otherwise the seconds until a short bucket has one again.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens = []
+            for key, rate, burst in limits:
+                held, updated, _ = self._buckets.get(key, (burst, now, now))
+                tokens.append(_refill(held, updated, now, rate, burst))
+            waits = [_wait(held, rate) for held, (_, rate, _) in zip(tokens, limits)]
+            if any(waits):
+                return waits
+            for held, (key, rate, burst) in zip(tokens, limits):
+                self._buckets[key] = (held - 1, now, now + (burst - held + 1) / rate)
+            if len(self._buckets) > self.max_keys:
+                # A bucket that has refilled is the same as no bucket.
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        return waits
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseBuckets:
+    """Token buckets in the RateLimitBuckets table, shared by every worker process.
+
+    A take reads the buckets and writes them back in one transaction, each
+    only if nobody else did in between (compare-and-set on updated_at). On
+    a conflict it rolls back and retries. Buckets idle for longer than
+    `retain` seconds are pruned now and then.
+    """
+
+    def __init__(self, pool, retain=3600, prune_every=1000, attempts=5):
+        self.pool = pool
+        self.retain = retain
+        self.prune_every = prune_every
+        self.attempts = attempts
+        self._takes = 0
+        self._lock = threading.Lock()
+
+    def take_all(self, limits):
+        """Takes one token from each (key, rate, burst) bucket, or from none of them."""
+        connection = self.pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                for _ in range(self.attempts):
+                    waits = self._take_once(cursor, limits)
+                    if waits is not None:
+                        connection.commit()
+                        break
+                    connection.rollback()
+                else:
+                    # Too contended to settle: the buckets are clearly busy.
+                    waits = [1 / rate for _, rate, _ in limits]
+                self._maybe_prune(cursor)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            self.pool.release(connection, discard=True)
+            raise
+        self.pool.release(connection)
+        return waits
+
+    def _take_once(self, cursor, limits):
+        """One compare-and-set attempt; returns the waits, or None if another writer won."""
+        now = time.time()
+        keys = [storage_key(key) for key, _, _ in limits]
+        cursor.execute(f"SELECT bucket_key, tokens, updated_at FROM RateLimitBuckets WHERE bucket_key IN ({', '.join(['%s'] * len(keys))})",
+                       keys)
+        rows = {row['bucket_key']: row for row in cursor.fetchall()}
+        tokens = [burst if key not in rows else _refill(rows[key]['tokens'], rows[key]['updated_at'], now, rate, burst)
+                  for key, (_, rate, burst) in zip(keys, limits)]
+        waits = [_wait(held, rate) for held, (_, rate, _) in zip(tokens, limits)]
+        if any(waits):
+            return waits
+        for key, held in zip(keys, tokens):
+            if key not in rows:
+                cursor.execute("INSERT IGNORE INTO RateLimitBuckets (bucket_key, tokens, updated_at) VALUES (%s, %s, %s)",
+                               (key, held - 1, now))
+            else:
+                cursor.execute("UPDATE RateLimitBuckets SET tokens = %s, updated_at = %s WHERE bucket_key = %s AND updated_at = %s",
+                               (held - 1, now, key, rows[key]['updated_at']))
+            if cursor.rowcount != 1:
+                return None
+        return waits
+
+    def _maybe_prune(self, cursor):
+        with self._lock:
+            self._takes += 1
+            due = self._takes % self.prune_every == 0
+        if due:
+            cursor.execute("DELETE FROM RateLimitBuckets WHERE updated_at < %s", (time.time() - self.retain,))
+
+    def clear(self):
+        connection = self.pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM RateLimitBuckets")
+            connection.commit()
+        finally:
+            self.pool.release(connection)
+
+
+class Lane:
+    """Caps how many requests of one kind run at once; `limit` 0 means no cap."""
+
+    def __init__(self, name, limit=0):
+        self.name = name
+        self.limit = limit
+        self.in_flight = 0
+        self.peak = 0
+
+
+class AdmissionController:
+    """Rate-limits password routes per IP and per email, and runs each request in a lane.
+
+    `admit` returns None when the request may proceed, and the caller must
+    `release` its lane afterwards; otherwise it returns (reason, seconds to
+    wait) for a 429. Rates are per second. If the bucket store fails, the
+    request is let through rather than failing logins with it.
+    """
+
+    def __init__(self, buckets, lanes, ip_rate, ip_burst, email_rate, email_burst, log=None):
+        self.buckets = buckets
+        self.lanes = {lane.name: lane for lane in lanes}
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.email_rate = email_rate
+        self.email_burst = email_burst
+        self.log = log
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'shed_ip': 0, 'shed_email': 0, 'bucket_errors': 0}
+        for name in self.lanes:
+            self._stats[f'shed_{name}'] = 0
+
+    def admit(self, lane, ip=None, email=None):
+        limits = []
+        if ip is not None:
+            limits.append(('ip', f'ip:{ip}', self.ip_rate, self.ip_burst))
+        if email:
+            limits.append(('email', f'email:{email.strip().lower()}', self.email_rate, self.email_burst))
+        if limits:
+            # All buckets or none: a request one limit turns away costs the others nothing.
+            waits = self._take([(key, rate, burst) for _, key, rate, burst in limits])
+            for (reason, _, _, _), wait in zip(limits, waits):
+                if wait:
+                    return self._shed(reason, wait)
+
+        if lane is not None:
+            lane = self.lanes[lane]
+            with self._lock:
+                if lane.limit and lane.in_flight >= lane.limit:
+                    self._stats[f'shed_{lane.name}'] += 1
+                    # A slot frees up as soon as one in-flight request ends.
+                    return lane.name, 1
+                lane.in_flight += 1
+                lane.peak = max(lane.peak, lane.in_flight)
+        with self._lock:
+            self._stats['admitted'] += 1
+        return None
+
+    def _take(self, limits):
+        try:
+            return self.buckets.take_all(limits)
+        except Exception:
+            with self._lock:
+                self._stats['bucket_errors'] += 1
+            if self.log is not None:
+                self.log(f"Rate limit check failed for {', '.join(key for key, _, _ in limits)}")
+            return [0.0] * len(limits)
+
+    def _shed(self, reason, wait):
+        with self._lock:
+            self._stats[f'shed_{reason}'] += 1
+        return reason, max(1, math.ceil(wait))
+
+    def release(self, lane):
+        with self._lock:
+            self.lanes[lane].in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            for name, lane in self.lanes.items():
+                snapshot[f'in_flight_{name}'] = lane.in_flight
+                snapshot[f'peak_in_flight_{name}'] = lane.peak
+        return snapshot
@@ -1,12 +1,43 @@
-from flask import Flask, request, jsonify
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import create_access_token, JWTManager, jwt_required, get_jwt_identity, get_jwt
+from flask import Flask, request, jsonify, g, has_request_context, send_file
+from functools import wraps, partial
+import click
+from flask_jwt_extended import create_access_token, JWTManager, jwt_required, get_jwt_identity, get_jwt, verify_jwt_in_request
 import pymysql.cursors
 import os
-import string
-import random
 from dotenv import load_dotenv
 from flask_cors import CORS
+from werkzeug.test import EnvironBuilder
+from db_pool import ConnectionPool, PoolTimeout
+from db_router import DatabaseRouter, PrimaryPins
+from user_cache import UserProfileCache
+from pagination import DEFAULT_PAGE_SIZE, InvalidPageRequest, Page, parse_page_args, keyset_filter, split_page, encode_cursor
+import feed_inbox
+import local_db
+import schema_migrations
+import query_plans
+import json
+import hmac
+import metrics
+from streaming import RowStream, stream_rows_response, wants_ndjson
+from feed_cache import FeedCache, ALL_POSTS_SCOPE, class_scope, user_scope
+from passwords import PasswordHasher
+from access_codes import generate_unique_access_codes
+from roster_import import RosterImport, parse_csv, parse_ndjson
+from post_events import EventBroker, LocalBackend, DatabaseBackend, format_event
+import notifications
+import admission
+import search_index
+import shards
+import attachments
+import post_archive
+import read_receipts
+import atexit
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import datetime
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -15,7 +46,7 @@ load_dotenv()
 # App Configuration
 # -----------------
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Read-Primary'])
 
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['JWT_SECRET_KEY'] = os.getenv('SECRET_KEY')
@@ -25,42 +56,939 @@ app.config['MYSQL_USER'] = os.getenv('MYSQL_USER')
 app.config['MYSQL_PASSWORD'] = os.getenv('MYSQL_PASSWORD')
 app.config['MYSQL_DB'] = os.getenv('MYSQL_DB')
 
-bcrypt = Bcrypt(app)
+# 'sqlite' runs against the local_db stand-in (benchmarks, offline development).
+app.config['DB_BACKEND'] = os.getenv('DB_BACKEND', 'mysql')
+app.config['SQLITE_PATH'] = os.getenv('SQLITE_PATH', 'parentsquare.sqlite3')
+
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 10))
+app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', 5))
+app.config['DB_POOL_MAX_LIFETIME'] = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))
+app.config['DB_POOL_HEALTH_CHECK_INTERVAL'] = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', 30))
+
+# Read replicas for GET requests: comma-separated MySQL hosts ("host" or
+# "host:port"), or database files when DB_BACKEND=sqlite. Empty disables them.
+app.config['DB_REPLICAS'] = [replica.strip() for replica in os.getenv('DB_REPLICAS', '').split(',') if replica.strip()]
+# How long a replica that failed to connect is skipped.
+app.config['DB_REPLICA_RETRY_SECONDS'] = float(os.getenv('DB_REPLICA_RETRY_SECONDS', 30))
+# How long a user's reads stay on the primary after they write; keep it above the replication lag.
+app.config['READ_YOUR_WRITES_SECONDS'] = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+
+# More shards for schools' rows: "name=primary[,replica...]" entries separated
+# by ";", hosts or database files as for DB_REPLICAS. The database above is
+# always the 'default' shard and holds the shard map. Empty means one shard.
+app.config['DB_SHARDS'] = shards.parse_shard_config(os.getenv('DB_SHARDS', ''))
+# How long the shard map is cached; a school move waits this long between steps.
+app.config['SHARD_MAP_TTL'] = float(os.getenv('SHARD_MAP_TTL', 5))
+
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 10000))
+app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 300))
+
+app.config['FEED_CACHE_SIZE'] = int(os.getenv('FEED_CACHE_SIZE', 5000))
+app.config['FEED_CACHE_TTL'] = float(os.getenv('FEED_CACHE_TTL', 60))
+
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASHER_EXECUTOR'] = os.getenv('PASSWORD_HASHER_EXECUTOR', 'process')
+app.config['PASSWORD_HASHER_WORKERS'] = int(os.getenv('PASSWORD_HASHER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+app.config['ROSTER_IMPORT_CHUNK_SIZE'] = int(os.getenv('ROSTER_IMPORT_CHUNK_SIZE', 500))
+
+# Admission control: per-IP and per-email rate limits on the password routes
+# (per minute, with bursts) and concurrency caps per lane; 0 means no cap.
+# ADMISSION_BACKEND 'database' shares the rate limits between worker processes.
+app.config['ADMISSION_ENABLED'] = os.getenv('ADMISSION_ENABLED', 'true').lower() in ('true', '1', 'yes')
+app.config['ADMISSION_BACKEND'] = os.getenv('ADMISSION_BACKEND', 'memory')
+app.config['ADMISSION_IP_PER_MINUTE'] = float(os.getenv('ADMISSION_IP_PER_MINUTE', 60))
+app.config['ADMISSION_IP_BURST'] = int(os.getenv('ADMISSION_IP_BURST', 20))
+app.config['ADMISSION_EMAIL_PER_MINUTE'] = float(os.getenv('ADMISSION_EMAIL_PER_MINUTE', 6))
+app.config['ADMISSION_EMAIL_BURST'] = int(os.getenv('ADMISSION_EMAIL_BURST', 5))
+app.config['ADMISSION_AUTH_CONCURRENCY'] = int(os.getenv('ADMISSION_AUTH_CONCURRENCY', 2 * app.config['PASSWORD_HASHER_WORKERS']))
+app.config['ADMISSION_WRITE_CONCURRENCY'] = int(os.getenv('ADMISSION_WRITE_CONCURRENCY', 0))
+app.config['ADMISSION_READ_CONCURRENCY'] = int(os.getenv('ADMISSION_READ_CONCURRENCY', 0))
+# Take the client IP from X-Forwarded-For; only behind a proxy that sets it.
+app.config['ADMISSION_TRUST_FORWARDED'] = os.getenv('ADMISSION_TRUST_FORWARDED', 'false').lower() in ('true', '1', 'yes')
+
+# Post attachments: files under ATTACHMENT_DIR, which every app server must
+# share, up to ATTACHMENT_MAX_BYTES each. Files without references are deleted
+# after ATTACHMENT_GC_GRACE seconds and uploads never attached to a post after
+# ATTACHMENT_UPLOAD_TTL; ATTACHMENT_GC_INTERVAL 0 leaves that to `flask attachments gc`.
+app.config['ATTACHMENT_DIR'] = os.path.abspath(os.getenv('ATTACHMENT_DIR', 'attachments'))
+app.config['ATTACHMENT_MAX_BYTES'] = int(os.getenv('ATTACHMENT_MAX_BYTES', 25 * 1024 * 1024))
+app.config['ATTACHMENT_GC_INTERVAL'] = float(os.getenv('ATTACHMENT_GC_INTERVAL', 300))
+app.config['ATTACHMENT_GC_GRACE'] = float(os.getenv('ATTACHMENT_GC_GRACE', 3600))
+app.config['ATTACHMENT_UPLOAD_TTL'] = float(os.getenv('ATTACHMENT_UPLOAD_TTL', 86400))
+
+# Archiving: posts created before the horizon move to PostsArchive, where
+# feeds only look when asked with ?archived=true. The horizon is the start of
+# the current school year if ARCHIVE_SCHOOL_YEAR_START ('MM-DD') is set, else
+# ARCHIVE_AFTER_DAYS ago; with neither, nothing is archived. The archiver runs
+# every ARCHIVE_INTERVAL seconds (0: only `flask archive run`), in batches of
+# ARCHIVE_BATCH_SIZE posts with ARCHIVE_BATCH_PAUSE seconds between them.
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv('ARCHIVE_AFTER_DAYS', 0))
+app.config['ARCHIVE_SCHOOL_YEAR_START'] = post_archive.parse_school_year_start(os.getenv('ARCHIVE_SCHOOL_YEAR_START', ''))
+app.config['ARCHIVE_INTERVAL'] = float(os.getenv('ARCHIVE_INTERVAL', 3600))
+app.config['ARCHIVE_BATCH_SIZE'] = int(os.getenv('ARCHIVE_BATCH_SIZE', 500))
+app.config['ARCHIVE_BATCH_PAUSE'] = float(os.getenv('ARCHIVE_BATCH_PAUSE', 0.1))
+
+# Read receipts: the feed pages parents and students load count as reads.
+# They are buffered in memory and written every READ_FLUSH_SECONDS, or once
+# READ_FLUSH_SIZE (post, user) pairs are pending. At most READ_BUFFER_MAX
+# pairs are held; reads past that are dropped.
+app.config['READ_RECEIPTS_ENABLED'] = os.getenv('READ_RECEIPTS_ENABLED', 'true').lower() in ('true', '1', 'yes')
+app.config['READ_FLUSH_SECONDS'] = float(os.getenv('READ_FLUSH_SECONDS', 5))
+app.config['READ_FLUSH_SIZE'] = int(os.getenv('READ_FLUSH_SIZE', 1000))
+app.config['READ_BUFFER_MAX'] = int(os.getenv('READ_BUFFER_MAX', 100000))
+
+# Most sub-requests one POST /api/batch may carry.
+app.config['BATCH_MAX_REQUESTS'] = int(os.getenv('BATCH_MAX_REQUESTS', 10))
+
+app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() in ('true', '1', 'yes')
+# If set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>".
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+# Requests slower than this are logged with their query breakdown; 0 disables the log.
+app.config['SLOW_REQUEST_MS'] = float(os.getenv('SLOW_REQUEST_MS', 0))
+metrics.enabled = app.config['METRICS_ENABLED']
+
+# 'local' delivers post events within one process; use 'database' when
+# running several workers.
+app.config['EVENTS_BACKEND'] = os.getenv('EVENTS_BACKEND', 'local')
+app.config['EVENTS_BUFFER_SIZE'] = int(os.getenv('EVENTS_BUFFER_SIZE', 100))
+app.config['EVENTS_REPLAY_SIZE'] = int(os.getenv('EVENTS_REPLAY_SIZE', 1000))
+app.config['EVENTS_POLL_INTERVAL'] = float(os.getenv('EVENTS_POLL_INTERVAL', 0.5))
+app.config['EVENTS_HEARTBEAT_SECONDS'] = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+# Streams are closed after this long so clients reconnect and pick up class changes.
+app.config['EVENTS_STREAM_MAX_SECONDS'] = float(os.getenv('EVENTS_STREAM_MAX_SECONDS', 300))
+
+# Post notifications, sent by `flask notifications worker`. NOTIFY_TRANSPORT is
+# 'file' (appends JSON lines to NOTIFY_FILE_PATH) or 'smtp'.
+app.config['NOTIFY_TRANSPORT'] = os.getenv('NOTIFY_TRANSPORT', 'file')
+app.config['NOTIFY_FILE_PATH'] = os.getenv('NOTIFY_FILE_PATH', 'notifications.jsonl')
+app.config['SMTP_HOST'] = os.getenv('SMTP_HOST', 'localhost')
+app.config['SMTP_PORT'] = int(os.getenv('SMTP_PORT', 25))
+app.config['SMTP_USER'] = os.getenv('SMTP_USER')
+app.config['SMTP_PASSWORD'] = os.getenv('SMTP_PASSWORD')
+app.config['SMTP_USE_TLS'] = os.getenv('SMTP_USE_TLS', 'false').lower() in ('true', '1', 'yes')
+app.config['NOTIFY_SENDER'] = os.getenv('NOTIFY_SENDER', 'noreply@parentsquare.local')
+app.config['NOTIFY_BATCH_SIZE'] = int(os.getenv('NOTIFY_BATCH_SIZE', 100))
+# Messages per second per school, per worker process.
+app.config['NOTIFY_RATE_PER_SCHOOL'] = float(os.getenv('NOTIFY_RATE_PER_SCHOOL', 20))
+app.config['NOTIFY_MAX_ATTEMPTS'] = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 6))
+app.config['NOTIFY_BACKOFF_SECONDS'] = float(os.getenv('NOTIFY_BACKOFF_SECONDS', 30))
+
+passwords = PasswordHasher(rounds=app.config['BCRYPT_LOG_ROUNDS'],
+                           max_workers=app.config['PASSWORD_HASHER_WORKERS'],
+                           executor=app.config['PASSWORD_HASHER_EXECUTOR'],
+                           observe=partial(metrics.observe_stage, 'bcrypt'))
 jwt = JWTManager(app)
 
 # -----------------
-# Helper Function for Database Connection
+# Helper Functions for Database Connection
 # -----------------
-def get_db_connection():
-    """Connects to the MySQL database."""
-    return pymysql.connect(host=app.config['MYSQL_HOST'],
+def connect_to_mysql(host=None):
+    """Opens a new connection to the MySQL database, or to the replica at `host`."""
+    host, _, port = (host or app.config['MYSQL_HOST']).partition(':')
+    return pymysql.connect(host=host,
+                           port=int(port or 3306),
                            user=app.config['MYSQL_USER'],
                            password=app.config['MYSQL_PASSWORD'],
                            database=app.config['MYSQL_DB'],
                            cursorclass=pymysql.cursors.DictCursor)
 
+def connect_to_database(host=None):
+    """Opens a new connection to the configured database backend.
+
+    That is the primary unless `host` names another server (a replica or a
+    shard's primary): a MySQL host, or a database file when DB_BACKEND=sqlite.
+    """
+    if app.config['DB_BACKEND'] == 'sqlite':
+        return local_db.connect(host or app.config['SQLITE_PATH'])
+    return connect_to_mysql(host)
+
+def create_pool(connect):
+    return ConnectionPool(metrics.instrument_connect(connect) if app.config['METRICS_ENABLED'] else connect,
+                          max_size=app.config['DB_POOL_SIZE'],
+                          checkout_timeout=app.config['DB_POOL_TIMEOUT'],
+                          max_lifetime=app.config['DB_POOL_MAX_LIFETIME'],
+                          health_check_interval=app.config['DB_POOL_HEALTH_CHECK_INTERVAL'])
+
+def create_router(primary_pool, replicas):
+    return DatabaseRouter(primary_pool,
+                          [(replica, create_pool(partial(connect_to_database, replica))) for replica in replicas],
+                          retry_interval=app.config['DB_REPLICA_RETRY_SECONDS'])
+
+# The default shard's primary pool; CLI commands and background workers
+# that aren't per shard use it directly.
+db_pool = create_pool(connect_to_database)
+db_router = create_router(db_pool, app.config['DB_REPLICAS'])
+# Every shard's router, the default shard first.
+shard_routers = {shards.DEFAULT_SHARD: db_router}
+for shard_name, (shard_host, shard_replicas) in app.config['DB_SHARDS'].items():
+    shard_routers[shard_name] = create_router(create_pool(partial(connect_to_database, shard_host)), shard_replicas)
+shard_map = shards.ShardMap(db_pool, shard_routers, ttl=app.config['SHARD_MAP_TTL'])
+# Runs a district-wide query on every shard at once.
+shard_executor = ThreadPoolExecutor(max_workers=4 * len(shard_routers), thread_name_prefix='shard-scatter')
+primary_pins = PrimaryPins(app.config['SECRET_KEY'], window=app.config['READ_YOUR_WRITES_SECONDS'])
+# Carries a user's pin to the primary from their write to their next requests.
+READ_PRIMARY_HEADER = 'X-Read-Primary'
+READ_METHODS = ('GET', 'HEAD')
+# POST endpoints that only read, so they don't pin their caller to the primary.
+READ_ONLY_ENDPOINTS = ('batch_requests',)
+
+def request_shard():
+    """The shard the current request works on.
+
+    That is the one the view picked (g.db_shard) for a row found by
+    find_on_shards, else the caller's school's shard.
+    """
+    if 'db_shard' in g:
+        return g.db_shard
+    user = g.get('current_user')
+    return shard_map.lookup(user['school_id'] if user else None).shard
+
+def get_db_connection(shard=None):
+    """Returns the request's pooled connection to a shard, checking one out on first use.
+
+    `shard` defaults to request_shard(). GET requests read from a replica
+    unless they carry their user's pin from a write within the last
+    READ_YOUR_WRITES_SECONDS; everything else uses the primary.
+    """
+    shard = shard or request_shard()
+    connections = g.setdefault('db_connections', {})
+    if shard not in connections:
+        user = g.get('current_user')
+        read_only = (has_request_context() and request.method in READ_METHODS
+                     and not (user and primary_pins.is_pinned(request.headers.get(READ_PRIMARY_HEADER), user['id'])))
+        with metrics.timed('db_checkout'):
+            connections[shard] = shard_routers[shard].acquire(read_only)
+        if connections[shard][2]:
+            g.db_replica = connections[shard][2]
+    return connections[shard][1]
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Returns the request's connections to their pools once the request ends."""
+    for pool, connection, _ in g.pop('db_connections', {}).values():
+        pool.release(connection, discard=exception is not None)
+
+def scatter(fn):
+    """Calls fn(shard, connection) for every shard at once; returns {shard: result}.
+
+    Each shard gets the request's connection to it. With a single shard
+    the call runs inline.
+    """
+    connections = {shard: get_db_connection(shard) for shard in shard_routers}
+    if len(connections) == 1:
+        return {shard: fn(shard, connection) for shard, connection in connections.items()}
+    futures = {shard: shard_executor.submit(fn, shard, connection) for shard, connection in connections.items()}
+    return {shard: future.result() for shard, future in futures.items()}
+
+def find_on_shards(query, params):
+    """Looks a row up on every shard; returns (shard, row), or (None, None) if none has it.
+
+    `query` must select the row's school_id: while a school is being moved
+    its rows are on two shards, and the one the shard map names wins.
+    """
+    def lookup(shard, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+
+    found = [(shard, row) for shard, row in scatter(lookup).items() if row]
+    for shard, row in found:
+        if shard_map.lookup(row['school_id']).shard == shard:
+            return shard, row
+    return found[0] if found else (None, None)
+
+def emails_registered(emails):
+    """Which of `emails` any shard has a user for."""
+    def lookup(shard, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT email FROM Users WHERE email IN ({', '.join(['%s'] * len(emails))})", emails)
+            return {row['email'] for row in cursor.fetchall()}
+    return set().union(*scatter(lookup).values())
+
+def email_registered(email):
+    return bool(emails_registered([email]))
+
+def ensure_writable(school_id):
+    """Raises SchoolMoving if the school's rows are being moved to another shard."""
+    if shard_map.lookup(school_id).frozen:
+        raise shards.SchoolMoving(school_id)
+
+@app.after_request
+def pin_writer_to_primary(response):
+    """Sends a user's reads to the primary for a while after a successful write.
+
+    The response carries the pin; the client sends it back as the
+    X-Read-Primary header, so it holds on every worker.
+    """
+    user = g.get('current_user')
+    if (user and request.method not in READ_METHODS and request.endpoint not in READ_ONLY_ENDPOINTS
+            and response.status_code < 400):
+        g.pinned_user_id = user['id']
+    if 'pinned_user_id' in g:
+        response.headers[READ_PRIMARY_HEADER] = primary_pins.issue(g.pinned_user_id)
+    return response
+
+@app.errorhandler(PoolTimeout)
+def handle_pool_timeout(e):
+    return jsonify({'message': 'Server is busy, please try again shortly'}), 503, {'Retry-After': '1'}
+
+@app.errorhandler(shards.SchoolMoving)
+def handle_school_moving(e):
+    return jsonify({'message': 'This school is being moved, please try again shortly'}), 503, \
+        {'Retry-After': str(int(app.config['SHARD_MAP_TTL']) + 1)}
+
 # -----------------
-# Helper Function to Generate a Random Code
+# Helper Function to Upgrade Password Hashes
 # -----------------
-def generate_access_code(length=10):
-    """Generates a unique random alphanumeric code."""
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(random.choice(chars) for _ in range(length))
+def rehash_password(connection, user_id, password):
+    """Re-hashes a password at the configured cost after a successful login."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE Users SET password_hash = %s WHERE id = %s",
+                           (passwords.hash(password), user_id))
+        connection.commit()
+        user_profiles.invalidate(user_id)
+    except Exception:
+        # The old hash still works, so never fail the login over this.
+        connection.rollback()
+        app.logger.exception('Failed to rehash password for user %s', user_id)
 
 # -----------------
-# Role-Based Access Control Helper
+# Role-Based Access Control Helpers
 # -----------------
+user_profiles = UserProfileCache(max_size=app.config['USER_CACHE_SIZE'],
+                                 ttl=app.config['USER_CACHE_TTL'])
+
+def get_user_profile(user_id):
+    """Returns a user's id, names, email, role and school_id, cached per process."""
+    profile = user_profiles.get(user_id)
+    if profile is not None:
+        return profile
+
+    sql = "SELECT id, first_name, last_name, email, role, school_id FROM Users WHERE id = %s"
+    if 'current_user' in g or 'db_shard' in g:
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (user_id,))
+            profile = cursor.fetchone()
+    else:
+        # Not authenticated by role_required, so the user's shard isn't known yet.
+        _, profile = find_on_shards(sql, (user_id,))
+    if profile:
+        user_profiles.put(user_id, profile)
+    return profile
+
 def get_user_role(user_id):
     """Returns the role of a user."""
-    connection = get_db_connection()
-    try:
+    profile = get_user_profile(user_id)
+    return profile['role'] if profile else None
+
+def authenticated_profile(locations=None):
+    """Verifies the request's JWT and returns the caller's id, role and school_id.
+
+    Role and school_id are read from the token's signed claims, so this
+    costs no extra queries. Tokens issued before school_id was added to the
+    claims fall back to the user-profile cache.
+    """
+    with metrics.timed('jwt'):
+        verify_jwt_in_request(locations=locations)
+    user_id = int(get_jwt_identity())
+    claims = get_jwt()
+    if 'role' in claims and 'school_id' in claims:
+        return {'id': user_id, 'role': claims['role'], 'school_id': claims['school_id']}
+    return get_user_profile(user_id)
+
+def role_required(*roles, message='Access denied', locations=None):
+    """Requires a valid JWT whose user has one of `roles`.
+
+    The caller's profile is available to the view as `g.current_user`.
+    Sub-requests of a batch reuse the profile the batch authenticated.
+    `locations` overrides where the token is looked for (see
+    verify_jwt_in_request). Writes are refused while the caller's school
+    is being moved between shards.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if 'batch_user' in g:
+                profile = g.batch_user
+            else:
+                profile = authenticated_profile(locations)
+
+            if not profile or profile['role'] not in roles:
+                return jsonify({'message': message}), 403
+
+            g.current_user = profile
+            if request.method not in READ_METHODS and request.endpoint not in READ_ONLY_ENDPOINTS:
+                ensure_writable(profile['school_id'])
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# -----------------
+# Feed Pagination and Streaming Helpers
+# -----------------
+def fetch_post_feed(cursor, query, params, page, keyword='AND', alias='p', id_column='id', posts_table='Posts',
+                    **fragments):
+    """Runs a feed query one keyset page at a time, or unpaged if `page` is None.
+
+    `query` must contain a `{page_filter}` placeholder where the keyset
+    condition goes and end with `ORDER BY <alias>.created_at DESC, <alias>.<id_column> DESC`.
+    A `{posts_table}` placeholder is filled with `posts_table`, and any
+    other placeholders from `fragments`.
+    Unpaged feeds come back as a RowStream over a server-side cursor rather
+    than a list, so they can be streamed to the client.
+    """
+    page_sql, page_params = keyset_filter(page, alias=alias, id_column=id_column, keyword=keyword)
+    query = query.format(page_filter=page_sql, posts_table=posts_table, **fragments)
+    params = tuple(params) + page_params
+    if page is None:
+        return RowStream(get_db_connection(), query, params)
+
+    cursor.execute(query + " LIMIT %s", params + (page.limit + 1,))
+    posts, next_cursor = split_page(cursor.fetchall(), page)
+    return {'posts': posts, 'next_cursor': next_cursor}
+
+def newest_first(row):
+    return row['created_at'], row['id']
+
+def unique_posts(rows):
+    """Drops repeats of the same post, which a school being moved has on two shards."""
+    last_id = None
+    for row in rows:
+        if row['id'] != last_id:
+            yield row
+        last_id = row['id']
+
+def fetch_district_feed(query, params, page, keyword='AND', posts_table='Posts'):
+    """fetch_post_feed over every shard at once, merged newest first (scatter-gather).
+
+    Each shard returns at most one page past the cursor, so the merged
+    page is exact. Unpaged, the shards' streams are merged as they are read.
+    """
+    page_sql, page_params = keyset_filter(page, keyword=keyword)
+    query = query.format(page_filter=page_sql, posts_table=posts_table)
+    params = tuple(params) + page_params
+    if page is None:
+        streams = [RowStream(get_db_connection(shard), query, params) for shard in shard_routers]
+        return unique_posts(heapq.merge(*streams, key=newest_first, reverse=True))
+
+    def fetch(shard, connection):
         with connection.cursor() as cursor:
-            sql = "SELECT role FROM Users WHERE id = %s"
-            cursor.execute(sql, (user_id,))
-            user = cursor.fetchone()
-            return user['role'] if user else None
-    finally:
-        connection.close()
+            cursor.execute(query + " LIMIT %s", params + (page.limit + 1,))
+            return cursor.fetchall()
+
+    rows = unique_posts(heapq.merge(*scatter(fetch).values(), key=newest_first, reverse=True))
+    posts, next_cursor = split_page(list(itertools.islice(rows, page.limit + 1)), page)
+    return {'posts': posts, 'next_cursor': next_cursor}
+
+def fetch_with_archive(posts, page, fetch_archived):
+    """Continues a live feed into PostsArchive, for requests with ?archived=true.
+
+    `posts` is the live feed as fetch_post_feed returned it, and
+    `fetch_archived(page)` reads the same feed from the archive. Archived
+    posts all sort after live ones, so a page reads the archive only once
+    the live rows run out, picking up after the last of them.
+    """
+    if page is None:
+        def rows():
+            yield from posts
+            # Only now: a connection runs one streaming query at a time.
+            yield from fetch_archived(None)
+        return rows()
+    if posts['next_cursor'] is not None:
+        return posts
+
+    rows = posts['posts']
+    after = (str(rows[-1]['created_at']), rows[-1]['id']) if rows else page.after
+    remaining = page.limit - len(rows)
+    older = fetch_archived(Page(max(remaining, 1), after))
+    if remaining == 0:
+        return dict(posts, next_cursor=encode_cursor(rows[-1]) if older['posts'] else None)
+    return dict(posts, posts=rows + older['posts'], next_cursor=older['next_cursor'])
+
+def feed_response(posts, page, cache_key=None, versions=None, reads=False):
+    """Returns a paged feed as JSON, or streams an unpaged one (NDJSON on request).
+
+    Paged feeds with a `cache_key` are stored in the feed cache under the
+    `versions` snapshot taken before they were queried, and carry an ETag.
+    With `reads`, the caller is recorded as having read the posts.
+    """
+    if page is None:
+        if reads:
+            posts = record_streamed_reads(posts)
+        return stream_rows_response(posts, ndjson=wants_ndjson(request))
+    post_ids = [post['id'] for post in posts['posts']]
+    if reads:
+        record_reads(post_ids)
+    # A page read from a replica soon after a write may predate it; don't cache it.
+    if cache_key is None or (g.get('db_replica') and
+                             not post_feeds.settled(versions, app.config['READ_YOUR_WRITES_SECONDS'])):
+        return jsonify(posts), 200
+    entry = post_feeds.put(cache_key, versions, jsonify(posts).get_data(), post_ids)
+    return conditional_feed_response(entry)
+
+# -----------------
+# Feed Cache Helpers
+# -----------------
+post_feeds = FeedCache(max_entries=app.config['FEED_CACHE_SIZE'],
+                       ttl=app.config['FEED_CACHE_TTL'])
+
+# The classes whose posts make up each role's feed.
+FEED_CLASSES_SQL = {
+    'parent': """
+        SELECT DISTINCT se.class_id
+        FROM ParentStudentLinks psl
+        JOIN StudentEnrollments se ON se.student_id = psl.student_id
+        WHERE psl.parent_user_id = %s
+    """,
+    'student': """
+        SELECT se.class_id
+        FROM Students s
+        JOIN StudentEnrollments se ON se.student_id = s.id
+        WHERE s.user_id = %s
+    """,
+}
+
+def snapshot_feed_versions(cursor, role, user_id, page):
+    """Returns the version snapshot a feed depends on; call before querying it.
+
+    Unpaged (streamed) feeds are never cached, so they get no snapshot.
+    """
+    if page is None:
+        return None
+    if role == 'school_admin':
+        return post_feeds.snapshot([ALL_POSTS_SCOPE])
+    cursor.execute(FEED_CLASSES_SQL[role], (user_id,))
+    scopes = [user_scope(user_id)] + [class_scope(row['class_id']) for row in cursor.fetchall()]
+    return post_feeds.snapshot(scopes)
+
+def conditional_feed_response(entry):
+    """Serves a cached feed body, or 304 if the client's ETag still matches."""
+    response = app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def cached_feed_response(cache_key, page, reads=False):
+    """Answers a paged feed request from the cache, or returns None on a miss."""
+    if page is None:
+        return None
+    entry = post_feeds.get(cache_key)
+    if entry is None:
+        return None
+    if reads:
+        record_reads(entry.post_ids)
+    return conditional_feed_response(entry)
+
+# Parent and student feeds read from the materialized inbox once it is ready.
+INBOX_FEED_SQL = """
+    SELECT p.id, p.title, p.content, p.created_at, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
+    FROM FeedInbox f
+    JOIN Posts p ON p.id = f.post_id
+    JOIN Classes c ON p.class_id = c.id
+    JOIN Users u ON p.user_id = u.id
+    WHERE f.user_id = %s{page_filter}
+    ORDER BY f.created_at DESC, f.post_id DESC
+"""
+
+def fetch_inbox_feed(cursor, user_id, page, query=INBOX_FEED_SQL):
+    """Reads a user's feed from their inbox, or returns None if it isn't ready yet."""
+    if not feed_inbox.inbox_ready(cursor, user_id):
+        return None
+    return fetch_post_feed(cursor, query, (user_id,), page, alias='f', id_column='post_id')
+
+# A parent's feed: each post once, however many of their children it
+# concerns. The inbox already holds one row per post; class_id is selected
+# so annotate_children can say which children each post is for.
+PARENT_INBOX_FEED_SQL = """
+    SELECT p.id, p.title, p.content, p.created_at, p.class_id, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
+    FROM FeedInbox f
+    JOIN Posts p ON p.id = f.post_id
+    JOIN Classes c ON p.class_id = c.id
+    JOIN Users u ON p.user_id = u.id
+    WHERE f.user_id = %s{page_filter}
+    ORDER BY f.created_at DESC, f.post_id DESC
+"""
+
+# The same feed from the posts of the children's classes, for parents whose
+# inbox isn't ready, for the per-child filter and for archived posts. The IN subquery is a
+# semi-join, so a class shared by siblings contributes its posts once.
+PARENT_FEED_SQL = """
+    SELECT p.id, p.title, p.content, p.created_at, p.class_id, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
+    FROM {posts_table} p
+    JOIN Classes c ON p.class_id = c.id
+    JOIN Users u ON p.user_id = u.id
+    WHERE p.class_id IN (
+        SELECT se.class_id
+        FROM ParentStudentLinks psl
+        JOIN StudentEnrollments se ON se.student_id = psl.student_id
+        WHERE psl.parent_user_id = %s{child_filter}
+    ){page_filter}
+    ORDER BY p.created_at DESC, p.id DESC
+"""
+
+def fetch_parent_children(cursor, parent_user_id):
+    """Returns (children, {class_id: [student_id, ...]}) for a parent, in one query."""
+    cursor.execute("""
+        SELECT s.id, s.first_name, s.last_name, se.class_id
+        FROM ParentStudentLinks psl
+        JOIN Students s ON s.id = psl.student_id
+        LEFT JOIN StudentEnrollments se ON se.student_id = s.id
+        WHERE psl.parent_user_id = %s
+        ORDER BY s.id
+    """, (parent_user_id,))
+    children, class_children = {}, {}
+    for row in cursor.fetchall():
+        children.setdefault(row['id'], {'id': row['id'], 'first_name': row['first_name'], 'last_name': row['last_name']})
+        if row['class_id'] is not None:
+            class_children.setdefault(row['class_id'], []).append(row['id'])
+    return list(children.values()), class_children
+
+def annotate_children(post, class_children):
+    """Adds the ids of the children a post concerns (all of them in its class)."""
+    post['student_ids'] = class_children.get(post['class_id'], [])
+    return post
+
+@app.errorhandler(InvalidPageRequest)
+def handle_invalid_page_request(e):
+    return jsonify({'message': str(e)}), 400
+
+# -----------------
+# Real-time Post Event Helpers
+# -----------------
+if app.config['EVENTS_BACKEND'] == 'database':
+    event_backend = DatabaseBackend(db_pool, poll_interval=app.config['EVENTS_POLL_INTERVAL'])
+else:
+    event_backend = LocalBackend()
+post_events = EventBroker(event_backend,
+                          buffer_size=app.config['EVENTS_BUFFER_SIZE'],
+                          replay_size=app.config['EVENTS_REPLAY_SIZE'])
+
+# The classes whose post events each role receives. Admins get their whole school.
+EVENT_CLASSES_SQL = dict(FEED_CLASSES_SQL, **{
+    'teacher': "SELECT id AS class_id FROM Classes WHERE teacher_id = %s",
+    'school_admin': "SELECT id AS class_id FROM Classes WHERE school_id = %s",
+})
+
+def caller_class_ids(cursor):
+    """The classes whose posts the caller may see, by the rules their events and feed follow."""
+    user = g.current_user
+    param = user['school_id'] if user['role'] == 'school_admin' else user['id']
+    cursor.execute(EVENT_CLASSES_SQL[user['role']], (param,))
+    return [row['class_id'] for row in cursor.fetchall()]
+
+def publish_post_event(event_type, class_id, data):
+    """Publishes a post event after its change has committed; never fails the request."""
+    try:
+        post_events.publish(event_type, class_id, data)
+    except Exception:
+        app.logger.exception('Failed to publish %s for class %s', event_type, class_id)
+
+# Other workers' post writes invalidate this process's cached feeds too.
+post_events.add_listener(post_feeds.apply_event)
+
+# -----------------
+# Search Helpers
+# -----------------
+post_search = search_index.SearchIndex([router.primary for router in shard_routers.values()])
+post_events.add_listener(post_search.apply_event)
+
+@app.before_request
+def warm_search_index():
+    """Starts building the search index when the first request arrives."""
+    if post_search.ready:
+        return
+    try:
+        # Listen before loading so no post created meanwhile is missed.
+        post_events.start()
+        post_search.ensure_built()
+    except Exception:
+        app.logger.exception('Failed to start the search index build')
+
+# -----------------
+# Archive Helpers
+# -----------------
+def archive_horizon():
+    return post_archive.archive_horizon(datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None),
+                                        app.config['ARCHIVE_AFTER_DAYS'], app.config['ARCHIVE_SCHOOL_YEAR_START'])
+
+def publish_archived_posts(rows):
+    """Tells every worker which posts were archived, one event per class."""
+    post_ids = {}
+    for row in rows:
+        post_ids.setdefault(row['class_id'], []).append(row['id'])
+    post_feeds.bump(ALL_POSTS_SCOPE, *(class_scope(class_id) for class_id in post_ids))
+    for class_id, ids in post_ids.items():
+        publish_post_event('posts_archived', class_id, {'class_id': class_id, 'ids': ids})
+
+post_archiver = post_archive.Archiver([router.primary for router in shard_routers.values()], archive_horizon,
+                                      interval=app.config['ARCHIVE_INTERVAL'],
+                                      batch_size=app.config['ARCHIVE_BATCH_SIZE'],
+                                      pause=app.config['ARCHIVE_BATCH_PAUSE'],
+                                      on_archived=publish_archived_posts,
+                                      log=app.logger.warning)
+
+@app.before_request
+def start_post_archiver():
+    if app.config['ARCHIVE_INTERVAL'] > 0 and archive_horizon() is not None:
+        post_archiver.start()
+
+# -----------------
+# Read Receipt Helpers
+# -----------------
+read_buffer = read_receipts.ReadBuffer({shard: router.primary for shard, router in shard_routers.items()},
+                                       flush_size=app.config['READ_FLUSH_SIZE'],
+                                       flush_interval=app.config['READ_FLUSH_SECONDS'],
+                                       max_pending=app.config['READ_BUFFER_MAX'],
+                                       log=app.logger.warning)
+atexit.register(read_buffer.close)
+
+def record_reads(post_ids):
+    """Counts the posts as read by the caller; written behind, never in the request."""
+    if app.config['READ_RECEIPTS_ENABLED'] and post_ids:
+        read_buffer.record(request_shard(), g.current_user['id'], post_ids)
+
+def record_streamed_reads(rows):
+    """Passes an unpaged feed through, recording each post as it is sent."""
+    if not app.config['READ_RECEIPTS_ENABLED']:
+        return rows
+    shard, user_id = request_shard(), g.current_user['id']
+
+    def reading():
+        for row in rows:
+            yield row
+            read_buffer.record(shard, user_id, (row['id'],))
+    return reading()
+
+# -----------------
+# Attachment Helpers
+# -----------------
+attachment_store = attachments.BlobStore(app.config['ATTACHMENT_DIR'])
+attachment_gc = attachments.GarbageCollector(attachment_store, db_pool,
+                                             [router.primary for router in shard_routers.values()],
+                                             interval=app.config['ATTACHMENT_GC_INTERVAL'],
+                                             grace=app.config['ATTACHMENT_GC_GRACE'],
+                                             upload_ttl=app.config['ATTACHMENT_UPLOAD_TTL'],
+                                             log=app.logger.warning)
+
+@app.before_request
+def start_attachment_gc():
+    if app.config['ATTACHMENT_GC_INTERVAL'] > 0:
+        attachment_gc.start()
+
+def release_attachments(sha256s):
+    """Drops the blob references of deleted attachment rows; a failure only leaks the blobs."""
+    try:
+        attachments.update_references(db_pool, attachments.release_references, sha256s)
+    except Exception:
+        app.logger.exception('Failed to release %d attachment reference(s)', len(sha256s))
+
+def attachment_json(row):
+    return {'id': row['id'], 'filename': row['filename'], 'content_type': row['content_type'], 'size': row['size']}
+
+# -----------------
+# Batch Request Helpers
+# -----------------
+# The GET requests behind each role's first screen, returned by
+# POST /api/login when it is asked for the dashboard.
+DASHBOARD_REQUESTS = {
+    'student': ('/api/student/dashboard', '/api/student/posts'),
+    'parent': ('/api/parent/posts',),
+    'school_admin': ('/api/admin/posts',),
+    'teacher': (),
+}
+# Endpoints a batch can't include: streams never finish, and files aren't JSON.
+BATCH_EXCLUDED_ENDPOINTS = ('post_event_stream', 'download_attachment')
+
+def parse_batch_paths(calls):
+    """Returns the paths of a batch's sub-requests, or None unless each is a GET to the API."""
+    if not isinstance(calls, list) or not calls:
+        return None
+    paths = []
+    for call in calls:
+        if not isinstance(call, dict) or str(call.get('method', 'GET')).upper() != 'GET':
+            return None
+        path = call.get('path')
+        if not isinstance(path, str) or not path.startswith('/api/'):
+            return None
+        paths.append(path)
+    return paths
+
+def dispatch_batch_call(held_lane):
+    """Runs the view for the current sub-request and returns its response."""
+    try:
+        if request.routing_exception is not None:
+            raise request.routing_exception
+        if request.endpoint in BATCH_EXCLUDED_ENDPOINTS:
+            return app.make_response((jsonify({'message': 'This endpoint cannot be batched'}), 400))
+        rejection = admit_batch_call(held_lane)
+        if rejection is not None:
+            return app.make_response(rejection)
+        if 'batch_user' not in g:
+            g.batch_user = authenticated_profile()
+        rv = app.view_functions[request.endpoint](**request.view_args)
+    except Exception as e:
+        rv = app.handle_user_exception(e)
+    return app.make_response(rv)
+
+def run_batch(paths, authorization):
+    """Runs GET sub-requests in order and returns their statuses and bodies.
+
+    They share this request's database connection and the caller's
+    profile, which is authenticated once. Sub-requests skip the
+    before/after-request hooks, so the batch is metered as one request.
+    Each is admitted to its own route's lane, except one in the lane this
+    request already holds, which runs in its slot.
+    """
+    held_lane = request.environ.get('admission.lane')
+    results = []
+    for path in paths:
+        environ = EnvironBuilder(path=path, base_url=request.host_url,
+                                 headers={'Authorization': authorization}).get_environ()
+        with app.request_context(environ):
+            response = dispatch_batch_call(held_lane)
+            body = response.get_json(silent=True)
+        results.append({'path': path, 'status': response.status_code,
+                        'body': body if body is not None else {'message': response.status}})
+    return results
+
+def parse_last_event_id():
+    """Reads the id an EventSource resumes from (header on reconnect, or ?last_event_id=)."""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+# -----------------
+# Metrics
+# -----------------
+metrics.REGISTRY.register_stats('db_pool', 'Connection pool', db_pool.stats,
+                                gauges=('max_size', 'size', 'idle', 'in_use', 'peak_in_use'))
+metrics.REGISTRY.register_stats('db_router', 'Read replica routing', db_router.stats,
+                                gauges=('replicas', 'healthy_replicas'))
+metrics.REGISTRY.register_stats('shard_map', 'School shard map', shard_map.stats,
+                                gauges=('shards', 'mapped_schools', 'frozen_schools'))
+metrics.REGISTRY.register_stats('primary_pins', 'Read-your-writes pins to the primary', primary_pins.stats)
+metrics.REGISTRY.register_stats('user_cache', 'User profile cache', user_profiles.stats, gauges=('size',))
+metrics.REGISTRY.register_stats('feed_cache', 'Feed page cache', post_feeds.stats, gauges=('size',))
+metrics.REGISTRY.register_stats('search_index', 'Post search index', post_search.stats,
+                                gauges=('posts', 'terms', 'ready'))
+metrics.REGISTRY.register_stats('attachment_gc', 'Attachment garbage collection', attachment_gc.stats)
+metrics.REGISTRY.register_stats('post_archive', 'Post archiving', post_archiver.stats)
+metrics.REGISTRY.register_stats('read_receipts', 'Read receipt buffer', read_buffer.stats, gauges=('pending',))
+metrics.REGISTRY.register_stats('post_events', 'Real-time post events', post_events.stats, gauges=('subscribers',))
+
+@app.before_request
+def start_request_trace():
+    metrics.start_trace()
+
+@app.after_request
+def record_request_metrics(response):
+    """Records the request's latency, size and queries, and logs it if slow."""
+    trace = metrics.end_trace()
+    if trace is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    # Read from the header: computing it would buffer a streamed response.
+    size = response.content_length
+    metrics.observe_request(trace, request.method, endpoint, response.status_code, size)
+
+    elapsed_ms = trace.elapsed() * 1000
+    if app.config['SLOW_REQUEST_MS'] and elapsed_ms >= app.config['SLOW_REQUEST_MS']:
+        entry = {'method': request.method, 'endpoint': endpoint, 'status': response.status_code,
+                 'ms': round(elapsed_ms, 3), 'response_bytes': size}
+        entry.update(trace.breakdown())
+        app.logger.warning('Slow request: %s', json.dumps(entry))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify({'message': 'Unauthorized'}), 401
+    return app.response_class(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# -----------------
+# Admission Control
+# -----------------
+# Routes that do password work: they share the small 'auth' lane.
+AUTH_ENDPOINTS = ('login', 'register_school_admin', 'register_parent', 'add_teacher')
+# Unauthenticated password routes, rate-limited per IP and per email.
+RATE_LIMITED_ENDPOINTS = ('login', 'register_school_admin', 'register_parent')
+# Never laned: streams would hold a slot for minutes.
+UNLANED_ENDPOINTS = ('post_event_stream', 'metrics_endpoint')
+
+admission_control = admission.AdmissionController(
+    admission.DatabaseBuckets(db_pool) if app.config['ADMISSION_BACKEND'] == 'database' else admission.MemoryBuckets(),
+    [admission.Lane('auth', app.config['ADMISSION_AUTH_CONCURRENCY']),
+     admission.Lane('write', app.config['ADMISSION_WRITE_CONCURRENCY']),
+     admission.Lane('read', app.config['ADMISSION_READ_CONCURRENCY'])],
+    ip_rate=app.config['ADMISSION_IP_PER_MINUTE'] / 60, ip_burst=app.config['ADMISSION_IP_BURST'],
+    email_rate=app.config['ADMISSION_EMAIL_PER_MINUTE'] / 60, email_burst=app.config['ADMISSION_EMAIL_BURST'],
+    log=app.logger.warning)
+metrics.REGISTRY.register_stats('admission', 'Admission control', admission_control.stats,
+                                gauges=('in_flight_auth', 'in_flight_write', 'in_flight_read',
+                                        'peak_in_flight_auth', 'peak_in_flight_write', 'peak_in_flight_read'))
+
+def request_lane():
+    """The lane the current request runs in, or None if it isn't laned."""
+    if request.endpoint is None or request.endpoint in UNLANED_ENDPOINTS:
+        return None
+    if request.endpoint in AUTH_ENDPOINTS:
+        return 'auth'
+    if request.method in READ_METHODS or request.endpoint in READ_ONLY_ENDPOINTS:
+        return 'read'
+    return 'write'
+
+def client_ip():
+    if app.config['ADMISSION_TRUST_FORWARDED'] and request.access_route:
+        return request.access_route[0]
+    return request.remote_addr
+
+@app.before_request
+def admit_request():
+    """Turns a request away with 429 if it is over a rate limit or its lane is full."""
+    if not app.config['ADMISSION_ENABLED']:
+        return
+    lane = request_lane()
+    ip = email = None
+    if request.endpoint in RATE_LIMITED_ENDPOINTS:
+        ip = client_ip()
+        email = (request.get_json(silent=True) or {}).get('email')
+        if not isinstance(email, str):
+            email = None
+    rejection = admission_control.admit(lane, ip, email)
+    if rejection is not None:
+        return too_many_requests(rejection)
+    # Kept in the environ, not g, which a batch's sub-requests share.
+    request.environ['admission.lane'] = lane
+
+def admit_batch_call(held_lane):
+    """Admits a batch sub-request to its lane; returns a 429 response if the lane is full."""
+    if not app.config['ADMISSION_ENABLED']:
+        return None
+    lane = request_lane()
+    if lane is None or lane == held_lane:
+        return None
+    rejection = admission_control.admit(lane)
+    if rejection is not None:
+        return too_many_requests(rejection)
+    # Released by release_admission_lane when the sub-request's context ends.
+    request.environ['admission.lane'] = lane
+    return None
+
+def too_many_requests(rejection):
+    _, retry_after = rejection
+    return jsonify({'message': 'Too many requests, please try again shortly'}), 429, {'Retry-After': str(retry_after)}
+
+@app.teardown_request
+def release_admission_lane(exception):
+    lane = request.environ.pop('admission.lane', None)
+    if lane is not None:
+        admission_control.release(lane)
 
 # -----------------
 # API Endpoints
@@ -82,18 +1010,23 @@ def register_school_admin():
     if not all([school_name, first_name, last_name, email, password]):
         return jsonify({'message': 'Missing required fields'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = passwords.hash(password)
 
-    connection = get_db_connection()
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id FROM Users WHERE email = %s", (email,))
-            if cursor.fetchone():
-                return jsonify({'message': 'Email already registered'}), 409
+        if email_registered(email):
+            return jsonify({'message': 'Email already registered'}), 409
 
+        # A new school goes to the shard with the fewest schools.
+        g.db_shard = shard_map.placement_for_new_school()
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
             sql_school = "INSERT INTO Schools (name) VALUES (%s)"
             cursor.execute(sql_school, (school_name,))
             school_id = cursor.lastrowid
+            # Mapped before the commit, so the school is never found on the wrong shard;
+            # on the default shard, in the same transaction.
+            shard_map.assign(school_id, g.db_shard,
+                             connection=connection if g.db_shard == shards.DEFAULT_SHARD else None)
 
             sql_user = "INSERT INTO Users (first_name, last_name, email, password_hash, role, school_id) VALUES (%s, %s, %s, %s, %s, %s)"
             cursor.execute(sql_user, (first_name, last_name, email, hashed_password, 'school_admin', school_id))
@@ -106,10 +1039,9 @@ def register_school_admin():
         return jsonify({'message': 'School and admin registered successfully'}), 201
 
     except Exception as e:
-        connection.rollback()
+        if 'db_shard' in g:
+            get_db_connection().rollback()
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/login', methods=['POST'])
 def login():
@@ -120,60 +1052,59 @@ def login():
     if not email or not password:
         return jsonify({'message': 'Email and password are required'}), 400
 
-    connection = get_db_connection()
     try:
-        with connection.cursor() as cursor:
-            sql = "SELECT id, first_name, last_name, email, password_hash, role FROM Users WHERE email = %s"
-            cursor.execute(sql, (email,))
-            user = cursor.fetchone()
-
-            if user and bcrypt.check_password_hash(user['password_hash'], password):
-                access_token = create_access_token(identity=str(user['id']), additional_claims={"role": user['role']})
-                return jsonify({
-                    'message': 'Login successful',
-                    'access_token': access_token,
-                    'user': {
-                        'id': user['id'],
-                        'first_name': user['first_name'],
-                        'last_name': user['last_name'],
-                        'email': user['email'],
-                        'role': user['role']
-                    }
-                }), 200
-            else:
-                return jsonify({'message': 'Invalid email or password'}), 401
+        sql = "SELECT id, first_name, last_name, email, password_hash, role, school_id FROM Users WHERE email = %s"
+        shard, user = find_on_shards(sql, (email,))
+
+        if user and passwords.verify(user['password_hash'], password):
+            g.db_shard = shard
+            if passwords.needs_rehash(user['password_hash']) and not shard_map.lookup(user['school_id']).frozen:
+                rehash_password(get_db_connection(), user['id'], password)
+
+            access_token = create_access_token(identity=str(user['id']), additional_claims={"role": user['role'], "school_id": user['school_id']})
+            # A new session starts on the primary, so an account that was
+            # just registered is found even if the replicas lag.
+            g.pinned_user_id = user['id']
+            payload = {
+                'message': 'Login successful',
+                'access_token': access_token,
+                'user': {
+                    'id': user['id'],
+                    'first_name': user['first_name'],
+                    'last_name': user['last_name'],
+                    'email': user['email'],
+                    'role': user['role']
+                }
+            }
+            if data.get('include_dashboard'):
+                # Saves the client a round trip before its first screen. The
+                # password check is done, so give back the auth lane's slot;
+                # the dashboard's reads are admitted to the read lane.
+                release_admission_lane(None)
+                payload['dashboard'] = run_batch(DASHBOARD_REQUESTS.get(user['role'], ()),
+                                                 f'Bearer {access_token}')
+            return jsonify(payload), 200
+        else:
+            return jsonify({'message': 'Invalid email or password'}), 401
     except Exception as e:
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/protected', methods=['GET'])
 @jwt_required()
 def protected():
     current_user_id = get_jwt_identity()
-    connection = get_db_connection()
     try:
-        with connection.cursor() as cursor:
-            sql = "SELECT first_name, role FROM Users WHERE id = %s"
-            cursor.execute(sql, (current_user_id,))
-            user = cursor.fetchone()
-            if user:
-                return jsonify({
-                    'message': f"Hello {user['first_name']}! You are a {user['role']}. This is protected data."
-                }), 200
+        user = get_user_profile(current_user_id)
+        if user:
+            return jsonify({
+                'message': f"Hello {user['first_name']}! You are a {user['role']}. This is protected data."
+            }), 200
     except Exception as e:
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/school_admin/add_teacher', methods=['POST'])
-@jwt_required()
+@role_required('school_admin', message='Access denied: Must be a school admin')
 def add_teacher():
-    current_user_id = get_jwt_identity()
-    user_role = get_user_role(current_user_id)
-
-    if user_role != 'school_admin':
-        return jsonify({'message': 'Access denied: Must be a school admin'}), 403
 
     data = request.get_json()
     first_name = data.get('first_name')
@@ -184,38 +1115,27 @@ def add_teacher():
     if not all([first_name, last_name, email, password]):
         return jsonify({'message': 'Missing required fields'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = passwords.hash(password)
 
-    connection = get_db_connection()
     try:
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id FROM Users WHERE email = %s", (email,))
-            if cursor.fetchone():
-                return jsonify({'message': 'Email already registered'}), 409
-
-            cursor.execute("SELECT school_id FROM Users WHERE id = %s", (current_user_id,))
-            admin_school_id = cursor.fetchone()['school_id']
+        if email_registered(email):
+            return jsonify({'message': 'Email already registered'}), 409
 
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
             sql = "INSERT INTO Users (first_name, last_name, email, password_hash, role, school_id) VALUES (%s, %s, %s, %s, %s, %s)"
-            cursor.execute(sql, (first_name, last_name, email, hashed_password, 'teacher', admin_school_id))
+            cursor.execute(sql, (first_name, last_name, email, hashed_password, 'teacher', g.current_user['school_id']))
 
         connection.commit()
         return jsonify({'message': 'Teacher added successfully'}), 201
 
     except Exception as e:
-        connection.rollback()
+        get_db_connection().rollback()
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/school_admin/enroll_student', methods=['POST'])
-@jwt_required()
+@role_required('school_admin', message='Access denied: Must be a school admin')
 def enroll_student():
-    current_user_id = get_jwt_identity()
-    user_role = get_user_role(current_user_id)
-
-    if user_role != 'school_admin':
-        return jsonify({'message': 'Access denied: Must be a school admin'}), 403
 
     data = request.get_json()
     student_first_name = data.get('student_first_name')
@@ -229,17 +1149,14 @@ def enroll_student():
     connection = get_db_connection()
     try:
         with connection.cursor() as cursor:
-            cursor.execute("SELECT school_id FROM Users WHERE id = %s", (current_user_id,))
-            admin_school_id = cursor.fetchone()['school_id']
-
             sql_student = "INSERT INTO Students (first_name, last_name, school_id) VALUES (%s, %s, %s)"
-            cursor.execute(sql_student, (student_first_name, student_last_name, admin_school_id))
+            cursor.execute(sql_student, (student_first_name, student_last_name, g.current_user['school_id']))
             student_id = cursor.lastrowid
 
             sql_enroll = "INSERT INTO StudentEnrollments (student_id, class_id) VALUES (%s, %s)"
             cursor.execute(sql_enroll, (student_id, class_id))
 
-            access_code = generate_access_code()
+            access_code = generate_unique_access_codes(cursor, 1)[0]
             sql_code = "INSERT INTO AccessCodes (code, student_id, parent_email) VALUES (%s, %s, %s)"
             cursor.execute(sql_code, (access_code, student_id, parent_email))
 
@@ -253,17 +1170,33 @@ def enroll_student():
     except Exception as e:
         connection.rollback()
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
+
+@app.route('/api/school_admin/roster_import', methods=['POST'])
+@role_required('school_admin', message='Access denied: Must be a school admin')
+def roster_import():
+    if request.mimetype == 'text/csv':
+        rows = parse_csv(request.stream)
+    elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = parse_ndjson(request.stream)
+    else:
+        return jsonify({'message': 'Upload the roster as text/csv or application/x-ndjson'}), 415
+
+    connection = get_db_connection()
+    importer = RosterImport(connection, g.current_user['school_id'], passwords,
+                            chunk_size=app.config['ROSTER_IMPORT_CHUNK_SIZE'],
+                            registered_elsewhere=emails_registered if shard_map.sharded else None)
+    try:
+        results = importer.run(rows)
+    except Exception as e:
+        connection.rollback()
+        return jsonify({'message': f'An error occurred: {str(e)}'}), 500
+
+    return jsonify({'summary': importer.summary(), 'results': results}), 200
 
 @app.route('/api/teacher/add_class', methods=['POST'])
-@jwt_required()
+@role_required('teacher', message='Access denied: Must be a teacher')
 def add_class():
     current_user_id = get_jwt_identity()
-    user_role = get_user_role(current_user_id)
-
-    if user_role != 'teacher':
-        return jsonify({'message': 'Access denied: Must be a teacher'}), 403
 
     data = request.get_json()
     class_name = data.get('class_name')
@@ -274,11 +1207,8 @@ def add_class():
     connection = get_db_connection()
     try:
         with connection.cursor() as cursor:
-            cursor.execute("SELECT school_id FROM Users WHERE id = %s", (current_user_id,))
-            teacher_school_id = cursor.fetchone()['school_id']
-
             sql = "INSERT INTO Classes (class_name, teacher_id, school_id) VALUES (%s, %s, %s)"
-            cursor.execute(sql, (class_name, current_user_id, teacher_school_id))
+            cursor.execute(sql, (class_name, current_user_id, g.current_user['school_id']))
 
         connection.commit()
         return jsonify({'message': 'Class added successfully'}), 201
@@ -286,8 +1216,6 @@ def add_class():
     except Exception as e:
         connection.rollback()
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/parent/register', methods=['POST'])
 def register_parent():
@@ -301,27 +1229,31 @@ def register_parent():
     if not all([first_name, last_name, email, password, access_code]):
         return jsonify({'message': 'Missing required fields'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = passwords.hash(password)
 
-    connection = get_db_connection()
     try:
-        with connection.cursor() as cursor:
-            sql_code_check = "SELECT student_id, parent_email FROM AccessCodes WHERE code = %s AND is_used = FALSE"
-            cursor.execute(sql_code_check, (access_code,))
-            code_info = cursor.fetchone()
-
-            if not code_info:
-                return jsonify({'message': 'Invalid or used access code'}), 400
-
-            cursor.execute("SELECT id FROM Users WHERE email = %s", (email,))
-            if cursor.fetchone():
-                return jsonify({'message': 'Email already registered'}), 409
-
-            student_id = code_info['student_id']
-
-            cursor.execute("SELECT school_id FROM Students WHERE id = %s", (student_id,))
-            school_id = cursor.fetchone()['school_id']
+        # The code says which school, and so which shard, the parent joins.
+        sql_code_check = """
+            SELECT ac.student_id, ac.parent_email, s.school_id
+            FROM AccessCodes ac
+            JOIN Students s ON s.id = ac.student_id
+            WHERE ac.code = %s AND ac.is_used = FALSE
+        """
+        shard, code_info = find_on_shards(sql_code_check, (access_code,))
+
+        if not code_info:
+            return jsonify({'message': 'Invalid or used access code'}), 400
+
+        if email_registered(email):
+            return jsonify({'message': 'Email already registered'}), 409
+
+        student_id = code_info['student_id']
+        school_id = code_info['school_id']
+        ensure_writable(school_id)
+        g.db_shard = shard
 
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
             sql_user = "INSERT INTO Users (first_name, last_name, email, password_hash, role, school_id) VALUES (%s, %s, %s, %s, %s, %s)"
             cursor.execute(sql_user, (first_name, last_name, email, hashed_password, 'parent', school_id))
             parent_user_id = cursor.lastrowid
@@ -332,23 +1264,23 @@ def register_parent():
             sql_invalidate = "UPDATE AccessCodes SET is_used = TRUE WHERE code = %s"
             cursor.execute(sql_invalidate, (access_code,))
 
+            feed_inbox.rebuild_inbox(cursor, parent_user_id)
+
         connection.commit()
+        post_feeds.bump(user_scope(parent_user_id))
         return jsonify({'message': 'Parent registered and linked successfully'}), 201
 
+    except shards.SchoolMoving:
+        raise
     except Exception as e:
-        connection.rollback()
+        if 'db_shard' in g:
+            get_db_connection().rollback()
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/student/dashboard', methods=['GET'])
-@jwt_required()
+@role_required('student', message='Access denied: Must be a student')
 def student_dashboard():
     current_user_id = get_jwt_identity()
-    user_role = get_user_role(current_user_id)
-
-    if user_role != 'student':
-        return jsonify({'message': 'Access denied: Must be a student'}), 403
 
     connection = get_db_connection()
     try:
@@ -377,169 +1309,736 @@ def student_dashboard():
 
     except Exception as e:
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/teacher/create_post', methods=['POST'])
-@jwt_required()
+@role_required('teacher', message='Access denied: Must be a teacher')
 def create_post():
     current_user_id = get_jwt_identity()
-    user_role = get_user_role(current_user_id)
-
-    if user_role != 'teacher':
-        return jsonify({'message': 'Access denied: Must be a teacher'}), 403
 
     data = request.get_json()
     title = data.get('title')
     content = data.get('content')
     class_id = data.get('class_id')
+    attachment_ids = data.get('attachment_ids') or []
 
     if not all([title, content, class_id]):
         return jsonify({'message': 'Missing required fields'}), 400
+    if not isinstance(attachment_ids, list) or not all(type(i) is int for i in attachment_ids):
+        return jsonify({'message': 'attachment_ids must be a list of upload ids'}), 400
+    attachment_ids = list(dict.fromkeys(attachment_ids))
 
     connection = get_db_connection()
+    # References taken for uploads already on another post, released again on failure.
+    copied = []
     try:
         with connection.cursor() as cursor:
-            cursor.execute("SELECT school_id FROM Classes WHERE id = %s", (class_id,))
+            # The author's names ride along for the post event, so no profile lookup is needed.
+            cursor.execute("""
+                SELECT c.id, c.school_id, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
+                FROM Classes c LEFT JOIN Users u ON u.id = %s
+                WHERE c.id = %s
+            """, (g.current_user['id'], class_id))
             class_info = cursor.fetchone()
             if not class_info:
                 return jsonify({'message': 'Class not found'}), 404
 
-            cursor.execute("SELECT school_id FROM Users WHERE id = %s", (current_user_id,))
-            teacher_info = cursor.fetchone()
-            if teacher_info['school_id'] != class_info['school_id']:
+            if g.current_user['school_id'] != class_info['school_id']:
                 return jsonify({'message': 'Teacher is not authorized for this class'}), 403
 
+            uploads = []
+            if attachment_ids:
+                cursor.execute(f"""
+                    SELECT id, post_id, sha256, filename, content_type, size FROM PostAttachments
+                    WHERE uploaded_by = %s AND id IN ({', '.join(['%s'] * len(attachment_ids))})
+                """, (g.current_user['id'], *attachment_ids))
+                uploads = sorted(cursor.fetchall(), key=lambda row: attachment_ids.index(row['id']))
+                if len(uploads) != len(attachment_ids):
+                    return jsonify({'message': 'Attachment not found'}), 400
+                # An upload sent to several classes: each post gets its own row.
+                copies = [(row['sha256'], row['size']) for row in uploads if row['post_id'] is not None]
+                if copies:
+                    attachments.update_references(db_pool, attachments.add_references, copies)
+                    copied = [sha256 for sha256, _ in copies]
+
             sql = "INSERT INTO Posts (title, content, user_id, class_id) VALUES (%s, %s, %s, %s)"
             cursor.execute(sql, (title, content, current_user_id, class_id))
+            post_id = cursor.lastrowid
+            attached = []
+            for row in uploads:
+                if row['post_id'] is None:
+                    cursor.execute("UPDATE PostAttachments SET post_id = %s WHERE id = %s AND post_id IS NULL",
+                                   (post_id, row['id']))
+                    if cursor.rowcount == 0:
+                        connection.rollback()
+                        release_attachments(copied)
+                        return jsonify({'message': f"Attachment {row['id']} was just attached to another post"}), 409
+                    attached.append(row)
+                else:
+                    attachment_id = attachments.record_upload(cursor, g.current_user['id'], class_info['school_id'], row['sha256'],
+                                                              row['filename'], row['content_type'], row['size'], post_id=post_id)
+                    attached.append(dict(row, id=attachment_id))
+            feed_inbox.fan_out_post(cursor, post_id)
+            notifications.enqueue_post(cursor, post_id, class_info['id'], class_info['school_id'])
 
         connection.commit()
-        return jsonify({'message': 'Post created successfully'}), 201
+        post_feeds.bump(ALL_POSTS_SCOPE, class_scope(class_id))
+        publish_post_event('post_created', class_info['id'], {
+            'id': post_id, 'class_id': class_info['id'], 'title': title, 'content': content,
+            'class_name': class_info['class_name'],
+            'author_first_name': class_info['author_first_name'], 'author_last_name': class_info['author_last_name'],
+            'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'attachments': [attachment_json(row) for row in attached],
+        })
+        return jsonify({'message': 'Post created successfully', 'post_id': post_id}), 201
 
     except Exception as e:
         connection.rollback()
+        release_attachments(copied)
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/student/posts', methods=['GET'])
-@jwt_required()
+@role_required('student', message='Access denied: Must be a student')
 def student_posts():
     current_user_id = get_jwt_identity()
-    user_role = get_user_role(current_user_id)
-
-    if user_role != 'student':
-        return jsonify({'message': 'Access denied: Must be a student'}), 403
+    page = parse_page_args(request.args)
+    archived = post_archive.include_archived(request.args)
+    cache_key = ('student', current_user_id, archived, page)
+    cached = cached_feed_response(cache_key, page, reads=True)
+    if cached is not None:
+        return cached
 
     connection = get_db_connection()
     try:
         with connection.cursor() as cursor:
+            versions = snapshot_feed_versions(cursor, 'student', current_user_id, page)
             sql = """
-                SELECT p.title, p.content, p.created_at, u.first_name AS author_first_name, u.last_name AS author_last_name, c.class_name
-                FROM Posts p
+                SELECT p.id, p.title, p.content, p.created_at, u.first_name AS author_first_name, u.last_name AS author_last_name, c.class_name
+                FROM {posts_table} p
                 JOIN Users u ON p.user_id = u.id
                 JOIN Classes c ON p.class_id = c.id
                 JOIN StudentEnrollments se ON c.id = se.class_id
                 JOIN Students s ON se.student_id = s.id
-                WHERE s.user_id = %s
-                ORDER BY p.created_at DESC
+                WHERE s.user_id = %s{page_filter}
+                ORDER BY p.created_at DESC, p.id DESC
             """
-            cursor.execute(sql, (current_user_id,))
-            posts = cursor.fetchall()
+            posts = fetch_inbox_feed(cursor, current_user_id, page)
+            if posts is None:
+                posts = fetch_post_feed(cursor, sql, (current_user_id,), page)
+            if archived:
+                posts = fetch_with_archive(posts, page, lambda older: fetch_post_feed(
+                    cursor, sql, (current_user_id,), older, posts_table='PostsArchive'))
 
-        return jsonify(posts), 200
+        return feed_response(posts, page, cache_key, versions, reads=True)
 
     except Exception as e:
         return jsonify({'message': f'An error occurred: {str(e)}'}), 500
-    finally:
-        connection.close()
 
 @app.route('/api/admin/posts', methods=['GET'])
-@jwt_required()
+@role_required('school_admin', message="Unauthorized access.")
 def admin_posts():
-    user_claims = get_jwt()
-    if user_claims.get('role') != 'school_admin':
-        return jsonify({"message": "Unauthorized access."}), 403
-    
+    page = parse_page_args(request.args)
+    archived = post_archive.include_archived(request.args)
+    cache_key = ('school_admin', None, archived, page)
+    cached = cached_feed_response(cache_key, page)
+    if cached is not None:
+        return cached
+
     try:
         connection = get_db_connection()
         with connection.cursor() as cursor:
+            versions = snapshot_feed_versions(cursor, 'school_admin', None, page)
             query = """
             SELECT p.id, p.title, p.content, p.created_at, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
-            FROM Posts p
+            FROM {posts_table} p
             JOIN Classes c ON p.class_id = c.id
             JOIN Users u ON p.user_id = u.id
-            ORDER BY p.created_at DESC
+            {page_filter}
+            ORDER BY p.created_at DESC, p.id DESC
             """
-            cursor.execute(query)
-            posts = cursor.fetchall()
-            return jsonify(posts), 200
+            # District-wide: every shard's posts.
+            posts = fetch_district_feed(query, (), page, keyword='WHERE')
+            if archived:
+                posts = fetch_with_archive(posts, page, lambda older: fetch_district_feed(
+                    query, (), older, keyword='WHERE', posts_table='PostsArchive'))
+            return feed_response(posts, page, cache_key, versions)
     except Exception as e:
         return jsonify({"message": f"An error occurred: {e}"}), 500
-    finally:
-        if connection:
-            connection.close()
 
 @app.route('/api/admin/delete_post/<int:post_id>', methods=['DELETE'])
-@jwt_required()
+@role_required('school_admin', message="Unauthorized access. Only school admins can delete posts.")
 def delete_post(post_id):
-    user_claims = get_jwt()
-    if user_claims.get('role') != 'school_admin':
-        return jsonify({"message": "Unauthorized access. Only school admins can delete posts."}), 403
-    
     try:
+        # Any school's post, so it may be on any shard, live or archived.
+        shard, post = find_on_shards("""
+            SELECT p.class_id, c.school_id FROM Posts p JOIN Classes c ON c.id = p.class_id WHERE p.id = %s
+            UNION ALL
+            SELECT a.class_id, c.school_id FROM PostsArchive a JOIN Classes c ON c.id = a.class_id WHERE a.id = %s
+        """, (post_id, post_id))
+        if post is None:
+            return jsonify({"message": f"Post {post_id} not found."}), 404
+        ensure_writable(post['school_id'])
+        g.db_shard = shard
+
         connection = get_db_connection()
         with connection.cursor() as cursor:
+            feed_inbox.remove_post(cursor, post_id)
+            cursor.execute("SELECT sha256 FROM PostAttachments WHERE post_id = %s", (post_id,))
+            released = [row['sha256'] for row in cursor.fetchall()]
+            cursor.execute("DELETE FROM PostAttachments WHERE post_id = %s", (post_id,))
             cursor.execute("DELETE FROM Posts WHERE id = %s", (post_id,))
             rows_affected = cursor.rowcount
+            cursor.execute("DELETE FROM PostsArchive WHERE id = %s", (post_id,))
+            rows_affected += cursor.rowcount
+            # After the post: a read receipt flush holding it waits, then its reads go too.
+            cursor.execute("DELETE FROM PostReads WHERE post_id = %s", (post_id,))
             connection.commit()
+            if released:
+                release_attachments(released)
             
             if rows_affected > 0:
+                post_feeds.bump(ALL_POSTS_SCOPE, class_scope(post['class_id']))
+                publish_post_event('post_deleted', post['class_id'], {'id': post_id, 'class_id': post['class_id']})
                 return jsonify({"message": f"Post {post_id} deleted successfully."}), 200
             else:
                 return jsonify({"message": f"Post {post_id} not found."}), 404
+    except shards.SchoolMoving:
+        raise
+    except Exception as e:
+        return jsonify({"message": f"An error occurred: {e}"}), 500
+
+@app.route('/api/admin/read_receipts', methods=['GET'])
+@role_required('school_admin', message="Unauthorized access.")
+def read_receipt_report():
+    """Read rates of the school's posts, newest first, and of its classes on the first page."""
+    page = parse_page_args(request.args) or Page(DEFAULT_PAGE_SIZE, None)
+    school_id = g.current_user['school_id']
+    class_id = request.args.get('class_id')
+    if class_id is not None:
+        if not class_id.isdigit():
+            return jsonify({"message": "class_id must be a positive integer"}), 400
+        class_id = int(class_id)
+
+    try:
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
+            if class_id is not None:
+                cursor.execute("SELECT id FROM Classes WHERE id = %s AND school_id = %s", (class_id, school_id))
+                if cursor.fetchone() is None:
+                    return jsonify({"message": f"Class {class_id} not found."}), 404
+            query = """
+                SELECT p.id, p.title, p.class_id, c.class_name, p.created_at
+                FROM Posts p
+                JOIN Classes c ON c.id = p.class_id
+                WHERE c.school_id = %s{class_filter}{page_filter}
+                ORDER BY p.created_at DESC, p.id DESC
+            """
+            params, class_filter = (school_id,), ''
+            if class_id is not None:
+                params, class_filter = (school_id, class_id), ' AND p.class_id = %s'
+            report = fetch_post_feed(cursor, query, params, page, class_filter=class_filter)
+            counts = read_receipts.post_read_counts(cursor, report['posts'])
+            for post in report['posts']:
+                recipients, readers = counts.get(post['id'], (0, 0))
+                post.update(recipients=recipients, readers=readers,
+                            read_rate=read_receipts.read_rate(readers, recipients))
+            if page.after is None:
+                report['classes'] = read_receipts.class_read_rates(cursor, school_id, class_id)
+        return jsonify(report), 200
+    except Exception as e:
+        return jsonify({"message": f"An error occurred: {e}"}), 500
+
+@app.route('/api/admin/posts/<int:post_id>/read_receipts', methods=['GET'])
+@role_required('school_admin', message="Unauthorized access.")
+def post_read_receipts(post_id):
+    """Who a post reached and which of its recipients haven't read it yet."""
+    try:
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT p.id, p.title, p.class_id FROM Posts p JOIN Classes c ON c.id = p.class_id
+                WHERE p.id = %s AND c.school_id = %s
+                UNION ALL
+                SELECT a.id, a.title, a.class_id FROM PostsArchive a JOIN Classes c ON c.id = a.class_id
+                WHERE a.id = %s AND c.school_id = %s
+            """, (post_id, g.current_user['school_id'], post_id, g.current_user['school_id']))
+            post = cursor.fetchone()
+            if post is None:
+                return jsonify({"message": f"Post {post_id} not found."}), 404
+            recipients, unread = read_receipts.unread_recipients(cursor, post_id, post['class_id'])
+        readers = recipients - len(unread)
+        return jsonify({'post_id': post['id'], 'title': post['title'], 'class_id': post['class_id'],
+                        'recipients': recipients, 'readers': readers,
+                        'read_rate': read_receipts.read_rate(readers, recipients), 'unread': unread}), 200
     except Exception as e:
         return jsonify({"message": f"An error occurred: {e}"}), 500
+
+@app.route('/api/attachments', methods=['POST'])
+@role_required('teacher', message='Access denied: Must be a teacher')
+def upload_attachment():
+    """Stores the raw request body as a file to attach to posts; name it with ?filename=."""
+    filename = os.path.basename((request.args.get('filename') or '').replace('\\', '/')).strip()
+    if not filename:
+        return jsonify({'message': 'filename is required'}), 400
+    max_bytes = app.config['ATTACHMENT_MAX_BYTES']
+    too_large = jsonify({'message': f'Attachments can be at most {max_bytes} bytes'}), 413
+    if request.content_length is not None and request.content_length > max_bytes:
+        return too_large
+    content_type = request.mimetype or 'application/octet-stream'
+    user = g.current_user
+
+    try:
+        temp_path, sha256, size = attachment_store.receive(request.stream, max_bytes)
+    except attachments.AttachmentTooLarge:
+        return too_large
+    try:
+        if size == 0:
+            return jsonify({'message': 'The file is empty'}), 400
+        # Counted before the file is kept, so the garbage collector leaves it be.
+        attachments.update_references(db_pool, attachments.add_references, [(sha256, size)])
+        attachment_store.keep(temp_path, sha256)
+    except Exception as e:
+        return jsonify({'message': f'An error occurred: {e}'}), 500
     finally:
-        if connection:
-            connection.close()
+        attachment_store.discard(temp_path)
+
+    connection = get_db_connection()
+    try:
+        with connection.cursor() as cursor:
+            attachment_id = attachments.record_upload(cursor, user['id'], user['school_id'], sha256, filename,
+                                                      content_type, size)
+        connection.commit()
+    except Exception as e:
+        connection.rollback()
+        release_attachments([sha256])
+        return jsonify({'message': f'An error occurred: {e}'}), 500
+    return jsonify({'id': attachment_id, 'filename': filename, 'content_type': content_type, 'size': size,
+                    'sha256': sha256}), 201
+
+ATTACHMENT_SQL = """
+    SELECT pa.id, pa.post_id, pa.uploaded_by, pa.sha256, pa.filename, pa.content_type, pa.size,
+           COALESCE(p.class_id, a.class_id) AS class_id
+    FROM PostAttachments pa
+    LEFT JOIN Posts p ON p.id = pa.post_id
+    LEFT JOIN PostsArchive a ON a.id = pa.post_id
+    WHERE pa.id = %s
+"""
+
+def attachment_visible(cursor, row):
+    """Uploads not yet posted are their uploader's alone; posted ones follow the post."""
+    if row['post_id'] is None:
+        return row['uploaded_by'] == g.current_user['id']
+    return row['class_id'] in caller_class_ids(cursor)
+
+@app.route('/api/attachments/<int:attachment_id>', methods=['GET'])
+@role_required('parent', 'student', 'teacher', 'school_admin', message='Access denied')
+def download_attachment(attachment_id):
+    """Sends an attachment's file; supports Range and If-None-Match."""
+    connection = get_db_connection()
+    with connection.cursor() as cursor:
+        cursor.execute(ATTACHMENT_SQL, (attachment_id,))
+        row = cursor.fetchone()
+        if row is None or not attachment_visible(cursor, row):
+            return jsonify({'message': 'Attachment not found'}), 404
+
+    try:
+        response = send_file(attachment_store.path(row['sha256']), mimetype=row['content_type'],
+                             as_attachment=row['content_type'] not in attachments.INLINE_TYPES,
+                             download_name=row['filename'], conditional=True, etag=row['sha256'])
+    except FileNotFoundError:
+        return jsonify({'message': 'Attachment not found'}), 404
+    response.headers['Cache-Control'] = 'private, max-age=86400'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+@app.route('/api/posts/<int:post_id>/attachments', methods=['GET'])
+@role_required('parent', 'student', 'teacher', 'school_admin', message='Access denied')
+def post_attachments(post_id):
+    try:
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT class_id FROM Posts WHERE id = %s
+                UNION ALL
+                SELECT class_id FROM PostsArchive WHERE id = %s
+            """, (post_id, post_id))
+            post = cursor.fetchone()
+            if post is None or post['class_id'] not in caller_class_ids(cursor):
+                return jsonify({'message': f'Post {post_id} not found.'}), 404
+            cursor.execute("""
+                SELECT id, filename, content_type, size FROM PostAttachments
+                WHERE post_id = %s ORDER BY created_at, id
+            """, (post_id,))
+            return jsonify([attachment_json(row) for row in cursor.fetchall()]), 200
+    except Exception as e:
+        return jsonify({'message': f'An error occurred: {e}'}), 500
 
 @app.route('/api/parent/posts', methods=['GET'])
-@jwt_required()
+@role_required('parent', message="Unauthorized access.")
 def parent_posts():
-    user_claims = get_jwt()
     current_user_id = get_jwt_identity()
-    if user_claims.get('role') != 'parent':
-        return jsonify({"message": "Unauthorized access."}), 403
-    
+    page = parse_page_args(request.args)
+    student_id = request.args.get('student_id')
+    if student_id is not None:
+        if not student_id.isdigit():
+            return jsonify({"message": "student_id must be a positive integer"}), 400
+        student_id = int(student_id)
+    archived = post_archive.include_archived(request.args)
+    cache_key = ('parent', current_user_id, student_id, archived, page)
+    cached = cached_feed_response(cache_key, page, reads=True)
+    if cached is not None:
+        return cached
+
     try:
         connection = get_db_connection()
         with connection.cursor() as cursor:
-            cursor.execute("SELECT student_id FROM ParentStudentLinks WHERE parent_user_id = %s", (current_user_id,))
-            child = cursor.fetchone()
-            
-            if not child:
+            children, class_children = fetch_parent_children(cursor, current_user_id)
+            if not children:
                 return jsonify({"message": "No child found for this parent."}), 404
-            
-            child_id = child['student_id']
+            if student_id is not None and student_id not in {child['id'] for child in children}:
+                return jsonify({"message": "Student is not linked to this parent."}), 404
 
-            query = """
-            SELECT p.title, p.content, p.created_at, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
-            FROM Posts p
-            JOIN Classes c ON p.class_id = c.id
-            JOIN Users u ON p.user_id = u.id
-            JOIN StudentEnrollments se ON c.id = se.class_id
-            WHERE se.student_id = %s
-            ORDER BY p.created_at DESC
-            """
-            cursor.execute(query, (child_id,))
-            posts = cursor.fetchall()
-            return jsonify(posts), 200
+            versions = snapshot_feed_versions(cursor, 'parent', current_user_id, page)
+            if student_id is None:
+                params, child_filter = (current_user_id,), ''
+            else:
+                params, child_filter = (current_user_id, student_id), ' AND psl.student_id = %s'
+            posts = fetch_inbox_feed(cursor, current_user_id, page, PARENT_INBOX_FEED_SQL) if student_id is None else None
+            if posts is None:
+                posts = fetch_post_feed(cursor, PARENT_FEED_SQL, params, page, child_filter=child_filter)
+            if archived:
+                posts = fetch_with_archive(posts, page, lambda older: fetch_post_feed(
+                    cursor, PARENT_FEED_SQL, params, older, posts_table='PostsArchive', child_filter=child_filter))
+
+            if page is None:
+                return feed_response((annotate_children(post, class_children) for post in posts), page, reads=True)
+            posts['posts'] = [annotate_children(post, class_children) for post in posts['posts']]
+            posts['children'] = children
+            return feed_response(posts, page, cache_key, versions, reads=True)
     except Exception as e:
         return jsonify({"message": f"An error occurred: {e}"}), 500
-    finally:
-        if connection:
+
+@app.route('/api/search', methods=['GET'])
+@role_required('parent', 'student', 'teacher', 'school_admin', message='Access denied')
+def search_posts():
+    """Ranked full-text search over the posts of the caller's classes."""
+    text, limit, after = search_index.parse_search_args(request.args)
+    if not text.strip():
+        return jsonify({'message': 'q is required'}), 400
+    if not post_search.ensure_built():
+        return jsonify({'message': 'Search is starting up, please try again shortly'}), 503, {'Retry-After': '2'}
+
+    try:
+        connection = get_db_connection()
+        with connection.cursor() as cursor:
+            class_ids = caller_class_ids(cursor)
+            results, next_after = post_search.search(text, class_ids, limit=limit, after=after)
+            if not results:
+                return jsonify({'posts': [], 'next_cursor': None}), 200
+
+            post_ids = [post_id for post_id, _ in results]
+            # Archived posts stay searchable.
+            cursor.execute(f"""
+                SELECT p.id, p.title, p.content, p.created_at, p.class_id, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
+                FROM Posts p
+                JOIN Classes c ON p.class_id = c.id
+                JOIN Users u ON p.user_id = u.id
+                WHERE p.id IN ({', '.join(['%s'] * len(post_ids))})
+                UNION ALL
+                SELECT a.id, a.title, a.content, a.created_at, a.class_id, c.class_name, u.first_name AS author_first_name, u.last_name AS author_last_name
+                FROM PostsArchive a
+                JOIN Classes c ON a.class_id = c.id
+                JOIN Users u ON a.user_id = u.id
+                WHERE a.id IN ({', '.join(['%s'] * len(post_ids))})
+            """, post_ids * 2)
+            rows = {row['id']: row for row in cursor.fetchall()}
+
+        posts = []
+        for post_id, score in results:
+            # A post deleted since it was indexed has no row.
+            if post_id in rows:
+                posts.append(dict(rows[post_id], score=score))
+        next_cursor = search_index.encode_search_cursor(*next_after) if next_after else None
+        return jsonify({'posts': posts, 'next_cursor': next_cursor}), 200
+    except Exception as e:
+        return jsonify({'message': f'An error occurred: {e}'}), 500
+
+@app.route('/api/batch', methods=['POST'])
+@role_required('parent', 'student', 'teacher', 'school_admin', message='Access denied')
+def batch_requests():
+    """Runs several GET requests to the API in one round trip; responses come back in order."""
+    data = request.get_json(silent=True) or {}
+    paths = parse_batch_paths(data.get('requests'))
+    if paths is None:
+        return jsonify({'message': 'requests must be a list of {"path": "/api/..."} GET requests'}), 400
+    if len(paths) > app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({'message': f"A batch can hold at most {app.config['BATCH_MAX_REQUESTS']} requests"}), 400
+
+    g.batch_user = g.current_user
+    return jsonify({'responses': run_batch(paths, request.headers.get('Authorization', ''))}), 200
+
+@app.route('/api/events', methods=['GET'])
+@role_required('parent', 'student', 'teacher', 'school_admin', locations=['headers', 'query_string'])
+def post_event_stream():
+    """Server-Sent Events stream of post_created/post_deleted/posts_archived for the caller's classes.
+
+    EventSource can't send an Authorization header, so the token may also
+    be passed as ?jwt=<token>.
+    """
+    connection = get_db_connection()
+    with connection.cursor() as cursor:
+        class_ids = caller_class_ids(cursor)
+
+    subscription = post_events.subscribe(class_ids, parse_last_event_id())
+    heartbeat = app.config['EVENTS_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + app.config['EVENTS_STREAM_MAX_SECONDS']
+
+    def generate():
+        # Runs after the request's DB connection went back to the pool.
+        try:
+            yield f'retry: {int(heartbeat * 1000)}\n\n'
+            if subscription.needs_resync:
+                yield 'event: resync\ndata: {}\n\n'
+            while time.monotonic() < deadline:
+                events = subscription.next_batch(timeout=heartbeat)
+                if subscription.overflowed:
+                    # Too far behind: end the stream; the client resumes via Last-Event-ID.
+                    return
+                yield ''.join(format_event(event) for event in events) if events else ': keep-alive\n\n'
+        finally:
+            post_events.unsubscribe(subscription)
+
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# -----------------
+# CLI Commands
+# -----------------
+def shard_connections():
+    """Yields (shard, new connection to its primary) for every shard, closing each after use."""
+    for shard in shard_routers:
+        connection = connect_to_database(app.config['DB_SHARDS'][shard][0] if shard in app.config['DB_SHARDS'] else None)
+        try:
+            if shard_map.sharded:
+                click.echo(f'[{shard}]')
+            yield shard, connection
+        finally:
             connection.close()
-            
+
+@app.cli.group('db')
+def db_cli():
+    """Apply schema migrations and check query plans."""
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Stop at this version.')
+def db_upgrade(target):
+    """Applies pending migrations on every shard."""
+    for _, connection in shard_connections():
+        applied = schema_migrations.upgrade(connection, target=target, log=click.echo)
+        click.echo(f'Applied {len(applied)} migration(s)')
+
+@db_cli.command('downgrade')
+@click.option('--to', 'target', type=int, required=True, help='Revert everything newer than this version.')
+def db_downgrade(target):
+    """Reverts migrations newer than --to on every shard."""
+    for _, connection in shard_connections():
+        reverted = schema_migrations.downgrade(connection, target, log=click.echo)
+        click.echo(f'Reverted {len(reverted)} migration(s)')
+
+@db_cli.command('status')
+def db_status():
+    """Lists migrations and whether each is applied."""
+    for _, connection in shard_connections():
+        applied = set(schema_migrations.applied_versions(connection))
+        for migration in schema_migrations.discover():
+            mark = 'x' if migration.version in applied else ' '
+            click.echo(f'[{mark}] {migration.version:04d}_{migration.name}')
+
+@db_cli.command('stamp')
+@click.argument('version', type=int)
+def db_stamp(version):
+    """Marks migrations up to VERSION as applied without running them."""
+    for _, connection in shard_connections():
+        schema_migrations.stamp(connection, version)
+
+@db_cli.command('check-plans')
+@click.option('--output', default='query_plans.json', show_default=True, help='Where to record the plans.')
+def db_check_plans(output):
+    """EXPLAINs every query in the app; fails if a hot query does a full scan."""
+    connection = connect_to_database()
+    try:
+        plans, regressions = query_plans.check_plans(connection)
+    finally:
+        connection.close()
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(plans, f, indent=2, default=str)
+    click.echo(f'Recorded {len(plans)} query plans in {output}')
+    for entry in regressions:
+        problem = entry.get('error') or f"full scan of {', '.join(entry['full_scans'])}"
+        click.echo(f"REGRESSION {entry['name']}: {problem}", err=True)
+    if regressions:
+        raise SystemExit(1)
+
+@app.cli.group('feed-inbox')
+def feed_inbox_cli():
+    """Maintain the materialized parent/student feed inboxes."""
+
+@feed_inbox_cli.command('backfill')
+@click.option('--batch-size', default=500, show_default=True)
+def feed_inbox_backfill(batch_size):
+    """Builds every recipient's inbox from existing posts, on every shard."""
+    for _, connection in shard_connections():
+        total = feed_inbox.backfill(connection, batch_size=batch_size, log=click.echo)
+        click.echo(f'Backfilled {total} inboxes')
+
+@feed_inbox_cli.command('check')
+@click.option('--user-id', type=int, default=None, help='Only check this user.')
+@click.option('--repair', is_flag=True, help='Rebuild every inconsistent inbox.')
+def feed_inbox_check(user_id, repair):
+    """Compares ready inboxes with the feed join, on every shard."""
+    inconsistent = False
+    for _, connection in shard_connections():
+        report = feed_inbox.check_consistency(connection, user_id=user_id)
+        click.echo(f"{len(report['missing'])} missing, {len(report['extra'])} extra inbox rows")
+        bad_users = sorted({user for user, _ in report['missing'] + report['extra']})
+        if bad_users and repair:
+            with connection.cursor() as cursor:
+                for bad_user in bad_users:
+                    feed_inbox.rebuild_inbox(cursor, bad_user)
+            connection.commit()
+            click.echo(f'Rebuilt {len(bad_users)} inboxes')
+        elif bad_users:
+            inconsistent = True
+    if inconsistent:
+        raise SystemExit(1)
+
+@app.cli.group('notifications')
+def notifications_cli():
+    """Deliver post notifications from the outbox."""
+
+def notification_transport():
+    if app.config['NOTIFY_TRANSPORT'] == 'smtp':
+        return notifications.SmtpTransport(app.config['SMTP_HOST'], app.config['SMTP_PORT'],
+                                           sender=app.config['NOTIFY_SENDER'],
+                                           username=app.config['SMTP_USER'],
+                                           password=app.config['SMTP_PASSWORD'],
+                                           use_tls=app.config['SMTP_USE_TLS'])
+    return notifications.FileTransport(app.config['NOTIFY_FILE_PATH'])
+
+@notifications_cli.command('worker')
+@click.option('--threads', default=4, show_default=True, help='Worker threads per shard.')
+@click.option('--once', is_flag=True, help='Process what is due now and exit.')
+def notifications_worker(threads, once):
+    """Expands the outbox and sends notifications until interrupted, on every shard."""
+    transport = notification_transport()
+    rate_limiter = notifications.SchoolRateLimiter(app.config['NOTIFY_RATE_PER_SCHOOL'])
+    workers = [notifications.NotificationWorker(
+        router.primary, transport,
+        rate_limiter=rate_limiter,
+        batch_size=app.config['NOTIFY_BATCH_SIZE'],
+        max_attempts=app.config['NOTIFY_MAX_ATTEMPTS'],
+        backoff_seconds=app.config['NOTIFY_BACKOFF_SECONDS'],
+        log=click.echo) for router in shard_routers.values()]
+    if once:
+        for worker in workers:
+            while worker.run_once():
+                pass
+    else:
+        stop = threading.Event()
+        runners = [threading.Thread(target=worker.run, kwargs={'threads': threads, 'stop': stop}, daemon=True)
+                   for worker in workers]
+        for runner in runners:
+            runner.start()
+        try:
+            while any(runner.is_alive() for runner in runners):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stop.set()
+    totals = {}
+    for worker in workers:
+        for key, value in worker.stats().items():
+            totals[key] = totals.get(key, 0) + value
+    click.echo(', '.join(f'{key} {value}' for key, value in sorted(totals.items())))
+
+@app.cli.group('archive')
+def archive_cli():
+    """Move old posts out of the live feed tables."""
+
+@archive_cli.command('run')
+def archive_run():
+    """Archives every post past the horizon on every shard, once."""
+    horizon = archive_horizon()
+    if horizon is None:
+        raise click.UsageError('Set ARCHIVE_AFTER_DAYS or ARCHIVE_SCHOOL_YEAR_START first')
+    click.echo(f'Archived {post_archiver.run_once()} post(s) created before {horizon:%Y-%m-%d %H:%M}')
+
+@archive_cli.command('status')
+def archive_status():
+    """Counts live and archived posts on each shard."""
+    horizon = archive_horizon()
+    click.echo(f"Horizon: {f'{horizon:%Y-%m-%d %H:%M}' if horizon else 'none, archiving is off'}")
+    for _, connection in shard_connections():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS n FROM Posts")
+            live = cursor.fetchone()['n']
+            cursor.execute("SELECT COUNT(*) AS n FROM PostsArchive")
+            archived = cursor.fetchone()['n']
+        connection.commit()
+        click.echo(f'{live} live post(s), {archived} archived')
+
+@app.cli.group('attachments')
+def attachments_cli():
+    """Manage stored attachment files."""
+
+@attachments_cli.command('gc')
+def attachments_gc():
+    """Expires stale uploads and deletes files nothing refers to, once."""
+    expired, deleted = attachment_gc.collect()
+    click.echo(f'Expired {expired} upload(s), deleted {deleted} file(s)')
+
+@app.cli.group('shards')
+def shards_cli():
+    """Place schools on shards and move them between shards."""
+
+@shards_cli.command('status')
+def shards_status():
+    """Lists how many schools each shard has and which are frozen for a move."""
+    placements = shard_map.placements()
+    for shard in shard_routers:
+        school_ids = [school_id for school_id, placement in placements.items() if placement.shard == shard]
+        frozen = [str(school_id) for school_id in school_ids if placements[school_id].frozen]
+        click.echo(f"{shard}: {len(school_ids)} mapped school(s)" + (f", frozen: {', '.join(frozen)}" if frozen else ''))
+
+@shards_cli.command('init')
+def shards_init():
+    """Gives each shard its own id range and maps the schools already on it; safe to re-run."""
+    if not shard_map.sharded:
+        raise click.UsageError('Set DB_SHARDS first')
+    placements = shard_map.placements()
+    for index, (shard, connection) in enumerate(shard_connections()):
+        shards.reserve_id_range(connection, index)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM Schools")
+            # A school already mapped may have a leftover copy here from a move.
+            unmapped = [row['id'] for row in cursor.fetchall() if row['id'] not in placements]
+        connection.commit()
+        for school_id in unmapped:
+            shard_map.assign(school_id, shard)
+            placements[school_id] = shards.Placement(shard, False)
+        click.echo(f'Ids from {shards.shard_id_start(index)}; mapped {len(unmapped)} new school(s)')
+
+@shards_cli.command('move-school')
+@click.argument('school_id', type=int)
+@click.argument('target')
+@click.option('--keep-source', is_flag=True, help="Leave the old shard's copy in place.")
+def shards_move_school(school_id, target, keep_source):
+    """Moves SCHOOL_ID's rows to the TARGET shard while the school stays online."""
+    if target not in shard_routers:
+        raise click.BadParameter(f"choose from {', '.join(shard_routers)}", param_hint='TARGET')
+    shards.move_school(shard_map, {shard: router.primary for shard, router in shard_routers.items()},
+                       school_id, target, keep_source=keep_source, log=click.echo)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,264 @@
+"""Post attachments: content-addressed files on local disk, reference counted.
+
+An upload is streamed to a temporary file in fixed-size chunks while it is
+hashed, so a file is never held in memory whole. The file is then stored
+under its SHA-256, so the same permission slip sent to twenty classes
+takes the disk space of one.
+
+Each PostAttachments row (on its school's shard) holds one reference to a
+blob. The references are counted in the default shard's AttachmentBlobs
+table, because schools on different shards can share a blob. Counts go up
+before the row that needs them is written and down after it is deleted,
+so a failure in between leaks a blob but never loses one. The garbage
+collector deletes blobs that have had no references for a grace period,
+and uploads never attached to a post once they expire.
+
+PostAttachments.created_at is naive UTC written by this module.
+"""
+import datetime
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+CHUNK_SIZE = 64 * 1024
+# Served inline; anything else is sent as a download, so an uploaded HTML
+# file can't run in the app's origin.
+INLINE_TYPES = frozenset(('application/pdf', 'image/gif', 'image/jpeg', 'image/png', 'image/webp', 'text/plain'))
+
+
+class AttachmentTooLarge(Exception):
+    """An upload went past the size limit."""
+
+
+class BlobStore:
+    """Files named by their SHA-256 under `root`, fanned out by the first two hex digits."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def receive(self, stream, max_bytes, chunk_size=CHUNK_SIZE):
+        """Copies a stream to a temporary file; returns (temporary path, sha256, size)."""
+        staging = os.path.join(self.root, 'tmp')
+        os.makedirs(staging, exist_ok=True)
+        digest, size = hashlib.sha256(), 0
+        handle, temp_path = tempfile.mkstemp(dir=staging)
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise AttachmentTooLarge(max_bytes)
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return temp_path, digest.hexdigest(), size
+
+    def keep(self, temp_path, sha256):
+        """Moves a received file into place, or drops it if that content is stored already.
+
+        Either way the stored file's mtime is now, which tells the garbage
+        collector it was just referenced again.
+        """
+        path = self.path(sha256)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        else:
+            os.unlink(temp_path)
+
+    def discard(self, temp_path):
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    def remove(self, sha256, older_than, referenced=None):
+        """Deletes a blob unless it was stored or re-uploaded after `older_than` (a Unix time).
+
+        The blob is renamed to a tombstone before it is checked, so a
+        concurrent keep() either touched it first, or finds it gone and
+        stores its own copy. `referenced(sha256)`, if given, is asked once
+        more before the tombstone is unlinked; uploads count their
+        reference before keep(), so this catches one that raced the check.
+        """
+        path = self.path(sha256)
+        tombstone = f'{path}.deleting'
+        try:
+            os.replace(path, tombstone)
+        except FileNotFoundError:
+            return False
+        if os.stat(tombstone).st_mtime < older_than and not (referenced is not None and referenced(sha256)):
+            os.unlink(tombstone)
+            return True
+        # Same content as any copy a keep() stored meanwhile, so it can go back over it.
+        os.replace(tombstone, path)
+        return False
+
+
+# -----------------
+# Rows and reference counts
+# -----------------
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def record_upload(cursor, uploader_id, school_id, sha256, filename, content_type, size, post_id=None):
+    """Adds an attachment row, by default not yet attached to a post; returns its id.
+
+    Count its reference first.
+    """
+    cursor.execute("""
+        INSERT INTO PostAttachments (post_id, uploaded_by, school_id, sha256, filename, content_type, size, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (post_id, uploader_id, school_id, sha256, filename, content_type, size, _utcnow()))
+    return cursor.lastrowid
+
+
+def add_references(cursor, blobs):
+    """Counts one more reference to each (sha256, size); the caller commits."""
+    now = time.time()
+    for sha256, size in blobs:
+        cursor.execute("INSERT IGNORE INTO AttachmentBlobs (sha256, size, ref_count, updated_at) VALUES (%s, %s, 1, %s)",
+                       (sha256, size, now))
+        if cursor.rowcount == 0:
+            cursor.execute("UPDATE AttachmentBlobs SET ref_count = ref_count + 1, updated_at = %s WHERE sha256 = %s",
+                           (now, sha256))
+
+
+def release_references(cursor, sha256s):
+    """Counts one reference fewer to each sha256 (repeats count again); the caller commits."""
+    if sha256s:
+        now = time.time()
+        cursor.executemany("UPDATE AttachmentBlobs SET ref_count = ref_count - 1, updated_at = %s WHERE sha256 = %s",
+                           [(now, sha256) for sha256 in sha256s])
+
+
+def update_references(pool, change, blobs):
+    """Applies add_references or release_references in its own transaction on `pool`."""
+    connection = pool.acquire()
+    try:
+        with connection.cursor() as cursor:
+            change(cursor, blobs)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        pool.release(connection, discard=True)
+        raise
+    pool.release(connection)
+
+
+# -----------------
+# Garbage collection
+# -----------------
+class GarbageCollector:
+    """Deletes unreferenced blobs and expired uploads in a background thread.
+
+    `shard_pools` are the primaries whose PostAttachments rows are checked
+    for uploads older than `upload_ttl` that were never attached to a
+    post; `directory_pool` holds the reference counts. A blob is deleted
+    once it has had no references for `grace` seconds.
+    """
+
+    def __init__(self, store, directory_pool, shard_pools, interval=300.0, grace=3600.0, upload_ttl=86400.0,
+                 batch_size=500, log=None):
+        self.store = store
+        self.directory_pool = directory_pool
+        self.shard_pools = list(shard_pools)
+        self.interval = interval
+        self.grace = grace
+        self.upload_ttl = upload_ttl
+        self.batch_size = batch_size
+        self.log = log
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'expired_uploads': 0, 'blobs_deleted': 0, 'errors': 0}
+
+    def start(self):
+        """Starts the background thread once; later calls do nothing."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='attachment-gc', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.collect()
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                if self.log is not None:
+                    self.log(f'Attachment garbage collection failed: {e}')
+            time.sleep(self.interval)
+
+    def collect(self):
+        """One pass; returns (expired uploads, deleted blobs)."""
+        expired = sum(self._expire_uploads(pool) for pool in self.shard_pools)
+        deleted = self._delete_blobs()
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['expired_uploads'] += expired
+            self._stats['blobs_deleted'] += deleted
+        return expired, deleted
+
+    def _expire_uploads(self, pool):
+        cutoff = _utcnow() - datetime.timedelta(seconds=self.upload_ttl)
+        connection = pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT id, sha256 FROM PostAttachments WHERE post_id IS NULL AND created_at < %s LIMIT %s",
+                               (cutoff, self.batch_size))
+                rows = cursor.fetchall()
+                if rows:
+                    cursor.executemany("DELETE FROM PostAttachments WHERE id = %s AND post_id IS NULL",
+                                       [(row['id'],) for row in rows])
+            connection.commit()
+        finally:
+            pool.release(connection)
+        if rows:
+            update_references(self.directory_pool, release_references, [row['sha256'] for row in rows])
+        return len(rows)
+
+    def _delete_blobs(self):
+        cutoff = time.time() - self.grace
+        deleted = 0
+        connection = self.directory_pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT sha256 FROM AttachmentBlobs WHERE ref_count <= 0 AND updated_at < %s LIMIT %s",
+                               (cutoff, self.batch_size))
+                for row in cursor.fetchall():
+                    # Only if nobody took a reference since the SELECT.
+                    cursor.execute("DELETE FROM AttachmentBlobs WHERE sha256 = %s AND ref_count <= 0", (row['sha256'],))
+                    unreferenced = cursor.rowcount == 1
+                    connection.commit()
+                    if unreferenced and self.store.remove(row['sha256'], cutoff,
+                                                          lambda sha256: self._referenced(cursor, sha256)):
+                        deleted += 1
+                    connection.commit()
+            connection.commit()
+        finally:
+            self.directory_pool.release(connection)
+        return deleted
+
+    @staticmethod
+    def _referenced(cursor, sha256):
+        """True if an upload counted a reference since the blob's row was deleted."""
+        cursor.execute("SELECT ref_count FROM AttachmentBlobs WHERE sha256 = %s AND ref_count > 0", (sha256,))
+        return cursor.fetchone() is not None
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
@@ -0,0 +1,8 @@
+"""Load-test and benchmark suite.
+
+datagen builds a seeded synthetic district, load replays role-weighted
+traffic against it and report turns the samples into per-endpoint
+latency percentiles, throughput and queries per request. By default
+everything runs in-process against a fresh local_db (SQLite) database,
+so it needs no network or MySQL server. See __main__.py for usage.
+"""
@@ -0,0 +1,175 @@
+"""Command line entry point; run from parentsquare_clone_backend/.
+
+    python -m benchmarks run --preset small --concurrency 8 --requests 2000 --output head.json
+    python -m benchmarks compare base.json head.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from benchmarks import datagen, report
+from benchmarks.load import DEFAULT_MIX, HttpTransport, InProcessTransport, LoadDriver
+
+
+def parse_mix(value):
+    """Parses 'parent_feed=40,login=10' into a mix dict."""
+    mix = {}
+    for item in value.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'Unknown operation {operation!r}')
+        mix[operation] = float(weight)
+    return mix
+
+
+def district_spec(args):
+    spec = datagen.PRESETS[args.preset]
+    if args.schools:
+        spec = spec._replace(schools=args.schools)
+    return spec
+
+
+def import_app(database_path=None, bcrypt_rounds=None):
+    """Imports the app, pointing it at a stand-in database first if given."""
+    if database_path is not None:
+        os.environ['DB_BACKEND'] = 'sqlite'
+        os.environ['SQLITE_PATH'] = database_path
+        os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-for-local-runs')
+        # Every simulated user logs in from the same address; measure the
+        # endpoints, not the per-IP rate limit.
+        os.environ.setdefault('ADMISSION_ENABLED', 'false')
+    if bcrypt_rounds is not None:
+        os.environ['BCRYPT_LOG_ROUNDS'] = str(bcrypt_rounds)
+    import app as app_module
+    return app_module
+
+
+def seed_database(app_module, spec, seed):
+    """Migrates the app's database and generates a district into it."""
+    import schema_migrations
+
+    connection = app_module.connect_to_database()
+    try:
+        schema_migrations.upgrade(connection, log=lambda message: None)
+        password_hash = app_module.passwords.hash(datagen.PASSWORD)
+        return datagen.generate_district(connection, spec, seed=seed, password_hash=password_hash,
+                                         log=lambda message: print(message, file=sys.stderr))
+    finally:
+        connection.close()
+
+
+def command_seed(args):
+    app_module = import_app(bcrypt_rounds=args.bcrypt_rounds)
+    try:
+        manifest = seed_database(app_module, district_spec(args), args.seed)
+    finally:
+        app_module.passwords.shutdown()
+    with open(args.manifest, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    print(f'Wrote {args.manifest}', file=sys.stderr)
+
+
+def command_run(args):
+    workdir = None
+    if args.url:
+        if not args.manifest:
+            sys.exit('--url needs the --manifest written by `seed`')
+        with open(args.manifest, encoding='utf-8') as f:
+            manifest = json.load(f)
+        transport, app_module = HttpTransport(args.url), None
+    else:
+        workdir = tempfile.mkdtemp(prefix='bench-')
+        app_module = import_app(os.path.join(workdir, 'district.sqlite3'), args.bcrypt_rounds)
+        manifest = seed_database(app_module, district_spec(args), args.seed)
+        transport = InProcessTransport(app_module.app, count_queries=True)
+
+    driver = LoadDriver(transport, manifest, mix=args.mix, concurrency=args.concurrency, seed=args.seed)
+    try:
+        samples, elapsed = driver.run(requests=None if args.duration else args.requests,
+                                      duration=args.duration, warmup=args.warmup)
+        result = report.summarize(samples, elapsed)
+        result['run'] = {
+            'target': args.url or 'in-process (local_db)',
+            'seed': args.seed,
+            'spec': manifest['spec'],
+            'concurrency': args.concurrency,
+            'mix': driver.mix,
+            'elapsed_seconds': round(elapsed, 3),
+        }
+        result['environment'] = report.environment()
+        if app_module is not None:
+            result['run']['bcrypt_rounds'] = app_module.passwords.rounds
+            result['db_pool'] = app_module.db_pool.stats()
+            result['feed_cache'] = app_module.post_feeds.stats()
+    finally:
+        if app_module is not None:
+            app_module.passwords.shutdown()
+            app_module.read_buffer.close()
+            app_module.db_router.close()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(report.format_table(result))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f'Wrote {args.output}', file=sys.stderr)
+
+
+def command_compare(args):
+    with open(args.base, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(args.head, encoding='utf-8') as f:
+        head = json.load(f)
+    regressions = report.compare(base, head, threshold=args.threshold, metric=args.metric)
+    for entry in regressions:
+        print(f"REGRESSION {entry['endpoint']} {entry['metric']}: {entry['base']} -> {entry['head']}")
+    if regressions:
+        sys.exit(1)
+    print('No regressions')
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_district_options(command):
+        command.add_argument('--preset', choices=sorted(datagen.PRESETS), default='small')
+        command.add_argument('--schools', type=int, help='override the preset school count')
+        command.add_argument('--seed', type=int, default=0)
+        command.add_argument('--bcrypt-rounds', type=int, help="defaults to the app's BCRYPT_LOG_ROUNDS")
+
+    seed = commands.add_parser('seed', help="generate a district into the app's configured database")
+    add_district_options(seed)
+    seed.add_argument('--manifest', default='manifest.json', help='where to write the district manifest')
+    seed.set_defaults(handler=command_seed)
+
+    run = commands.add_parser('run', help='replay load and report latency per endpoint')
+    add_district_options(run)
+    run.add_argument('--url', help='load a running server instead of an in-process app')
+    run.add_argument('--manifest', help='district manifest for --url')
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--requests', type=int, default=2000, help='operations to record')
+    run.add_argument('--duration', type=float, help='run for this many seconds instead')
+    run.add_argument('--warmup', type=int, default=100, help='operations to run before recording')
+    default_mix = ','.join(f'{operation}={weight}' for operation, weight in DEFAULT_MIX.items())
+    run.add_argument('--mix', type=parse_mix, help=f'operation weights (default: {default_mix})')
+    run.add_argument('--output', help='write the JSON result here')
+    run.set_defaults(handler=command_run)
+
+    compare = commands.add_parser('compare', help='exit 1 if head regressed against base')
+    compare.add_argument('base')
+    compare.add_argument('head')
+    compare.add_argument('--threshold', type=float, default=0.10, help='allowed relative growth')
+    compare.add_argument('--metric', default='p95_ms', choices=('p50_ms', 'p95_ms', 'p99_ms'))
+    compare.set_defaults(handler=command_compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == '__main__':
+    main()
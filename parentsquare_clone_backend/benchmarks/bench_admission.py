@@ -0,0 +1,157 @@
+"""Feed latency during a login flood, with and without admission control.
+
+Seeds a district into a local_db database and serves the app from a
+threaded HTTP server. Reader threads page through /api/parent/posts while
+flood threads post wrong passwords for real accounts at a fixed rate from
+many client addresses, as credential stuffing would, so every admitted
+attempt costs a bcrypt verification. A login holds a pooled connection
+while it waits for bcrypt, so an unchecked flood starves the pool that the
+reads need. Three phases run in turn: readers alone, the flood with
+admission control off, and the flood with it on. The feed cache is off, so
+every read reaches the database.
+
+    python benchmarks/bench_admission.py --flood-rate 100 --readers 4 --seconds 5
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def import_app(database_path, args):
+    os.environ.update(DB_BACKEND='sqlite', SQLITE_PATH=database_path, BCRYPT_LOG_ROUNDS=str(args.rounds),
+                      PASSWORD_HASHER_EXECUTOR=args.executor, FEED_CACHE_SIZE='0', METRICS_ENABLED='false',
+                      ADMISSION_TRUST_FORWARDED='true')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-for-local-runs')
+    import app as app_module
+    return app_module
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+def call(url, data=None, headers=None):
+    """Returns the status of one request to the benchmark server."""
+    body = json.dumps(data).encode() if data is not None else None
+    request = urllib.request.Request(url, data=body, headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def run_phase(base_url, tokens, emails, args, flood_rate):
+    stop = threading.Event()
+    feed_latencies, feed_errors, statuses = [], [], []
+
+    def read_loop(token):
+        headers = {'Authorization': f'Bearer {token}'}
+        while not stop.is_set():
+            started = time.perf_counter()
+            status = call(f'{base_url}/api/parent/posts?limit=20', headers=headers)
+            feed_latencies.append((time.perf_counter() - started) * 1000)
+            if status != 200:
+                feed_errors.append(status)
+
+    def flood_loop(seed, interval):
+        # Open loop: attempts keep coming at the same rate however slowly
+        # the server answers, as they would from many attackers.
+        rng = random.Random(seed)
+        due = time.monotonic() + rng.random() * interval
+        while not stop.is_set():
+            stop.wait(max(0.0, due - time.monotonic()))
+            due += interval
+            address = f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}'
+            statuses.append(call(f'{base_url}/api/login', {'email': rng.choice(emails), 'password': 'wrong'},
+                                 {'X-Forwarded-For': address}))
+
+    threads = [threading.Thread(target=read_loop, args=(tokens[number % len(tokens)],)) for number in range(args.readers)]
+    threads += [threading.Thread(target=flood_loop, args=(number, args.flood / flood_rate))
+                for number in range(args.flood if flood_rate else 0)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    feed_latencies.sort()
+    return {
+        'feed_p50_ms': statistics.median(feed_latencies),
+        'feed_p99_ms': feed_latencies[min(len(feed_latencies) - 1, int(len(feed_latencies) * 0.99))],
+        'feed_errors': len(feed_errors),
+        'verified_per_sec': statuses.count(401) / args.seconds,
+        'shed_per_sec': statuses.count(429) / args.seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flood-rate', type=float, default=100, help='login attempts per second')
+    parser.add_argument('--flood', type=int, default=64, help='login flood threads sharing that rate')
+    parser.add_argument('--readers', type=int, default=4, help='concurrent feed reader threads')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt cost of the seeded accounts')
+    parser.add_argument('--executor', default='thread', help='PasswordHasher executor')
+    parser.add_argument('--preset', default='small')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-admission-')
+    app_module = import_app(os.path.join(workdir, 'district.sqlite3'), args)
+    import schema_migrations
+    from benchmarks import datagen
+
+    connection = app_module.connect_to_database()
+    schema_migrations.upgrade(connection, log=lambda message: None)
+    manifest = datagen.generate_district(connection, datagen.PRESETS[args.preset],
+                                         password_hash=app_module.passwords.hash(datagen.PASSWORD),
+                                         log=lambda message: None)
+    connection.close()
+
+    app = app_module.app
+    app.config['ADMISSION_ENABLED'] = False
+    client = app.test_client()
+    tokens = [client.post('/api/login', json={'email': email, 'password': datagen.PASSWORD}).get_json()['access_token']
+              for email in manifest['users']['parent'][:args.readers]]
+    emails = [email for users in manifest['users'].values() for email in users]
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_port}'
+
+    print(f'{"phase":<22} {"feed p50 ms":>12} {"feed p99 ms":>12} {"feed errors":>12} {"verified/s":>11} {"shed/s":>8}')
+    for label, flood_rate, enabled in (('readers only', 0, True), ('flood, no admission', args.flood_rate, False),
+                                       ('flood, admission', args.flood_rate, True)):
+        app.config['ADMISSION_ENABLED'] = enabled
+        app_module.admission_control.buckets.clear()
+        result = run_phase(base_url, tokens, emails, args, flood_rate)
+        print(f'{label:<22} {result["feed_p50_ms"]:>12.2f} {result["feed_p99_ms"]:>12.2f} {result["feed_errors"]:>12} '
+              f'{result["verified_per_sec"]:>11.1f} {result["shed_per_sec"]:>8.1f}')
+    print('admission stats:', {key: value for key, value in app_module.admission_control.stats().items() if value})
+
+    server.shutdown()
+    app_module.passwords.shutdown()
+    app_module.read_buffer.close()
+    app_module.db_router.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Feed latency as post history grows, with and without archiving.
+
+Seeds a district whose posts make up the current school year (the hot
+set), then adds older posts in steps, each step's history a multiple of
+the hot set. At every step it times a page of each feed twice: with the
+whole history still in Posts and FeedInbox, and after the archiver has
+moved it to PostsArchive. The hot set stays the same size throughout, so
+the archived timings should stay flat while the live ones grow. The
+history is then put back for the next step. The feed cache is off, so
+every request reaches the database.
+
+    python benchmarks/bench_archive.py --history 0,4,16,64
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+POST_COLUMNS = 'id, title, content, user_id, class_id, created_at'
+
+
+def import_app(database_path, rounds):
+    os.environ.update(DB_BACKEND='sqlite', SQLITE_PATH=database_path, BCRYPT_LOG_ROUNDS=str(rounds),
+                      PASSWORD_HASHER_EXECUTOR='inline', FEED_CACHE_SIZE='0', METRICS_ENABLED='false',
+                      ARCHIVE_INTERVAL='0', ARCHIVE_BATCH_PAUSE='0', ARCHIVE_BATCH_SIZE='2000')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-for-local-runs')
+    import app as app_module
+    return app_module
+
+
+def add_history(connection, feed_inbox, datagen, classes, posts, rng):
+    """Adds `posts` posts dated before the hot set, spread over `classes`, and fans them out."""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(created_at) AS oldest FROM Posts")
+        oldest = cursor.fetchone()['oldest'] or datagen.EPOCH
+        oldest = datetime.datetime.fromisoformat(str(oldest))
+        rows = []
+        for number in range(posts):
+            oldest -= datetime.timedelta(minutes=rng.randint(1, 90))
+            class_id, teacher_id = classes[number % len(classes)]
+            rows.append((rng.choice(datagen.POST_TITLES), datagen.POST_BODY, teacher_id, class_id,
+                         oldest.strftime('%Y-%m-%d %H:%M:%S')))
+        for start in range(0, len(rows), datagen.BATCH_SIZE):
+            cursor.executemany("INSERT INTO Posts (title, content, user_id, class_id, created_at) VALUES (%s, %s, %s, %s, %s)",
+                               rows[start:start + datagen.BATCH_SIZE])
+        cursor.execute(*feed_inbox.fan_out_statement())
+    connection.commit()
+
+
+def restore_history(connection, feed_inbox):
+    """Moves archived posts back into Posts and FeedInbox."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO Posts ({POST_COLUMNS}) SELECT {POST_COLUMNS} FROM PostsArchive")
+        cursor.execute("DELETE FROM PostsArchive")
+        cursor.execute(*feed_inbox.fan_out_statement())
+    connection.commit()
+
+
+def time_feed(client, token, path, iterations):
+    """Median milliseconds for the first page of a feed."""
+    headers = {'Authorization': f'Bearer {token}'}
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(path, headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--history', default='0,4,16,64', help='history sizes, as multiples of the hot set')
+    parser.add_argument('--preset', default='small')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost, kept low for seeding')
+    args = parser.parse_args()
+    multiples = [int(multiple) for multiple in args.history.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='bench-archive-')
+    app_module = import_app(os.path.join(workdir, 'district.sqlite3'), args.rounds)
+    import feed_inbox
+    import schema_migrations
+    from benchmarks import datagen
+
+    connection = app_module.connect_to_database()
+    schema_migrations.upgrade(connection, log=lambda message: None)
+    manifest = datagen.generate_district(connection, datagen.PRESETS[args.preset],
+                                         password_hash=app_module.passwords.hash(datagen.PASSWORD),
+                                         log=lambda message: None)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM Posts")
+        hot_posts = cursor.fetchone()['n']
+        cursor.execute("SELECT id, teacher_id FROM Classes ORDER BY id")
+        classes = [(row['id'], row['teacher_id']) for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT psl.student_id FROM Users u JOIN ParentStudentLinks psl ON psl.parent_user_id = u.id WHERE u.email = %s
+        """, (manifest['users']['parent'][0],))
+        child_id = cursor.fetchone()['student_id']
+    connection.commit()
+    # The hot set is everything datagen made; history goes before it.
+    app_module.post_archiver.horizon = lambda: datagen.EPOCH
+
+    client = app_module.app.test_client()
+    tokens = {role: client.post('/api/login', json={'email': manifest['users'][role][0], 'password': datagen.PASSWORD})
+              .get_json()['access_token'] for role in ('school_admin', 'parent', 'student')}
+    feeds = (('admin', 'school_admin', '/api/admin/posts?limit=20'),
+             ('parent', 'parent', '/api/parent/posts?limit=20'),
+             ('1 child', 'parent', f'/api/parent/posts?limit=20&student_id={child_id}'),
+             ('student', 'student', '/api/student/posts?limit=20'))
+
+    rng = random.Random(0)
+    header = f'{"history":>8} {"posts":>8}' + ''.join(f' {name + " live":>13} {name + " arch":>13}' for name, _, _ in feeds)
+    print(f'hot set: {hot_posts} posts; median ms for the first page of each feed')
+    print(header)
+    history = 0
+    for multiple in multiples:
+        add_history(connection, feed_inbox, datagen, classes, multiple * hot_posts - history, rng)
+        history = multiple * hot_posts
+        live = [time_feed(client, tokens[role], path, args.iterations) for _, role, path in feeds]
+        app_module.post_archiver.run_once()
+        archived = [time_feed(client, tokens[role], path, args.iterations) for _, role, path in feeds]
+        restore_history(connection, feed_inbox)
+        print(f'{f"{multiple}x":>8} {hot_posts + history:>8}' +
+              ''.join(f' {a:>13.3f} {b:>13.3f}' for a, b in zip(live, archived)))
+
+    connection.close()
+    app_module.read_buffer.close()
+    app_module.db_router.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
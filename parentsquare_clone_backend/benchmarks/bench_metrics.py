@@ -0,0 +1,102 @@
+"""Measures the overhead of the request/query instrumentation in metrics.py.
+
+First times the individual hooks against a local_db connection, then runs
+the load suite with the same seed alternately with METRICS_ENABLED=false
+and true, and compares the median of each. The suite runs on one thread
+by default: with several threads in one process, GIL scheduling noise is
+far larger than the overhead being measured.
+
+    python benchmarks/bench_metrics.py --requests 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import local_db  # noqa: E402
+import metrics  # noqa: E402
+
+
+def per_call_ns(fn, iterations):
+    """Best of five timings, which filters out scheduler noise."""
+    return min(timeit.repeat(fn, number=iterations, repeat=5)) / iterations * 1e9
+
+
+def micro(iterations):
+    raw = local_db.connect(':memory:')
+    instrumented = metrics.InstrumentedConnection(raw)
+    histogram = metrics.HistogramFamily('bench_seconds', 'benchmark', ('endpoint',))
+    sql = 'SELECT 1 FROM (SELECT 1) WHERE 1 = %s'
+
+    def query(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (1,))
+            cursor.fetchall()
+
+    def request_hooks():
+        trace = metrics.start_trace()
+        metrics.end_trace()
+        metrics.observe_request(trace, 'GET', '/bench', 200, 100)
+
+    raw_ns = per_call_ns(lambda: query(raw), iterations)
+    instrumented_ns = per_call_ns(lambda: query(instrumented), iterations)
+    print(f'{"hook":<32} {"ns/call":>10}')
+    print(f'{"histogram observe":<32} {per_call_ns(lambda: histogram.observe(0.01, "/bench"), iterations):>10.0f}')
+    print(f'{"start/end trace + request":<32} {per_call_ns(request_hooks, iterations):>10.0f}')
+    print(f'{"query overhead (instrumented)":<32} {instrumented_ns - raw_ns:>10.0f}')
+    raw.close()
+
+
+def suite_run(enabled, args, output):
+    env = dict(os.environ, METRICS_ENABLED='true' if enabled else 'false')
+    subprocess.run([sys.executable, '-m', 'benchmarks', 'run', '--requests', str(args.requests),
+                    '--concurrency', str(args.concurrency), '--seed', str(args.seed),
+                    '--bcrypt-rounds', str(args.rounds), '--output', output],
+                   cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(output, encoding='utf-8') as f:
+        return json.load(f)['overall']
+
+
+def median_result(results):
+    return {key: statistics.median(result[key] for result in results)
+            for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')}
+
+
+def macro(args):
+    runs = {False: [], True: []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for number in range(args.repeat):
+            for enabled in (False, True):
+                output = os.path.join(workdir, f'{number}-{enabled}.json')
+                runs[enabled].append(suite_run(enabled, args, output))
+    off, on = median_result(runs[False]), median_result(runs[True])
+    print(f'\n{"load suite":<12} {"req/s":>10} {"p50 ms":>10} {"p95 ms":>10} {"p99 ms":>10}')
+    for label, result in (('metrics off', off), ('metrics on', on)):
+        print(f'{label:<12} {result["throughput_rps"]:>10.1f} {result["p50_ms"]:>10.3f} '
+              f'{result["p95_ms"]:>10.3f} {result["p99_ms"]:>10.3f}')
+    print(f'p50 overhead: {on["p50_ms"] - off["p50_ms"]:+.3f} ms '
+          f'({(on["p50_ms"] - off["p50_ms"]) / off["p50_ms"] * 100:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5, help='load suite runs per setting')
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost, kept low so it does not dominate')
+    args = parser.parse_args()
+
+    micro(args.iterations)
+    macro(args)
+
+
+if __name__ == '__main__':
+    main()
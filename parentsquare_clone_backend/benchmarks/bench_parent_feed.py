@@ -0,0 +1,112 @@
+"""Parent feed cost as the number of linked children grows.
+
+Seeds a district into a local_db database, then adds one parent per
+family size, linked to children in that many different classes plus a
+sibling who shares the first child's class. It times a page of
+/api/parent/posts for each parent three ways: from the inbox, from the
+class join (inbox not ready), and filtered to one child. The feed cache
+is off, so every request reaches the database.
+
+    python benchmarks/bench_parent_feed.py --children 1,2,4,8,16
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def import_app(database_path, rounds):
+    os.environ.update(DB_BACKEND='sqlite', SQLITE_PATH=database_path, BCRYPT_LOG_ROUNDS=str(rounds),
+                      PASSWORD_HASHER_EXECUTOR='inline', FEED_CACHE_SIZE='0', METRICS_ENABLED='false')
+    os.environ.setdefault('SECRET_KEY', 'benchmark-only-secret-key-for-local-runs')
+    import app as app_module
+    return app_module
+
+
+def add_parent(connection, feed_inbox, school_id, class_ids, children, password_hash):
+    """Creates a parent of `children` students in distinct classes, plus a sibling in the first class."""
+    with connection.cursor() as cursor:
+        email = f'bench-parent-{children}@example.org'
+        cursor.execute("INSERT INTO Users (first_name, last_name, email, password_hash, role, school_id) VALUES (%s, %s, %s, %s, %s, %s)",
+                       ('Bench', 'Parent', email, password_hash, 'parent', school_id))
+        parent_id = cursor.lastrowid
+        for class_id in [class_ids[index % len(class_ids)] for index in range(children)] + [class_ids[0]]:
+            cursor.execute("INSERT INTO Students (first_name, last_name, school_id) VALUES (%s, %s, %s)",
+                           ('Bench', 'Child', school_id))
+            student_id = cursor.lastrowid
+            cursor.execute("INSERT INTO StudentEnrollments (student_id, class_id) VALUES (%s, %s)", (student_id, class_id))
+            cursor.execute("INSERT INTO ParentStudentLinks (parent_user_id, student_id) VALUES (%s, %s)", (parent_id, student_id))
+        feed_inbox.rebuild_inbox(cursor, parent_id)
+    connection.commit()
+    return parent_id, email, student_id
+
+
+def time_feed(client, token, query, iterations, local_db):
+    """Median milliseconds and queries for one page of the parent feed."""
+    headers = {'Authorization': f'Bearer {token}'}
+    timings, queries = [], None
+    for _ in range(iterations):
+        before = local_db.thread_queries()
+        started = time.perf_counter()
+        response = client.get(f'/api/parent/posts?limit=20{query}', headers=headers)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries = local_db.thread_queries() - before
+        assert response.status_code == 200, response.get_data(as_text=True)
+    return statistics.median(timings), queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--children', default='1,2,4,8,16', help='family sizes to measure')
+    parser.add_argument('--preset', default='small')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost, kept low for seeding')
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.children.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='bench-parent-feed-')
+    app_module = import_app(os.path.join(workdir, 'district.sqlite3'), args.rounds)
+    import feed_inbox
+    import local_db
+    import schema_migrations
+    from benchmarks import datagen
+
+    connection = app_module.connect_to_database()
+    schema_migrations.upgrade(connection, log=lambda message: None)
+    password_hash = app_module.passwords.hash(datagen.PASSWORD)
+    manifest = datagen.generate_district(connection, datagen.PRESETS[args.preset], password_hash=password_hash,
+                                         log=lambda message: None)
+    class_ids = sorted(class_id for ids in manifest['teacher_classes'].values() for class_id in ids)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT school_id FROM Classes WHERE id = %s", (class_ids[0],))
+        school_id = cursor.fetchone()['school_id']
+
+    client = app_module.app.test_client()
+    print(f'{"children":>8} {"inbox ms":>9} {"queries":>8} {"join ms":>9} {"queries":>8} {"1 child ms":>10} {"queries":>8}')
+    for children in sizes:
+        parent_id, email, student_id = add_parent(connection, feed_inbox, school_id, class_ids,
+                                                  children, password_hash)
+        token = client.post('/api/login', json={'email': email, 'password': datagen.PASSWORD}).get_json()['access_token']
+        inbox = time_feed(client, token, '', args.iterations, local_db)
+        with connection.cursor() as cursor:
+            feed_inbox.set_status(cursor, parent_id, 'rebuilding')
+        connection.commit()
+        join = time_feed(client, token, '', args.iterations, local_db)
+        one_child = time_feed(client, token, f'&student_id={student_id}', args.iterations, local_db)
+        print(f'{children:>8} {inbox[0]:>9.3f} {inbox[1]:>8} {join[0]:>9.3f} {join[1]:>8} '
+              f'{one_child[0]:>10.3f} {one_child[1]:>8}')
+
+    connection.close()
+    app_module.read_buffer.close()
+    app_module.db_router.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Login throughput and feed latency during a concurrent login burst.
+
+Login threads verify passwords through PasswordHasher while feed threads
+serialize a page of posts, standing in for cheap feed reads. Each hasher
+mode is run in turn:
+
+    python benchmarks/bench_passwords.py --logins 16 --feeds 4 --seconds 5
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from passwords import PasswordHasher  # noqa: E402
+
+FEED_PAGE = [{
+    'id': i,
+    'title': f'Announcement {i}',
+    'content': 'Please remember to return the field trip form by Friday. ' * 4,
+    'created_at': str(datetime.datetime(2024, 9, 1) + datetime.timedelta(hours=i)),
+    'class_name': 'Grade 3',
+    'author_first_name': 'Jane',
+    'author_last_name': 'Doe',
+} for i in range(20)]
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(mode, args):
+    hasher = PasswordHasher(rounds=args.rounds, max_workers=args.workers, executor=mode)
+    stored_hash = hasher.hash('correct horse battery staple')  # also warms the pool
+    stop = threading.Event()
+    logins = []
+    feed_latencies = []
+
+    def login_loop():
+        while not stop.is_set():
+            hasher.verify(stored_hash, 'correct horse battery staple')
+            logins.append(1)
+
+    def feed_loop():
+        while not stop.is_set():
+            started = time.perf_counter()
+            for _ in range(10):
+                json.dumps(FEED_PAGE)
+            feed_latencies.append(time.perf_counter() - started)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=login_loop) for _ in range(args.logins)]
+    threads += [threading.Thread(target=feed_loop) for _ in range(args.feeds)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    hasher.shutdown()
+
+    return {
+        'mode': mode,
+        'logins_per_sec': len(logins) / args.seconds,
+        'feed_p50_ms': statistics.median(feed_latencies) * 1000 if feed_latencies else float('nan'),
+        'feed_p99_ms': percentile(feed_latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--logins', type=int, default=16, help='concurrent login threads')
+    parser.add_argument('--feeds', type=int, default=4, help='concurrent feed threads')
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--modes', default='inline,thread,process')
+    args = parser.parse_args()
+
+    print(f'{"mode":<8} {"logins/s":>10} {"feed_p50_ms":>12} {"feed_p99_ms":>12}')
+    for mode in args.modes.split(','):
+        result = run(mode, args)
+        print(f'{result["mode"]:<8} {result["logins_per_sec"]:>10.1f} '
+              f'{result["feed_p50_ms"]:>12.2f} {result["feed_p99_ms"]:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
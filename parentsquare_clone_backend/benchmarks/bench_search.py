@@ -0,0 +1,91 @@
+"""Search index build time, memory and query latency at scale.
+
+Fills a SearchIndex directly with synthetic posts: titles from the data
+generator's list, contents drawn from a Zipf-distributed vocabulary,
+spread over `--schools` schools of `--classes-per-school` classes. It then
+times a fixed query mix scoped the way the endpoint scopes it: a parent
+(three classes) and a school admin (one school's classes).
+
+    python benchmarks/bench_search.py --posts 1000000
+"""
+import argparse
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+import search_index  # noqa: E402
+from benchmarks.datagen import POST_TITLES  # noqa: E402
+
+QUERIES = ('field trip form', 'picture day', 'conference sign', 'homework', 'early dis',
+           'permission slip', 'word17 word4', 'supplies needed')
+
+
+def vocabulary(size):
+    """Zipf-ranked words; the school words sit mid-table, as in real posts once stopwords are gone."""
+    words = [f'word{number}' for number in range(size)]
+    for rank, word in zip(range(50, size, 97), ('field', 'trip', 'form', 'permission', 'slip', 'schedule',
+                                                 'sign', 'lunch', 'bus', 'library')):
+        words[rank] = word
+    return words
+
+
+def fill(index, args, rng):
+    words = vocabulary(args.vocabulary)
+    cumulative, total = [], 0.0
+    for rank in range(len(words)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    classes = args.schools * args.classes_per_school
+    started = time.perf_counter()
+    for post_id in range(1, args.posts + 1):
+        content = ' '.join(rng.choices(words, cum_weights=cumulative, k=args.words))
+        index.add(post_id, rng.randint(1, classes), rng.choice(POST_TITLES), content)
+    return time.perf_counter() - started
+
+
+def time_queries(index, class_ids, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query, class_ids, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], timings[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--schools', type=int, default=100)
+    parser.add_argument('--classes-per-school', type=int, default=100)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=30, help='content words per post')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = search_index.SearchIndex(pools=[])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    seconds = fill(index, args, rng)
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats = index.stats()
+    print(f'indexed {stats["posts"]} posts, {stats["terms"]} terms in {seconds:.1f}s, '
+          f'~{(rss_after - rss_before) / 1024:.0f} MB')
+
+    parent_classes = rng.sample(range(1, args.schools * args.classes_per_school + 1), 3)
+    school_classes = list(range(1, args.classes_per_school + 1))
+    print(f'{"scope":<8} {"p50 ms":>8} {"p95 ms":>8} {"max ms":>8}')
+    for label, class_ids in (('parent', parent_classes), ('admin', school_classes)):
+        p50, p95, worst = time_queries(index, class_ids, args.repeat)
+        print(f'{label:<8} {p50:>8.2f} {p95:>8.2f} {worst:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
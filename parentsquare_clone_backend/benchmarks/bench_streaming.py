@@ -0,0 +1,77 @@
+"""Compares buffered jsonify() with the streaming feed response.
+
+Rows come from a generator standing in for an unbuffered server-side
+cursor, so the benchmark runs without a database:
+
+    python benchmarks/bench_streaming.py --rows 200000
+"""
+import argparse
+import datetime
+import os
+import sys
+import time
+import tracemalloc
+
+from flask import Flask, jsonify
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from streaming import stream_rows_response  # noqa: E402
+
+
+def fake_rows(count):
+    start = datetime.datetime(2020, 1, 1)
+    for i in range(count):
+        yield {
+            'id': count - i,
+            'title': f'Announcement {i}',
+            'content': 'Please remember to return the field trip form by Friday. ' * 4,
+            'created_at': start + datetime.timedelta(minutes=i),
+            'class_name': f'Class {i % 40}',
+            'author_first_name': 'Jane',
+            'author_last_name': 'Doe',
+        }
+
+
+def measure(produce_chunks):
+    """Returns (time to first byte, total time, peak traced memory in bytes, body size)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    first_byte = None
+    size = 0
+    for chunk in produce_chunks():
+        if first_byte is None:
+            first_byte = time.perf_counter() - started
+        size += len(chunk)
+    total = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return first_byte, total, peak, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+
+    def buffered():
+        with app.test_request_context():
+            response = jsonify(list(fake_rows(args.rows)))
+            yield response.get_data()
+
+    def streamed():
+        with app.test_request_context():
+            response = stream_rows_response(fake_rows(args.rows))
+            for chunk in response.response:
+                yield chunk
+
+    print(f'{"path":<10} {"ttfb_ms":>10} {"total_ms":>10} {"peak_mib":>10} {"body_mib":>10}')
+    for name, produce in (('buffered', buffered), ('streamed', streamed)):
+        ttfb, total, peak, size = measure(produce)
+        print(f'{name:<10} {ttfb * 1000:>10.1f} {total * 1000:>10.1f} '
+              f'{peak / 2**20:>10.1f} {size / 2**20:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
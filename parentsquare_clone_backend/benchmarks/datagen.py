@@ -0,0 +1,142 @@
+"""Seeded synthetic school-district generator.
+
+The same seed and DistrictSpec always produce the same schools, people,
+enrollments and posts (only the bcrypt salt differs), so benchmark runs
+against freshly generated districts are comparable between commits.
+"""
+import datetime
+import random
+from collections import namedtuple
+
+import feed_inbox
+
+DistrictSpec = namedtuple('DistrictSpec', [
+    'schools', 'teachers_per_school', 'classes_per_teacher', 'students_per_class',
+    'posts_per_class', 'sibling_rate', 'student_login_rate',
+])
+
+PRESETS = {
+    'small': DistrictSpec(2, 5, 2, 15, 10, 0.2, 0.3),
+    'medium': DistrictSpec(5, 20, 3, 25, 30, 0.2, 0.3),
+    'large': DistrictSpec(20, 40, 4, 28, 60, 0.2, 0.3),
+}
+
+PASSWORD = 'benchmark-password'
+EPOCH = datetime.datetime(2024, 1, 1, 7, 0, 0)
+
+FIRST_NAMES = ('Ava', 'Ben', 'Chloe', 'Daniel', 'Elena', 'Farid', 'Grace', 'Hiro', 'Isla', 'Jamal',
+               'Keiko', 'Liam', 'Maya', 'Noah', 'Olivia', 'Priya', 'Quinn', 'Rosa', 'Sam', 'Tariq')
+LAST_NAMES = ('Adams', 'Brown', 'Chen', 'Diaz', 'Evans', 'Garcia', 'Hughes', 'Ito', 'Jones', 'Khan',
+              'Lopez', 'Martin', 'Nguyen', 'Okafor', 'Patel', 'Reyes', 'Smith', 'Tanaka', 'Walker', 'Young')
+SUBJECTS = ('Math', 'Science', 'Reading', 'History', 'Art', 'Music', 'Spanish', 'PE')
+POST_TITLES = ('Field trip reminder', 'Homework this week', 'Picture day', 'Conference sign-ups',
+               'Class update', 'Supplies needed', 'Early dismissal', 'Project due date')
+POST_BODY = ('Please remember to check the attached schedule and sign the permission slip. '
+             'Reach out if you have any questions about this week.')
+
+BATCH_SIZE = 1000
+
+
+def _insert_rows(cursor, sql, rows):
+    """Inserts rows one at a time, returning their ids (needed for foreign keys)."""
+    ids = []
+    for row in rows:
+        cursor.execute(sql, row)
+        ids.append(cursor.lastrowid)
+    return ids
+
+
+def _executemany(cursor, sql, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def generate_district(connection, spec, seed=0, password_hash=None, build_inboxes=True, log=print):
+    """Fills an empty database with a district; returns its manifest.
+
+    The manifest lists the login emails per role and the ids the load
+    driver needs (classes per teacher, posts per school). Every user's
+    password is PASSWORD; pass `password_hash` (a bcrypt hash of it at
+    the app's cost) so logins don't trigger a rehash.
+    """
+    rng = random.Random(seed)
+
+    def name():
+        return rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+
+    manifest = {
+        'seed': seed, 'spec': spec._asdict(), 'password': PASSWORD,
+        'users': {'school_admin': [], 'teacher': [], 'student': [], 'parent': []},
+        'teacher_classes': {}, 'school_posts': {},
+    }
+    users_sql = "INSERT INTO Users (first_name, last_name, email, password_hash, role, school_id) VALUES (%s, %s, %s, %s, %s, %s)"
+    minutes = 0
+
+    with connection.cursor() as cursor:
+        for school_number in range(1, spec.schools + 1):
+            domain = f'school{school_number}.example.org'
+            cursor.execute("INSERT INTO Schools (name) VALUES (%s)", (f'School {school_number}',))
+            school_id = cursor.lastrowid
+
+            admin_email = f'admin@{domain}'
+            cursor.execute(users_sql, (*name(), admin_email, password_hash, 'school_admin', school_id))
+            cursor.execute("UPDATE Schools SET admin_user_id = %s WHERE id = %s", (cursor.lastrowid, school_id))
+            manifest['users']['school_admin'].append(admin_email)
+
+            teacher_emails = [f'teacher{n}@{domain}' for n in range(1, spec.teachers_per_school + 1)]
+            teacher_ids = _insert_rows(cursor, users_sql, [
+                (*name(), email, password_hash, 'teacher', school_id) for email in teacher_emails])
+            manifest['users']['teacher'].extend(teacher_emails)
+
+            class_rows, class_teachers = [], []
+            for teacher_id, email in zip(teacher_ids, teacher_emails):
+                for _ in range(spec.classes_per_teacher):
+                    class_rows.append((f'{rng.choice(SUBJECTS)} {len(class_rows) + 1}', teacher_id, school_id))
+                    class_teachers.append((teacher_id, email))
+            class_ids = _insert_rows(cursor, "INSERT INTO Classes (class_name, teacher_id, school_id) VALUES (%s, %s, %s)", class_rows)
+            for class_id, (_, email) in zip(class_ids, class_teachers):
+                manifest['teacher_classes'].setdefault(email, []).append(class_id)
+
+            student_rows = [(*name(), school_id) for _ in range(len(class_ids) * spec.students_per_class)]
+            student_ids = _insert_rows(cursor, "INSERT INTO Students (first_name, last_name, school_id) VALUES (%s, %s, %s)", student_rows)
+            _executemany(cursor, "INSERT INTO StudentEnrollments (student_id, class_id) VALUES (%s, %s)", [
+                (student_id, class_ids[index // spec.students_per_class])
+                for index, student_id in enumerate(student_ids)])
+
+            # Students with their own login.
+            for index, student_id in enumerate(student_ids):
+                if rng.random() < spec.student_login_rate:
+                    email = f'student{index + 1}@{domain}'
+                    cursor.execute(users_sql, (*student_rows[index][:2], email, password_hash, 'student', school_id))
+                    cursor.execute("UPDATE Students SET user_id = %s WHERE id = %s", (cursor.lastrowid, student_id))
+                    manifest['users']['student'].append(email)
+
+            # One parent per family; some families have a second child.
+            links, index = [], 0
+            while index < len(student_ids):
+                email = f'parent{len(links) + 1}@{domain}'
+                cursor.execute(users_sql, (*name(), email, password_hash, 'parent', school_id))
+                parent_id = cursor.lastrowid
+                children = 2 if rng.random() < spec.sibling_rate and index + 1 < len(student_ids) else 1
+                for student_id in student_ids[index:index + children]:
+                    links.append((parent_id, student_id))
+                index += children
+                manifest['users']['parent'].append(email)
+            _executemany(cursor, "INSERT INTO ParentStudentLinks (parent_user_id, student_id) VALUES (%s, %s)", links)
+
+            post_rows = []
+            for class_id, (teacher_id, _) in zip(class_ids, class_teachers):
+                for _ in range(spec.posts_per_class):
+                    minutes += rng.randint(1, 90)
+                    created_at = (EPOCH + datetime.timedelta(minutes=minutes)).strftime('%Y-%m-%d %H:%M:%S')
+                    post_rows.append((rng.choice(POST_TITLES), POST_BODY, teacher_id, class_id, created_at))
+            manifest['school_posts'][admin_email] = _insert_rows(
+                cursor, "INSERT INTO Posts (title, content, user_id, class_id, created_at) VALUES (%s, %s, %s, %s, %s)", post_rows)
+
+            connection.commit()
+            log(f'School {school_number}/{spec.schools}: {len(teacher_ids)} teachers, {len(class_ids)} classes, '
+                f'{len(student_ids)} students, {len(post_rows)} posts')
+
+    if build_inboxes:
+        feed_inbox.backfill(connection, log=lambda message: None)
+    return manifest
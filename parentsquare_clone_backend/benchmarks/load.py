@@ -0,0 +1,206 @@
+"""Role-weighted load driver.
+
+Worker threads replay a weighted mix of operations (logins, feed reads,
+post creation and deletes) as randomly chosen users from a district
+manifest. Requests go either straight into the Flask app through its test
+client (offline, and able to count SQL statements per request when the
+app runs on the local_db stand-in) or to a running server over HTTP.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+
+import local_db
+
+Sample = namedtuple('Sample', ['endpoint', 'status', 'seconds', 'queries'])
+
+# Operation -> relative weight.
+DEFAULT_MIX = {
+    'login': 10,
+    'parent_feed': 40,
+    'student_feed': 15,
+    'admin_feed': 5,
+    'create_post': 20,
+    'delete_post': 10,
+}
+
+# Share of feed reads that go on to fetch the next page.
+NEXT_PAGE_RATE = 0.25
+PAGE_SIZE = 20
+
+
+class InProcessTransport:
+    """Calls the app directly through Flask's test client."""
+
+    def __init__(self, app, count_queries=False):
+        self.app = app
+        self.count_queries = count_queries
+        self._clients = threading.local()
+
+    def request(self, method, path, body=None, token=None):
+        client = getattr(self._clients, 'client', None)
+        if client is None:
+            client = self._clients.client = self.app.test_client()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        before = local_db.thread_queries()
+        response = client.open(path, method=method, json=body, headers=headers)
+        queries = local_db.thread_queries() - before if self.count_queries else None
+        return response.status_code, response.get_json(silent=True), queries
+
+
+class HttpTransport:
+    """Calls a running server; per-request query counts are not available."""
+
+    def __init__(self, base_url, timeout=30.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                status, payload = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        try:
+            return status, json.loads(payload), None
+        except ValueError:
+            return status, None, None
+
+
+class LoadDriver:
+    """Replays the operation mix from `concurrency` threads."""
+
+    def __init__(self, transport, manifest, mix=None, concurrency=8, seed=0):
+        self.transport = transport
+        self.manifest = manifest
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.concurrency = concurrency
+        self.seed = seed
+        self._tokens = {}
+        self._lock = threading.Lock()
+        # Seeded posts each admin may delete, consumed at most once.
+        deletable = {admin: list(post_ids) for admin, post_ids in manifest['school_posts'].items()}
+        for post_ids in deletable.values():
+            random.Random(seed).shuffle(post_ids)
+        self._deletable = deletable
+
+    def run(self, requests=None, duration=None, warmup=0):
+        """Runs `requests` operations, or as many as fit in `duration` seconds.
+
+        Returns (samples, elapsed seconds). An operation can send more than
+        one request (a login first, a second feed page). The first `warmup`
+        operations run but are not recorded.
+        """
+        if requests is None and duration is None:
+            raise ValueError('Pass requests or duration')
+        remaining = {'warmup': warmup, 'requests': requests}
+        stop = threading.Event()
+        per_thread = [[] for _ in range(self.concurrency)]
+
+        def claim():
+            # Returns (send, record) for the next operation.
+            with self._lock:
+                if remaining['warmup'] > 0:
+                    remaining['warmup'] -= 1
+                    return True, False
+                if remaining['requests'] is None:
+                    return not stop.is_set(), True
+                if remaining['requests'] <= 0:
+                    return False, False
+                remaining['requests'] -= 1
+                return True, True
+
+        def worker(number):
+            rng = random.Random(self.seed * 1000 + number)
+            operations, weights = zip(*self.mix.items())
+            while True:
+                send, record = claim()
+                if not send:
+                    return
+                samples = self._run_operation(rng.choices(operations, weights)[0], rng)
+                if record:
+                    per_thread[number].extend(samples)
+
+        threads = [threading.Thread(target=worker, args=(n,), daemon=True) for n in range(self.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        if duration is not None:
+            stop.wait(duration)
+            stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return [sample for samples in per_thread for sample in samples], elapsed
+
+    # -----------------
+    # Operations
+    # -----------------
+    def _call(self, endpoint, method, path, body=None, token=None):
+        started = time.perf_counter()
+        status, payload, queries = self.transport.request(method, path, body, token)
+        return Sample(endpoint, status, time.perf_counter() - started, queries), payload
+
+    def _login(self, email):
+        sample, payload = self._call('POST /api/login', 'POST', '/api/login',
+                                     {'email': email, 'password': self.manifest['password']})
+        if sample.status == 200:
+            with self._lock:
+                self._tokens[email] = payload['access_token']
+        return sample
+
+    def _token(self, email, samples):
+        """Returns a cached token for `email`, logging in (and recording it) if needed."""
+        with self._lock:
+            token = self._tokens.get(email)
+        if token is None:
+            samples.append(self._login(email))
+            with self._lock:
+                token = self._tokens.get(email)
+        return token
+
+    def _feed(self, endpoint, path, email, rng, samples):
+        token = self._token(email, samples)
+        sample, payload = self._call(endpoint, 'GET', f'{path}?limit={PAGE_SIZE}', token=token)
+        samples.append(sample)
+        cursor = (payload or {}).get('next_cursor')
+        if cursor and rng.random() < NEXT_PAGE_RATE:
+            sample, _ = self._call(endpoint, 'GET', f'{path}?limit={PAGE_SIZE}&cursor={cursor}', token=token)
+            samples.append(sample)
+
+    def _run_operation(self, operation, rng):
+        users = self.manifest['users']
+        samples = []
+        if operation == 'login':
+            role = rng.choice([role for role in users if users[role]])
+            samples.append(self._login(rng.choice(users[role])))
+        elif operation == 'parent_feed' and users['parent']:
+            self._feed('GET /api/parent/posts', '/api/parent/posts', rng.choice(users['parent']), rng, samples)
+        elif operation == 'student_feed' and users['student']:
+            self._feed('GET /api/student/posts', '/api/student/posts', rng.choice(users['student']), rng, samples)
+        elif operation == 'admin_feed':
+            self._feed('GET /api/admin/posts', '/api/admin/posts', rng.choice(users['school_admin']), rng, samples)
+        elif operation == 'create_post':
+            email = rng.choice(users['teacher'])
+            token = self._token(email, samples)
+            body = {'title': 'Load test update', 'content': 'Generated by the load driver.',
+                    'class_id': rng.choice(self.manifest['teacher_classes'][email])}
+            samples.append(self._call('POST /api/teacher/create_post', 'POST', '/api/teacher/create_post', body, token)[0])
+        elif operation == 'delete_post':
+            email = rng.choice(users['school_admin'])
+            with self._lock:
+                post_id = self._deletable[email].pop() if self._deletable[email] else None
+            if post_id is not None:
+                token = self._token(email, samples)
+                samples.append(self._call('DELETE /api/admin/delete_post', 'DELETE',
+                                          f'/api/admin/delete_post/{post_id}', token=token)[0])
+        return samples
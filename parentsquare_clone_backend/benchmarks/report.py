@@ -0,0 +1,89 @@
+"""Latency, throughput and query-count summaries for load-driver samples."""
+import datetime
+import platform
+import subprocess
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _summarize(samples, elapsed):
+    latencies = sorted(sample.seconds * 1000 for sample in samples)
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    errors = sum(1 for sample in samples if sample.status >= 400)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else None,
+        'p50_ms': _round(percentile(latencies, 0.50)),
+        'p95_ms': _round(percentile(latencies, 0.95)),
+        'p99_ms': _round(percentile(latencies, 0.99)),
+        'max_ms': _round(latencies[-1] if latencies else None),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def _round(value):
+    return round(value, 3) if value is not None else None
+
+
+def summarize(samples, elapsed):
+    """Returns {'overall': {...}, 'endpoints': {endpoint: {...}}}."""
+    by_endpoint = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample.endpoint, []).append(sample)
+    return {
+        'overall': _summarize(samples, elapsed),
+        'endpoints': {endpoint: _summarize(endpoint_samples, elapsed)
+                      for endpoint, endpoint_samples in sorted(by_endpoint.items())},
+    }
+
+
+def environment():
+    """Identifies the commit and machine a result was produced on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+
+
+def format_table(summary):
+    columns = ('requests', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+    headers = ('reqs', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries')
+    rows = [(endpoint, stats) for endpoint, stats in summary['endpoints'].items()]
+    rows.append(('overall', summary['overall']))
+
+    def cell(value):
+        return '-' if value is None else f'{value:g}' if isinstance(value, float) else str(value)
+
+    width = max(len(endpoint) for endpoint, _ in rows)
+    lines = [f'{"endpoint":<{width}} ' + ' '.join(f'{header:>9}' for header in headers)]
+    for endpoint, stats in rows:
+        lines.append(f'{endpoint:<{width}} ' + ' '.join(f'{cell(stats[column]):>9}' for column in columns))
+    return '\n'.join(lines)
+
+
+def compare(base, head, threshold=0.10, metric='p95_ms'):
+    """Lists endpoints whose `metric` or queries per request grew by more than `threshold`."""
+    regressions = []
+    for endpoint, head_stats in head['endpoints'].items():
+        base_stats = base['endpoints'].get(endpoint)
+        if base_stats is None:
+            continue
+        for name in (metric, 'queries_per_request'):
+            before, after = base_stats.get(name), head_stats.get(name)
+            if before and after and (after - before) / before > threshold:
+                regressions.append({'endpoint': endpoint, 'metric': name, 'base': before, 'head': after})
+    return regressions
@@ -0,0 +1,198 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+class _PooledConnection:
+    """Bookkeeping wrapper around a raw DB-API connection."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of database connections.
+
+    `connect` is any zero-argument callable returning a DB-API connection,
+    so the pool works the same against MySQL or a local stand-in database.
+    """
+
+    def __init__(self, connect, max_size=10, checkout_timeout=5.0,
+                 max_lifetime=1800.0, health_check_interval=30.0):
+        self._connect = connect
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+        self._stats = {
+            'checkouts': 0,
+            'created': 0,
+            'recycled': 0,
+            'health_check_failures': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0,
+            'peak_in_use': 0,
+        }
+
+    # -----------------
+    # Checkout / Return
+    # -----------------
+    def acquire(self, timeout=None):
+        """Checks out a healthy connection, waiting up to `timeout` seconds."""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited_since = None
+
+        while True:
+            pooled = None
+            with self._available:
+                while True:
+                    pooled = self._pop_idle()
+                    if pooled is not None:
+                        if not self._check_due(pooled):
+                            return self._check_out(pooled, waited_since)
+                        break
+
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f'No database connection available within {timeout:.1f}s '
+                            f'({self._size}/{self.max_size} in use)')
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._stats['waits'] += 1
+                    self._available.wait(remaining)
+
+            if pooled is None:
+                break
+            # Ping outside the lock, so a slow or half-dead connection doesn't
+            # hold up every other checkout and release. It stays counted in
+            # _size meanwhile.
+            if self._ping(pooled):
+                with self._available:
+                    return self._check_out(pooled, waited_since)
+            with self._available:
+                self._stats['health_check_failures'] += 1
+                self._discard(pooled)
+                self._available.notify()
+
+        # Connect outside the lock so a slow handshake doesn't block returns.
+        try:
+            pooled = _PooledConnection(self._connect())
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+        with self._available:
+            self._stats['created'] += 1
+            return self._check_out(pooled, waited_since)
+
+    def release(self, connection, discard=False):
+        """Returns a checked-out connection to the pool."""
+        if not discard:
+            try:
+                # Never hand the next request an open transaction. The caller
+                # still owns the connection, so this needs no lock.
+                connection.rollback()
+            except Exception:
+                discard = True
+
+        with self._available:
+            pooled = self._in_use.pop(id(connection), None)
+            if pooled is None:
+                return
+
+            pooled.last_used = time.monotonic()
+            if not discard and self._expired(pooled):
+                self._stats['recycled'] += 1
+                discard = True
+            if discard:
+                self._discard(pooled)
+            else:
+                self._idle.append(pooled)
+            self._available.notify()
+
+    def close(self):
+        """Closes every idle connection; checked-out ones close on release."""
+        with self._available:
+            while self._idle:
+                self._discard(self._idle.pop())
+
+    # -----------------
+    # Metrics
+    # -----------------
+    def stats(self):
+        """Returns a snapshot of pool occupancy and exhaustion counters."""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+            })
+        return snapshot
+
+    # -----------------
+    # Internal Helpers (call with the lock held)
+    # -----------------
+    def _check_out(self, pooled, waited_since):
+        self._in_use[id(pooled.raw)] = pooled
+        self._stats['checkouts'] += 1
+        self._stats['peak_in_use'] = max(self._stats['peak_in_use'], len(self._in_use))
+        if waited_since is not None:
+            self._stats['wait_seconds'] += time.monotonic() - waited_since
+        return pooled.raw
+
+    def _expired(self, pooled):
+        return self.max_lifetime is not None and time.monotonic() - pooled.created_at > self.max_lifetime
+
+    def _pop_idle(self):
+        """Returns the most recently used idle connection that hasn't expired, or None."""
+        while self._idle:
+            pooled = self._idle.pop()
+            if not self._expired(pooled):
+                return pooled
+            self._stats['recycled'] += 1
+            self._discard(pooled)
+        return None
+
+    def _check_due(self, pooled):
+        return time.monotonic() - pooled.last_used >= self.health_check_interval
+
+    @staticmethod
+    def _ping(pooled):
+        """Health-checks a connection; call without the lock held."""
+        try:
+            pooled.raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, pooled):
+        self._size -= 1
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
@@ -0,0 +1,123 @@
+import itertools
+import threading
+import time
+
+from itsdangerous import BadData, URLSafeTimedSerializer
+
+from db_pool import PoolTimeout
+
+
+class _Replica:
+    """A replica's pool and health."""
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.down_until = 0.0
+        self.failures = 0
+
+
+class DatabaseRouter:
+    """Sends reads to healthy read replicas and everything else to the primary.
+
+    Replicas are picked by fewest connections in use, round-robin among
+    ties. A replica whose checkout fails is skipped for `retry_interval`
+    seconds; with no healthy replica left, reads fail over to the primary.
+    """
+
+    def __init__(self, primary, replicas=(), retry_interval=30.0):
+        self.primary = primary
+        self.replicas = [_Replica(name, pool) for name, pool in replicas]
+        self.retry_interval = retry_interval
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {'primary_reads': 0, 'replica_reads': 0, 'failovers': 0}
+
+    def acquire(self, read_only=False):
+        """Checks out a connection; returns (pool, connection, replica name or None)."""
+        if read_only:
+            for replica in self._candidates():
+                try:
+                    connection = replica.pool.acquire()
+                except PoolTimeout:
+                    # Busy rather than broken: try the next one.
+                    continue
+                except Exception:
+                    self._mark_down(replica)
+                    continue
+                with self._lock:
+                    replica.failures = 0
+                    self._stats['replica_reads'] += 1
+                return replica.pool, connection, replica.name
+            with self._lock:
+                self._stats['primary_reads'] += 1
+                if self.replicas:
+                    self._stats['failovers'] += 1
+        return self.primary, self.primary.acquire(), None
+
+    def _candidates(self):
+        """Healthy replicas, least busy first."""
+        now = time.monotonic()
+        healthy = [replica for replica in self.replicas if replica.down_until <= now]
+        if not healthy:
+            return []
+        # Rotate before sorting so equally busy replicas take turns.
+        start = next(self._turn) % len(healthy)
+        healthy = healthy[start:] + healthy[:start]
+        return sorted(healthy, key=lambda replica: replica.pool.stats()['in_use'])
+
+    def _mark_down(self, replica):
+        with self._lock:
+            replica.failures += 1
+            replica.down_until = time.monotonic() + self.retry_interval
+
+    def close(self):
+        self.primary.close()
+        for replica in self.replicas:
+            replica.pool.close()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot['replicas'] = len(self.replicas)
+        snapshot['healthy_replicas'] = sum(1 for replica in self.replicas if replica.down_until <= now)
+        return snapshot
+
+
+class PrimaryPins:
+    """Signed tokens that send a user's reads to the primary for a while after they write.
+
+    The token travels with the client, which sends it back on its next
+    requests, so the pin holds on whichever worker serves them. It names
+    the user it was issued to and expires after `window` seconds, long
+    enough for the replicas to catch up, so a user always reads their own
+    writes.
+    """
+
+    def __init__(self, secret, window=5.0):
+        self.window = window
+        self._serializer = URLSafeTimedSerializer(secret, salt='read-primary')
+        self._lock = threading.Lock()
+        self._stats = {'issued': 0, 'honored': 0, 'rejected': 0}
+
+    def issue(self, user_id):
+        with self._lock:
+            self._stats['issued'] += 1
+        return self._serializer.dumps(user_id)
+
+    def is_pinned(self, token, user_id):
+        """Whether `token` is a live pin for `user_id`."""
+        if not token:
+            return False
+        try:
+            pinned = self._serializer.loads(token, max_age=self.window) == user_id
+        except BadData:
+            pinned = False
+        with self._lock:
+            self._stats['honored' if pinned else 'rejected'] += 1
+        return pinned
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,115 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Version scopes a cached feed can depend on.
+ALL_POSTS_SCOPE = 'all'
+
+
+def class_scope(class_id):
+    return f'class:{class_id}'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+# Post events that change the feeds of the event's class.
+POST_EVENTS = ('post_created', 'post_deleted', 'posts_archived')
+
+# post_ids: the posts on the page, for read receipts on cache hits.
+CachedFeed = namedtuple('CachedFeed', ['etag', 'body', 'versions', 'stored_at', 'post_ids'])
+
+
+class FeedCache:
+    """A bounded LRU cache of serialized feed pages validated by version counters.
+
+    Every entry remembers the version of each scope it was built from
+    (its classes, the caller's own memberships, or all posts). Writes bump
+    the affected scopes, which makes exactly the dependent entries stale
+    without touching MySQL. Counters are per process: apply_event, as a
+    post_events listener, bumps them for other workers' post writes, and
+    `ttl` bounds how long any other write can go unseen.
+    """
+
+    def __init__(self, max_entries=5000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bumped_at = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'evictions': 0}
+
+    # -----------------
+    # Version Counters
+    # -----------------
+    def bump(self, *scopes):
+        """Invalidates every cached feed that depends on any of `scopes`."""
+        with self._lock:
+            now = time.monotonic()
+            for scope in scopes:
+                self._versions[scope] = self._versions.get(scope, 0) + 1
+                self._bumped_at[scope] = now
+
+    def apply_event(self, event):
+        """post_events listener: invalidates the feeds a post event from any worker changes."""
+        if event.type in POST_EVENTS:
+            self.bump(ALL_POSTS_SCOPE, class_scope(event.class_id))
+
+    def snapshot(self, scopes):
+        """Returns the current versions of `scopes`; take it before querying."""
+        with self._lock:
+            return tuple((scope, self._versions.get(scope, 0)) for scope in scopes)
+
+    def settled(self, versions, window):
+        """True if none of the scopes in a snapshot was bumped in the last `window` seconds.
+
+        A page read from a lagging replica right after a bump may predate
+        the write, so it shouldn't be cached under the new versions.
+        """
+        cutoff = time.monotonic() - window
+        with self._lock:
+            return all(self._bumped_at.get(scope, cutoff) <= cutoff for scope, _ in versions)
+
+    # -----------------
+    # Entries
+    # -----------------
+    def get(self, key):
+        """Returns a still-valid CachedFeed for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            fresh = time.monotonic() - entry.stored_at <= self.ttl
+            if not fresh or any(self._versions.get(scope, 0) != version for scope, version in entry.versions):
+                del self._entries[key]
+                self._stats['stale'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def put(self, key, versions, body, post_ids=()):
+        """Stores a serialized feed built from `versions` and returns its entry."""
+        entry = CachedFeed(hashlib.sha256(body).hexdigest()[:32], body, versions, time.monotonic(), tuple(post_ids))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+        return snapshot
@@ -0,0 +1,152 @@
+"""Materialized per-recipient feed ("fan-out on write").
+
+Every post is copied into FeedInbox once per recipient when it is created,
+so reading a parent's or student's feed is a single range scan on
+(user_id, created_at, post_id). A user's inbox is only served once its
+FeedInboxStatus row says 'ready'; until then the feeds fall back to the
+join over Posts/Classes/StudentEnrollments. The tables are created by
+migrations/0002_feed_inbox.up.sql.
+"""
+
+# Every (recipient user, post) pair the feeds' join rules produce: students
+# with a login see their classes' posts, parents see their children's.
+RECIPIENT_POSTS_SQL = """
+    SELECT s.user_id AS user_id, p.id AS post_id, p.created_at AS created_at
+    FROM Posts p
+    JOIN StudentEnrollments se ON se.class_id = p.class_id
+    JOIN Students s ON s.id = se.student_id
+    WHERE s.user_id IS NOT NULL{student_filter}
+    UNION
+    SELECT psl.parent_user_id AS user_id, p.id AS post_id, p.created_at AS created_at
+    FROM Posts p
+    JOIN StudentEnrollments se ON se.class_id = p.class_id
+    JOIN ParentStudentLinks psl ON psl.student_id = se.student_id
+    WHERE TRUE{parent_filter}
+"""
+
+
+def _recipient_posts(post_id=None, user_id=None):
+    """Returns RECIPIENT_POSTS_SQL narrowed to one post and/or one user, with params."""
+    student_filter, parent_filter = '', ''
+    student_params, parent_params = [], []
+    if post_id is not None:
+        student_filter += " AND p.id = %s"
+        parent_filter += " AND p.id = %s"
+        student_params.append(post_id)
+        parent_params.append(post_id)
+    if user_id is not None:
+        student_filter += " AND s.user_id = %s"
+        parent_filter += " AND psl.parent_user_id = %s"
+        student_params.append(user_id)
+        parent_params.append(user_id)
+    sql = RECIPIENT_POSTS_SQL.format(student_filter=student_filter, parent_filter=parent_filter)
+    return sql, tuple(student_params + parent_params)
+
+
+def fan_out_statement(post_id=None, user_id=None):
+    """Returns the INSERT ... SELECT copying matching recipient posts into FeedInbox."""
+    sql, params = _recipient_posts(post_id=post_id, user_id=user_id)
+    insert = f"INSERT IGNORE INTO FeedInbox (user_id, post_id, created_at) SELECT user_id, post_id, created_at FROM ({sql}) r"
+    return insert, params
+
+
+# -----------------
+# Write Path
+# -----------------
+def fan_out_post(cursor, post_id):
+    """Copies a new post into every recipient's inbox (same transaction as the INSERT)."""
+    cursor.execute(*fan_out_statement(post_id=post_id))
+    return cursor.rowcount
+
+
+def remove_post(cursor, post_id):
+    """Removes a deleted post from every inbox."""
+    cursor.execute("DELETE FROM FeedInbox WHERE post_id = %s", (post_id,))
+    return cursor.rowcount
+
+
+def set_status(cursor, user_id, status):
+    cursor.execute("DELETE FROM FeedInboxStatus WHERE user_id = %s", (user_id,))
+    cursor.execute("INSERT INTO FeedInboxStatus (user_id, status) VALUES (%s, %s)", (user_id, status))
+
+
+def rebuild_inbox(cursor, user_id):
+    """Recomputes one user's inbox from the join and marks it ready.
+
+    Call after a user's enrollments or parent links change. The caller
+    commits, so the rebuild is atomic with the change that triggered it.
+    """
+    cursor.execute("DELETE FROM FeedInbox WHERE user_id = %s", (user_id,))
+    cursor.execute(*fan_out_statement(user_id=user_id))
+    set_status(cursor, user_id, 'ready')
+
+
+# -----------------
+# Read Path
+# -----------------
+def inbox_ready(cursor, user_id):
+    """True if the user's inbox is fully built and can replace the join."""
+    cursor.execute("SELECT status FROM FeedInboxStatus WHERE user_id = %s", (user_id,))
+    row = cursor.fetchone()
+    return bool(row) and row['status'] == 'ready'
+
+
+# -----------------
+# Maintenance
+# -----------------
+def backfill(connection, batch_size=500, log=print):
+    """Builds the inbox of every recipient user, committing once per user.
+
+    Each user is marked 'rebuilding' first, so their feed keeps using the
+    join until their own inbox is complete.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT s.user_id AS user_id FROM Students s WHERE s.user_id IS NOT NULL
+            UNION
+            SELECT psl.parent_user_id AS user_id FROM ParentStudentLinks psl
+        """)
+        user_ids = sorted(row['user_id'] for row in cursor.fetchall())
+
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        with connection.cursor() as cursor:
+            for user_id in batch:
+                set_status(cursor, user_id, 'rebuilding')
+        connection.commit()
+
+        for user_id in batch:
+            with connection.cursor() as cursor:
+                rebuild_inbox(cursor, user_id)
+            connection.commit()
+        log(f'Rebuilt {min(start + batch_size, len(user_ids))}/{len(user_ids)} inboxes')
+    return len(user_ids)
+
+
+def check_consistency(connection, user_id=None):
+    """Compares ready inboxes with the join; returns {'missing': [...], 'extra': [...]}.
+
+    Each entry is a (user_id, post_id) pair. Users whose inbox is not ready
+    are skipped since their feeds are still served from the join.
+    """
+    expected_sql, params = _recipient_posts(user_id=user_id)
+    user_filter = " AND f.user_id = %s" if user_id is not None else ""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT e.user_id, e.post_id
+            FROM ({expected_sql}) e
+            JOIN FeedInboxStatus st ON st.user_id = e.user_id AND st.status = 'ready'
+            LEFT JOIN FeedInbox f ON f.user_id = e.user_id AND f.post_id = e.post_id
+            WHERE f.post_id IS NULL
+        """, params)
+        missing = [(row['user_id'], row['post_id']) for row in cursor.fetchall()]
+
+        cursor.execute(f"""
+            SELECT f.user_id, f.post_id
+            FROM FeedInbox f
+            JOIN FeedInboxStatus st ON st.user_id = f.user_id AND st.status = 'ready'
+            LEFT JOIN ({expected_sql}) e ON e.user_id = f.user_id AND e.post_id = f.post_id
+            WHERE e.post_id IS NULL{user_filter}
+        """, params + ((user_id,) if user_id is not None else ()))
+        extra = [(row['user_id'], row['post_id']) for row in cursor.fetchall()]
+    return {'missing': missing, 'extra': extra}
@@ -0,0 +1,197 @@
+"""A pymysql-compatible stand-in database backed by SQLite.
+
+For benchmarks and local development without a MySQL server. Connections
+accept the app's SQL unchanged: %s placeholders, INSERT IGNORE, ON DUPLICATE
+KEY UPDATE, ALTER TABLE ... AUTO_INCREMENT, ALTER TABLE ... ADD KEY and
+SHOW INDEX are translated, LOCK IN SHARE MODE is dropped (SQLite locks
+the whole database for a write), and the MySQL DDL in migrations/ is
+rewritten on the fly, so the stand-in schema always comes from the same
+migration scripts. Rows come back as dicts, like pymysql's DictCursor.
+
+Only the subset of MySQL the app uses is supported.
+"""
+import contextlib
+import re
+import sqlite3
+import threading
+
+_KEY_LINE = re.compile(r'^\s*(UNIQUE\s+)?KEY\s+(\w+)\s*\(([^)]*)\),?\s*$', re.IGNORECASE)
+_TABLE_OPTIONS = re.compile(r'\)\s*ENGINE=.*$', re.IGNORECASE | re.DOTALL)
+_AUTO_INCREMENT = re.compile(r'INT\s+NOT\s+NULL\s+AUTO_INCREMENT\s+PRIMARY\s+KEY', re.IGNORECASE)
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+_SET_AUTO_INCREMENT = re.compile(r'^\s*ALTER\s+TABLE\s+(\w+)\s+AUTO_INCREMENT\s*=\s*(\d+)\s*$', re.IGNORECASE)
+_ADD_KEY = re.compile(r'^\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+(UNIQUE\s+)?(?:KEY|INDEX)\s+(\w+)\s*\(([^)]*)\)\s*$',
+                      re.IGNORECASE)
+_SHOW_INDEX = re.compile(r'^\s*SHOW\s+INDEX\s+FROM\s+(\w+)\s+WHERE\s+Key_name\s*=\s*%s\s*$', re.IGNORECASE)
+_SHARE_MODE = re.compile(r'\s+LOCK\s+IN\s+SHARE\s+MODE\s*$', re.IGNORECASE)
+_ON_DUPLICATE_KEY = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_VALUES_FUNCTION = re.compile(r'\bVALUES\((\w+)\)', re.IGNORECASE)
+
+_counter = threading.local()
+
+
+def thread_queries():
+    """Returns how many statements the current thread has executed so far."""
+    return getattr(_counter, 'queries', 0)
+
+
+@contextlib.contextmanager
+def capture_queries():
+    """Collects the SQL of every statement the current thread executes in the block."""
+    statements = []
+    outer = getattr(_counter, 'captured', None)
+    _counter.captured = statements
+    try:
+        yield statements
+    finally:
+        _counter.captured = outer
+
+
+def _count_query(sql):
+    _counter.queries = thread_queries() + 1
+    captured = getattr(_counter, 'captured', None)
+    if captured is not None:
+        captured.append(sql)
+
+
+def translate_ddl(sql):
+    """Rewrites a MySQL CREATE TABLE as SQLite statements (table first, then indexes)."""
+    table = _CREATE_TABLE.match(sql).group(2)
+    sql = _TABLE_OPTIONS.sub(')', sql)
+    sql = _AUTO_INCREMENT.sub('INTEGER PRIMARY KEY AUTOINCREMENT', sql)
+
+    lines, indexes = [], []
+    for line in sql.splitlines():
+        match = _KEY_LINE.match(line)
+        if match:
+            # Named indexes, unique ones included, so SHOW INDEX can find them.
+            unique = 'UNIQUE ' if match.group(1) else ''
+            indexes.append(f'CREATE {unique}INDEX IF NOT EXISTS {match.group(2)} ON {table} ({match.group(3)})')
+        else:
+            lines.append(line)
+    # Dropping a trailing KEY line can leave a dangling comma before ')'.
+    table_sql = re.sub(r',\s*\)\s*$', '\n)', '\n'.join(lines))
+    return [table_sql] + indexes
+
+
+def translate(sql):
+    """Rewrites one MySQL statement as a list of SQLite statements."""
+    if _CREATE_TABLE.match(sql):
+        return translate_ddl(sql)
+    match = _SET_AUTO_INCREMENT.match(sql)
+    if match:
+        # SQLite keeps the last id handed out, not the next one.
+        table, next_id = match.group(1), int(match.group(2))
+        return [f"DELETE FROM sqlite_sequence WHERE name = '{table}'",
+                f"INSERT INTO sqlite_sequence (name, seq) VALUES ('{table}', {next_id - 1})"]
+    match = _ADD_KEY.match(sql)
+    if match:
+        table, unique, name, columns = match.groups()
+        return [f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"]
+    match = _SHOW_INDEX.match(sql)
+    if match:
+        return [f"SELECT tbl_name AS `Table`, name AS Key_name FROM sqlite_master "
+                f"WHERE type = 'index' AND tbl_name = '{match.group(1)}' AND name = ?"]
+    sql = _SHARE_MODE.sub('', sql)
+    sql = re.sub(r'\bINSERT\s+IGNORE\b', 'INSERT OR IGNORE', sql, flags=re.IGNORECASE)
+    if _ON_DUPLICATE_KEY.search(sql):
+        # An upsert on any unique key; VALUES(col) is the row that collided.
+        sql = _ON_DUPLICATE_KEY.sub('ON CONFLICT DO UPDATE SET', sql)
+        sql = _VALUES_FUNCTION.sub(r'excluded.\1', sql)
+    return [sql.replace('%s', '?')]
+
+
+class Cursor:
+    """DictCursor-like wrapper around a sqlite3 cursor."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def execute(self, sql, params=None):
+        _count_query(sql)
+        match = _CREATE_TABLE.match(sql)
+        if match and match.group(1) and self._table_exists(match.group(2)):
+            # Like MySQL, leaves an existing table's indexes alone too.
+            return 0
+        statements = translate(sql)
+        for statement in statements[:-1]:
+            self._cursor.execute(statement)
+        self._cursor.execute(statements[-1], tuple(params or ()))
+        return self._cursor.rowcount
+
+    def _table_exists(self, table):
+        self._cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        return self._cursor.fetchone() is not None
+
+    def executemany(self, sql, seq_of_params):
+        _count_query(sql)
+        self._cursor.executemany(translate(sql)[-1], [tuple(params) for params in seq_of_params])
+        return self._cursor.rowcount
+
+    def _row(self, row):
+        return dict(zip([column[0] for column in self._cursor.description], row))
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return self._row(row) if row is not None else None
+
+    def fetchmany(self, size=None):
+        return [self._row(row) for row in self._cursor.fetchmany(size or self._cursor.arraysize)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield self._row(row)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class Connection:
+    """The parts of a pymysql connection the app uses."""
+
+    def __init__(self, path, timeout=30.0):
+        self.raw = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        self.raw.execute('PRAGMA journal_mode=WAL')
+        self.raw.execute('PRAGMA synchronous=NORMAL')
+
+    def cursor(self, cursorclass=None):
+        # Every cursor returns dicts; the class is ignored.
+        return Cursor(self)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def ping(self, reconnect=False):
+        self.raw.execute('SELECT 1')
+
+    def close(self):
+        self.raw.close()
+
+
+def connect(path):
+    """Opens a stand-in connection to the SQLite database file at `path`."""
+    return Connection(path)
@@ -0,0 +1,321 @@
+"""Request and query instrumentation, rendered in Prometheus text format.
+
+Histograms are plain bucket counters behind a per-series lock, so an
+observation costs a bisect and a few additions. Each request gets a
+RequestTrace (held in a context variable) that collects its queries and
+the time spent in named stages (db_checkout, db_connect, jwt, bcrypt);
+the trace feeds the per-request histograms and the slow-request log.
+
+Database connections are instrumented by wrapping the pool's connect
+function with instrument_connect(), so every cursor the app opens is
+timed without touching the call sites.
+"""
+import contextvars
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# Switched off by the app when METRICS_ENABLED is false; the hooks then
+# return immediately.
+enabled = True
+
+
+# -----------------
+# Metric Types
+# -----------------
+class Histogram:
+    """One labelled histogram series."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Returns (cumulative bucket counts, sum, count)."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for value in counts:
+            running += value
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class HistogramFamily:
+    """A named histogram with one series per combination of label values."""
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, Histogram(self.buckets))
+        return series
+
+    def observe(self, value, *label_values):
+        self.labels(*label_values).observe(value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series_items = sorted(self._series.items())
+        for values, series in series_items:
+            cumulative, total, count = series.snapshot()
+            labels = _format_labels(zip(self.label_names, values))
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), cumulative):
+                le = _format_labels(list(zip(self.label_names, values)) + [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{le} {bucket_count}')
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+def _format_value(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    pairs = list(pairs)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class Registry:
+    """Holds histogram families and stats collectors for /metrics."""
+
+    def __init__(self):
+        self._families = []
+        self._collectors = []
+
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        family = HistogramFamily(name, documentation, label_names, buckets)
+        self._families.append(family)
+        return family
+
+    def register_stats(self, prefix, documentation, stats, gauges=()):
+        """Exposes a component's stats() dict: keys in `gauges` as gauges, the rest as counters."""
+        self._collectors.append((prefix, documentation, stats, set(gauges)))
+
+    def render(self):
+        lines = []
+        for family in self._families:
+            lines.extend(family.render())
+        for prefix, documentation, stats, gauges in self._collectors:
+            for key, value in sorted(stats().items()):
+                kind = 'gauge' if key in gauges else 'counter'
+                name = f'{prefix}_{key}' + ('' if kind == 'gauge' else '_total')
+                lines.append(f'# HELP {name} {documentation}: {key.replace("_", " ")}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time to produce a response',
+    ('method', 'endpoint', 'status'))
+RESPONSE_SIZE = REGISTRY.histogram(
+    'http_response_size_bytes', 'Response body size (streamed responses are not counted)',
+    ('endpoint',), SIZE_BUCKETS)
+QUERIES_PER_REQUEST = REGISTRY.histogram(
+    'db_queries_per_request', 'SQL statements executed per request', ('endpoint',), COUNT_BUCKETS)
+QUERY_TIME_PER_REQUEST = REGISTRY.histogram(
+    'db_query_time_per_request_seconds', 'Time spent in SQL per request', ('endpoint',))
+QUERY_DURATION = REGISTRY.histogram(
+    'db_query_duration_seconds', 'Execution time per SQL statement', ('statement',))
+STAGE_DURATION = REGISTRY.histogram(
+    'request_stage_duration_seconds', 'Time spent in db_checkout, db_connect, jwt and bcrypt', ('stage',))
+
+
+# -----------------
+# Request Traces
+# -----------------
+class RequestTrace:
+    """What one request spent its time on."""
+
+    __slots__ = ('started', 'queries', 'stages')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (statement tag, sql, seconds) in execution order.
+        self.queries = []
+        self.stages = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def breakdown(self):
+        """Returns the trace as a JSON-serializable dict, for the slow-request log."""
+        return {
+            'stages_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self.stages.items()},
+            'query_ms': round(sum(seconds for _, _, seconds in self.queries) * 1000, 3),
+            'queries': [{'statement': tag, 'ms': round(seconds * 1000, 3), 'sql': ' '.join(sql.split())[:300]}
+                        for tag, sql, seconds in self.queries],
+        }
+
+
+_current_trace = contextvars.ContextVar('request_trace', default=None)
+
+
+def start_trace():
+    if not enabled:
+        return None
+    trace = RequestTrace()
+    _current_trace.set(trace)
+    return trace
+
+
+def end_trace():
+    """Detaches and returns the current request's trace (None if none was started)."""
+    trace = _current_trace.get()
+    _current_trace.set(None)
+    return trace
+
+
+def observe_stage(stage, seconds):
+    if not enabled:
+        return
+    STAGE_DURATION.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.stages[stage] = trace.stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Times the body of a with-block as `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def observe_request(trace, method, endpoint, status, response_size):
+    """Records a finished request's latency, size and query totals."""
+    REQUEST_DURATION.observe(trace.elapsed(), method, endpoint, str(status))
+    if response_size is not None:
+        RESPONSE_SIZE.observe(response_size, endpoint)
+    QUERIES_PER_REQUEST.observe(len(trace.queries), endpoint)
+    QUERY_TIME_PER_REQUEST.observe(sum(seconds for _, _, seconds in trace.queries), endpoint)
+
+
+# -----------------
+# Database Instrumentation
+# -----------------
+_STATEMENT_TABLE = re.compile(r'\b(?:FROM|INTO|UPDATE)\s+(\w+)', re.IGNORECASE)
+_statement_tags = {}
+MAX_STATEMENT_TAGS = 2048
+
+
+def statement_tag(sql):
+    """Labels a statement by verb and first table, e.g. 'SELECT Users'."""
+    tag = _statement_tags.get(sql)
+    if tag is None:
+        verb = sql.split(None, 1)[0].upper() if sql.strip() else '?'
+        match = _STATEMENT_TABLE.search(sql)
+        tag = f'{verb} {match.group(1)}' if match else verb
+        # IN (...) lists make statements of many lengths; keep the memo bounded.
+        if len(_statement_tags) >= MAX_STATEMENT_TAGS:
+            _statement_tags.clear()
+        _statement_tags[sql] = tag
+    return tag
+
+
+def observe_query(sql, seconds):
+    if not enabled:
+        return
+    tag = statement_tag(sql)
+    QUERY_DURATION.observe(seconds, tag)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.queries.append((tag, sql, seconds))
+
+
+class InstrumentedCursor:
+    """Times execute() and executemany() on a DB-API cursor."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __enter__(self):
+        self._cursor.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cursor.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            observe_query(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq_of_params)
+        finally:
+            observe_query(sql, time.perf_counter() - started)
+
+
+class InstrumentedConnection:
+    """Hands out instrumented cursors; everything else goes to the raw connection."""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs))
+
+
+def instrument_connect(connect):
+    """Wraps a connect function so it is timed and returns instrumented connections."""
+    def instrumented():
+        with timed('db_connect'):
+            raw = connect()
+        return InstrumentedConnection(raw)
+    return instrumented
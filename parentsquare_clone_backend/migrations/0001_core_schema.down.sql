@@ -0,0 +1,8 @@
+DROP TABLE IF EXISTS Posts;
+DROP TABLE IF EXISTS AccessCodes;
+DROP TABLE IF EXISTS ParentStudentLinks;
+DROP TABLE IF EXISTS StudentEnrollments;
+DROP TABLE IF EXISTS Classes;
+DROP TABLE IF EXISTS Students;
+DROP TABLE IF EXISTS Users;
+DROP TABLE IF EXISTS Schools;
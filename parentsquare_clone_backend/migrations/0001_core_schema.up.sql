@@ -0,0 +1,87 @@
+-- Core tables. Tables that already exist keep theirs; 0010_core_indexes adds
+-- any index they lack. Indexes are matched to the lookups in app.py:
+--   Users.email                         login, duplicate-email checks
+--   AccessCodes.code                    register_parent
+--   Students.user_id                    student dashboard and feed
+--   StudentEnrollments(class_id, ...)   feed joins and fan-out from a class
+--   ParentStudentLinks(parent_user_id)  parent feed
+--   Posts(class_id, created_at, id)     per-class feed ordering
+--   Posts(created_at, id)               admin feed keyset pagination
+
+CREATE TABLE IF NOT EXISTS Schools (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    admin_user_id INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS Users (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100) NOT NULL,
+    email VARCHAR(255) NOT NULL,
+    password_hash VARCHAR(255) NOT NULL,
+    role VARCHAR(32) NOT NULL,
+    school_id INT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_users_email (email),
+    KEY idx_users_school_role (school_id, role)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS Students (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    first_name VARCHAR(100) NOT NULL,
+    last_name VARCHAR(100) NOT NULL,
+    school_id INT NOT NULL,
+    user_id INT NULL,
+    KEY idx_students_user (user_id),
+    KEY idx_students_school (school_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS Classes (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    class_name VARCHAR(255) NOT NULL,
+    teacher_id INT NOT NULL,
+    school_id INT NOT NULL,
+    KEY idx_classes_school_name (school_id, class_name),
+    KEY idx_classes_teacher (teacher_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS StudentEnrollments (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    student_id INT NOT NULL,
+    class_id INT NOT NULL,
+    UNIQUE KEY uq_enrollments_student_class (student_id, class_id),
+    KEY idx_enrollments_class_student (class_id, student_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS ParentStudentLinks (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    parent_user_id INT NOT NULL,
+    student_id INT NOT NULL,
+    UNIQUE KEY uq_links_parent_student (parent_user_id, student_id),
+    KEY idx_links_student_parent (student_id, parent_user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS AccessCodes (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    code VARCHAR(32) NOT NULL,
+    student_id INT NOT NULL,
+    parent_email VARCHAR(255) NOT NULL,
+    is_used BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_access_codes_code (code),
+    KEY idx_access_codes_student (student_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS Posts (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    user_id INT NOT NULL,
+    class_id INT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_posts_class_created (class_id, created_at, id),
+    KEY idx_posts_created (created_at, id),
+    KEY idx_posts_user (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,2 @@
+DROP TABLE IF EXISTS FeedInboxStatus;
+DROP TABLE IF EXISTS FeedInbox;
@@ -0,0 +1,16 @@
+-- Materialized per-recipient feed (see feed_inbox.py). The primary key is
+-- the feed's read order, so a page is one range scan per user.
+
+CREATE TABLE IF NOT EXISTS FeedInbox (
+    user_id INT NOT NULL,
+    post_id INT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (user_id, created_at, post_id),
+    KEY idx_feed_inbox_post (post_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS FeedInboxStatus (
+    user_id INT NOT NULL PRIMARY KEY,
+    status VARCHAR(16) NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,10 @@
+-- Post events shared between worker processes by post_events.DatabaseBackend.
+-- Workers read new rows by primary key range; old rows are pruned by id.
+
+CREATE TABLE IF NOT EXISTS PostEvents (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    event_type VARCHAR(32) NOT NULL,
+    class_id INT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
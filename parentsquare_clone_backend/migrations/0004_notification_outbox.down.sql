@@ -0,0 +1,2 @@
+DROP TABLE IF EXISTS NotificationDeliveries;
+DROP TABLE IF EXISTS NotificationOutbox;
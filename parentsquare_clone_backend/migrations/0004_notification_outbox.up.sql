@@ -0,0 +1,33 @@
+-- Post notification outbox and per-recipient deliveries (see notifications.py).
+-- Outbox rows are written in the same transaction as their post; the worker
+-- expands each into one delivery per parent and leases rows by pushing
+-- next_attempt_at forward.
+
+CREATE TABLE IF NOT EXISTS NotificationOutbox (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    post_id INT NOT NULL,
+    class_id INT NOT NULL,
+    school_id INT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    next_attempt_at DATETIME NOT NULL,
+    claim_token CHAR(32) NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_outbox_due (status, next_attempt_at),
+    KEY idx_outbox_claim (claim_token)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS NotificationDeliveries (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    outbox_id INT NOT NULL,
+    user_id INT NOT NULL,
+    school_id INT NOT NULL,
+    status VARCHAR(16) NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NOT NULL,
+    claim_token CHAR(32) NULL,
+    last_error VARCHAR(500) NULL,
+    sent_at DATETIME NULL,
+    UNIQUE KEY uq_deliveries_outbox_user (outbox_id, user_id),
+    KEY idx_deliveries_due (status, next_attempt_at),
+    KEY idx_deliveries_claim (claim_token)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,10 @@
+-- Token buckets for admission control when ADMISSION_BACKEND=database
+-- (see admission.py), shared by every worker process. Times are Unix
+-- seconds; idle buckets are pruned by updated_at.
+
+CREATE TABLE IF NOT EXISTS RateLimitBuckets (
+    bucket_key VARCHAR(255) NOT NULL PRIMARY KEY,
+    tokens DOUBLE NOT NULL,
+    updated_at DOUBLE NOT NULL,
+    KEY idx_rate_limit_updated (updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,11 @@
+-- Which shard each school's rows live on (see shards.py). Only the default
+-- shard's copy is read; schools without a row live on the default shard.
+-- state is 'active', or 'frozen' while a move copies its last changes.
+
+CREATE TABLE IF NOT EXISTS SchoolShards (
+    school_id INT NOT NULL PRIMARY KEY,
+    shard VARCHAR(64) NOT NULL,
+    state VARCHAR(16) NOT NULL DEFAULT 'active',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_school_shards_shard (shard)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,2 @@
+DROP TABLE IF EXISTS PostAttachments;
+DROP TABLE IF EXISTS AttachmentBlobs;
@@ -0,0 +1,27 @@
+-- Post attachments (see attachments.py). Files live on disk under their
+-- SHA-256. AttachmentBlobs counts the PostAttachments rows referencing
+-- each one; only the default shard's copy is used, since schools on
+-- different shards share blobs. updated_at is Unix seconds.
+-- PostAttachments.post_id is NULL from upload until create_post claims it.
+
+CREATE TABLE IF NOT EXISTS AttachmentBlobs (
+    sha256 CHAR(64) NOT NULL PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INT NOT NULL,
+    updated_at DOUBLE NOT NULL,
+    KEY idx_blobs_unreferenced (ref_count, updated_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS PostAttachments (
+    id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    post_id INT NULL,
+    uploaded_by INT NOT NULL,
+    school_id INT NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    content_type VARCHAR(255) NOT NULL,
+    size BIGINT NOT NULL,
+    created_at DATETIME NOT NULL,
+    KEY idx_post_attachments_post (post_id, created_at),
+    KEY idx_post_attachments_school (school_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,17 @@
+-- Posts moved out of the live feed tables once they pass the retention
+-- horizon (see post_archive.py). Same columns as Posts plus archived_at,
+-- and the same feed indexes, so a historical page reads like a live one.
+-- ids are kept, so they are not AUTO_INCREMENT here.
+
+CREATE TABLE IF NOT EXISTS PostsArchive (
+    id INT NOT NULL PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    content TEXT NOT NULL,
+    user_id INT NOT NULL,
+    class_id INT NOT NULL,
+    created_at TIMESTAMP NOT NULL,
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    KEY idx_posts_archive_class_created (class_id, created_at, id),
+    KEY idx_posts_archive_created (created_at, id),
+    KEY idx_posts_archive_user (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
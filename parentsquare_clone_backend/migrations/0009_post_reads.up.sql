@@ -0,0 +1,13 @@
+-- Who has seen each post (see read_receipts.py). One row per (post, user),
+-- written in batches by the read buffer: read_count counts feed loads that
+-- showed the post. Times are naive UTC.
+
+CREATE TABLE IF NOT EXISTS PostReads (
+    post_id INT NOT NULL,
+    user_id INT NOT NULL,
+    first_read_at DATETIME NOT NULL,
+    last_read_at DATETIME NOT NULL,
+    read_count INT NOT NULL,
+    PRIMARY KEY (post_id, user_id),
+    KEY idx_post_reads_user (user_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
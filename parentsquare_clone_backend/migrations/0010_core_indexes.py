@@ -0,0 +1,67 @@
+"""Adds the core indexes to tables that predate the migrations.
+
+0001 creates a missing table together with its indexes but leaves an
+existing table alone, so a database whose tables were made by hand never
+got them. Each index below is added only where it's missing. Duplicate
+rows would break a unique index halfway through, so they are looked for
+first and nothing changes while any exist.
+"""
+from schema_migrations import MigrationError
+
+# (table, index, columns, unique), as declared in 0001_core_schema.
+INDEXES = (
+    ('Users', 'uq_users_email', ('email',), True),
+    ('Users', 'idx_users_school_role', ('school_id', 'role'), False),
+    ('Students', 'idx_students_user', ('user_id',), False),
+    ('Students', 'idx_students_school', ('school_id',), False),
+    ('Classes', 'idx_classes_school_name', ('school_id', 'class_name'), False),
+    ('Classes', 'idx_classes_teacher', ('teacher_id',), False),
+    ('StudentEnrollments', 'uq_enrollments_student_class', ('student_id', 'class_id'), True),
+    ('StudentEnrollments', 'idx_enrollments_class_student', ('class_id', 'student_id'), False),
+    ('ParentStudentLinks', 'uq_links_parent_student', ('parent_user_id', 'student_id'), True),
+    ('ParentStudentLinks', 'idx_links_student_parent', ('student_id', 'parent_user_id'), False),
+    ('AccessCodes', 'uq_access_codes_code', ('code',), True),
+    ('AccessCodes', 'idx_access_codes_student', ('student_id',), False),
+    ('Posts', 'idx_posts_class_created', ('class_id', 'created_at', 'id'), False),
+    ('Posts', 'idx_posts_created', ('created_at', 'id'), False),
+    ('Posts', 'idx_posts_user', ('user_id',), False),
+)
+
+# Duplicates listed per index in the error.
+SHOWN_DUPLICATES = 5
+
+
+def _exists(cursor, table, name):
+    cursor.execute(f"SHOW INDEX FROM {table} WHERE Key_name = %s", (name,))
+    return bool(cursor.fetchall())
+
+
+def _duplicates(cursor, table, columns):
+    listed = ', '.join(columns)
+    cursor.execute(f"""
+        SELECT {listed}, COUNT(*) AS copies FROM {table}
+        GROUP BY {listed} HAVING COUNT(*) > 1
+        ORDER BY copies DESC LIMIT {SHOWN_DUPLICATES}
+    """)
+    return cursor.fetchall()
+
+
+def upgrade(cursor):
+    missing = [index for index in INDEXES if not _exists(cursor, index[0], index[1])]
+
+    problems = []
+    for table, name, columns, unique in missing:
+        if unique:
+            problems += [f"{table} {tuple(row[column] for column in columns)} x{row['copies']}"
+                         for row in _duplicates(cursor, table, columns)]
+    if problems:
+        raise MigrationError('Duplicate rows block the unique indexes; merge them and run db upgrade again: '
+                             + '; '.join(problems))
+
+    for table, name, columns, unique in missing:
+        cursor.execute(f"ALTER TABLE {table} ADD {'UNIQUE ' if unique else ''}KEY {name} ({', '.join(columns)})")
+
+
+def downgrade(cursor):
+    # The indexes belong to 0001's tables, and reverting 0001 drops those.
+    pass
@@ -0,0 +1,345 @@
+"""Post notifications: a transactional outbox and a batched delivery worker.
+
+create_post writes one NotificationOutbox row in the same transaction as
+the post, so a post costs the same to create whatever the size of its
+audience, and a notification is never lost or sent for a rolled-back post.
+Everything else happens in the worker (`flask notifications worker`):
+
+1. Expand: each pending outbox row becomes one NotificationDeliveries
+   row per parent of a student enrolled in the class, in a single
+   INSERT ... SELECT DISTINCT. The UNIQUE (outbox_id, user_id) key
+   dedupes parents with several children in the class.
+2. Deliver: pending deliveries are claimed in batches, checked against
+   the per-school rate limit and sent through the transport. Failures,
+   of one message or of the whole transport, are retried with
+   exponential backoff, and marked failed after `max_attempts`.
+
+Rows are claimed with a lease: claiming pushes next_attempt_at past the
+lease, so rows held by a crashed worker become due again on their own.
+Delivery is therefore at least once; the delivery id goes out with every
+message (as the Message-ID for SMTP) so receivers can drop repeats.
+
+All timestamps in these tables are naive UTC written by this module.
+"""
+import datetime
+import json
+import smtplib
+import threading
+import time
+import uuid
+from collections import namedtuple
+from email.message import EmailMessage
+
+Message = namedtuple('Message', ['delivery_id', 'email', 'subject', 'body'])
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+# -----------------
+# Transports
+# -----------------
+class FileTransport:
+    """Appends each message to a JSON-lines file; a local SMTP-sink stand-in."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send_batch(self, messages):
+        """Returns {delivery_id: error or None}."""
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            for message in messages:
+                f.write(json.dumps(message._asdict()) + '\n')
+        return {message.delivery_id: None for message in messages}
+
+
+class SmtpTransport:
+    """Sends a batch over one SMTP connection."""
+
+    def __init__(self, host, port=25, sender='noreply@localhost', username=None, password=None,
+                 use_tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def send_batch(self, messages):
+        results = {}
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            for message in messages:
+                email = EmailMessage()
+                email['From'] = self.sender
+                email['To'] = message.email
+                email['Subject'] = message.subject
+                email['Message-ID'] = f'<notification-{message.delivery_id}@{self.sender.split("@")[-1]}>'
+                email.set_content(message.body)
+                try:
+                    smtp.send_message(email)
+                    results[message.delivery_id] = None
+                except smtplib.SMTPException as e:
+                    results[message.delivery_id] = str(e)
+        return results
+
+
+# -----------------
+# Rate Limiting
+# -----------------
+class SchoolRateLimiter:
+    """Token bucket per school: `rate` messages per second, bursts up to `burst`.
+
+    Limits are per worker process.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, school_id, wanted):
+        """Takes up to `wanted` tokens; returns (granted, seconds until the next token)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(school_id, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            granted = min(wanted, int(tokens))
+            tokens -= granted
+            self._buckets[school_id] = (tokens, now)
+        return granted, (1 - tokens % 1) / self.rate if granted < wanted else 0.0
+
+
+# -----------------
+# Outbox
+# -----------------
+def enqueue_post(cursor, post_id, class_id, school_id):
+    """Queues notifications for a new post; call inside the post's transaction."""
+    cursor.execute(
+        "INSERT INTO NotificationOutbox (post_id, class_id, school_id, status, next_attempt_at) VALUES (%s, %s, %s, %s, %s)",
+        (post_id, class_id, school_id, 'pending', _utcnow()))
+
+
+class NotificationWorker:
+    """Expands the outbox and delivers notifications; safe to run from many threads and processes."""
+
+    def __init__(self, pool, transport, rate_limiter=None, batch_size=100, max_attempts=6,
+                 backoff_seconds=30, lease_seconds=300, log=print):
+        self.pool = pool
+        self.transport = transport
+        self.rate_limiter = rate_limiter
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.log = log
+        self._stats = {'expanded': 0, 'recipients': 0, 'sent': 0, 'retried': 0, 'failed': 0,
+                       'cancelled': 0, 'rate_limited': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _lease_end(self, now):
+        return now + datetime.timedelta(seconds=self.lease_seconds)
+
+    # Claiming: select due rows, then lease them with a conditional UPDATE.
+    # Another worker may have claimed some of them since the SELECT; the
+    # conditions make each row go to exactly one claimant, found again by
+    # its claim token.
+
+    def _claim_outbox(self, cursor, now):
+        cursor.execute("SELECT id FROM NotificationOutbox WHERE status = 'pending' AND next_attempt_at <= %s "
+                       "ORDER BY next_attempt_at LIMIT %s", (now, self.batch_size))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        cursor.execute(f"UPDATE NotificationOutbox SET claim_token = %s, next_attempt_at = %s "
+                       f"WHERE id IN ({_placeholders(ids)}) AND status = 'pending' AND next_attempt_at <= %s",
+                       [token, self._lease_end(now)] + ids + [now])
+        cursor.execute("SELECT id FROM NotificationOutbox WHERE claim_token = %s", (token,))
+        return [row['id'] for row in cursor.fetchall()]
+
+    def _claim_deliveries(self, cursor, now):
+        cursor.execute("SELECT id FROM NotificationDeliveries WHERE status = 'pending' AND next_attempt_at <= %s "
+                       "ORDER BY next_attempt_at LIMIT %s", (now, self.batch_size))
+        ids = [row['id'] for row in cursor.fetchall()]
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        cursor.execute(f"UPDATE NotificationDeliveries SET claim_token = %s, next_attempt_at = %s "
+                       f"WHERE id IN ({_placeholders(ids)}) AND status = 'pending' AND next_attempt_at <= %s",
+                       [token, self._lease_end(now)] + ids + [now])
+        cursor.execute("SELECT id FROM NotificationDeliveries WHERE claim_token = %s", (token,))
+        return [row['id'] for row in cursor.fetchall()]
+
+    def expand_outbox(self):
+        """Turns due outbox rows into per-recipient deliveries; returns how many were expanded."""
+        connection = self.pool.acquire()
+        try:
+            now = _utcnow()
+            with connection.cursor() as cursor:
+                outbox_ids = self._claim_outbox(cursor, now)
+            connection.commit()
+
+            for outbox_id in outbox_ids:
+                with connection.cursor() as cursor:
+                    cursor.execute("""
+                        INSERT IGNORE INTO NotificationDeliveries (outbox_id, user_id, school_id, status, attempts, next_attempt_at)
+                        SELECT DISTINCT o.id, psl.parent_user_id, o.school_id, 'pending', 0, %s
+                        FROM NotificationOutbox o
+                        JOIN StudentEnrollments se ON se.class_id = o.class_id
+                        JOIN ParentStudentLinks psl ON psl.student_id = se.student_id
+                        WHERE o.id = %s
+                    """, (now, outbox_id))
+                    recipients = cursor.rowcount
+                    cursor.execute("UPDATE NotificationOutbox SET status = 'expanded' WHERE id = %s", (outbox_id,))
+                connection.commit()
+                self._count(expanded=1, recipients=recipients)
+            return len(outbox_ids)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            self.pool.release(connection)
+
+    def deliver_batch(self):
+        """Sends one batch of due deliveries; returns how many were attempted."""
+        connection = self.pool.acquire()
+        try:
+            now = _utcnow()
+            with connection.cursor() as cursor:
+                delivery_ids = self._claim_deliveries(cursor, now)
+                if not delivery_ids:
+                    connection.commit()
+                    return 0
+                cursor.execute(f"""
+                    SELECT d.id, d.school_id, d.attempts, u.email, p.id AS post_id, p.title, p.content, c.class_name
+                    FROM NotificationDeliveries d
+                    JOIN Users u ON u.id = d.user_id
+                    JOIN NotificationOutbox o ON o.id = d.outbox_id
+                    LEFT JOIN Posts p ON p.id = o.post_id
+                    LEFT JOIN Classes c ON c.id = o.class_id
+                    WHERE d.id IN ({_placeholders(delivery_ids)})
+                """, delivery_ids)
+                rows = cursor.fetchall()
+            connection.commit()
+
+            sendable, deferred, cancelled = self._apply_rate_limits(rows)
+            results = self._send(sendable) if sendable else {}
+            self._record(connection, sendable, results, deferred, cancelled, now)
+            return len(sendable)
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            self.pool.release(connection)
+
+    def _send(self, rows):
+        """Sends the rows' messages; returns {delivery_id: error or None}.
+
+        A transport that fails as a whole (connection refused, dropped
+        session) fails every message in the batch, so each is retried with
+        backoff like a message the server rejected.
+        """
+        try:
+            return self.transport.send_batch([
+                Message(row['id'], row['email'], f"New post in {row['class_name']}: {row['title']}",
+                        f"{row['title']}\n\n{row['content']}\n") for row in rows])
+        except Exception as e:
+            self.log(f'Notification transport error: {e}')
+            return {row['id']: f'{type(e).__name__}: {e}' for row in rows}
+
+    def _apply_rate_limits(self, rows):
+        """Splits claimed rows into (sendable, {id: seconds to defer}, cancelled ids)."""
+        by_school, cancelled = {}, []
+        for row in rows:
+            if row['post_id'] is None:
+                # The post was deleted before its notice went out.
+                cancelled.append(row['id'])
+            else:
+                by_school.setdefault(row['school_id'], []).append(row)
+
+        sendable, deferred = [], {}
+        for school_id, school_rows in by_school.items():
+            granted, wait = (len(school_rows), 0.0) if self.rate_limiter is None else \
+                self.rate_limiter.take(school_id, len(school_rows))
+            sendable.extend(school_rows[:granted])
+            for index, row in enumerate(school_rows[granted:]):
+                deferred[row['id']] = wait + index / self.rate_limiter.rate
+        return sendable, deferred, cancelled
+
+    def _record(self, connection, sendable, results, deferred, cancelled, now):
+        sent, retry, failed = [], [], []
+        for row in sendable:
+            error = results.get(row['id'], 'No result from transport')
+            if error is None:
+                sent.append((now, row['id']))
+            elif row['attempts'] + 1 >= self.max_attempts:
+                failed.append((error[:500], row['id']))
+            else:
+                delay = self.backoff_seconds * 2 ** row['attempts']
+                retry.append((error[:500], now + datetime.timedelta(seconds=delay), row['id']))
+
+        with connection.cursor() as cursor:
+            if sent:
+                cursor.executemany("UPDATE NotificationDeliveries SET status = 'sent', sent_at = %s, attempts = attempts + 1 WHERE id = %s", sent)
+            if retry:
+                cursor.executemany("UPDATE NotificationDeliveries SET last_error = %s, next_attempt_at = %s, attempts = attempts + 1 WHERE id = %s", retry)
+            if failed:
+                cursor.executemany("UPDATE NotificationDeliveries SET status = 'failed', last_error = %s, attempts = attempts + 1 WHERE id = %s", failed)
+            if deferred:
+                # Rate-limited rows wait for the school's next tokens; this isn't an attempt.
+                cursor.executemany("UPDATE NotificationDeliveries SET next_attempt_at = %s WHERE id = %s", [
+                    (now + datetime.timedelta(seconds=max(1, round(seconds))), delivery_id)
+                    for delivery_id, seconds in deferred.items()])
+            if cancelled:
+                cursor.execute(f"UPDATE NotificationDeliveries SET status = 'cancelled' WHERE id IN ({_placeholders(cancelled)})",
+                               cancelled)
+        connection.commit()
+        self._count(sent=len(sent), retried=len(retry), failed=len(failed),
+                    rate_limited=len(deferred), cancelled=len(cancelled))
+
+    def run_once(self):
+        """One expand pass and one delivery batch; returns True if there was work."""
+        expanded = self.expand_outbox()
+        attempted = self.deliver_batch()
+        return bool(expanded or attempted)
+
+    def run(self, threads=4, idle_sleep=1.0, stop=None):
+        """Runs `threads` worker loops until `stop` (a threading.Event) is set."""
+        stop = stop or threading.Event()
+
+        def loop():
+            while not stop.is_set():
+                try:
+                    busy = self.run_once()
+                except Exception as e:
+                    self.log(f'Notification worker error: {e}')
+                    busy = False
+                if not busy:
+                    stop.wait(idle_sleep)
+
+        workers = [threading.Thread(target=loop, name=f'notifications-{n}', daemon=True) for n in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,65 @@
+import base64
+import json
+from collections import namedtuple
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# `after` is the (created_at, id) of the last row on the previous page.
+Page = namedtuple('Page', ['limit', 'after'])
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for a malformed `limit` or `cursor` query parameter."""
+
+
+def encode_cursor(post):
+    """Encodes a post's (created_at, id) sort key as an opaque cursor."""
+    raw = json.dumps([str(post['created_at']), post['id']]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(token):
+    """Decodes a cursor produced by encode_cursor()."""
+    try:
+        created_at, post_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return str(created_at), int(post_id)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest('Invalid cursor')
+
+
+def parse_page_args(args):
+    """Builds a Page from request args, or None if the caller opted out of paging.
+
+    `?paginate=false` keeps the old unpaged response while clients migrate.
+    """
+    if args.get('paginate', '').lower() in ('false', '0', 'no'):
+        return None
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageRequest('limit must be an integer')
+    if limit < 1:
+        raise InvalidPageRequest('limit must be at least 1')
+
+    token = args.get('cursor')
+    return Page(min(limit, MAX_PAGE_SIZE), decode_cursor(token) if token else None)
+
+
+def keyset_filter(page, alias='p', id_column='id', keyword='AND'):
+    """Returns the SQL condition and params selecting rows after the cursor."""
+    if page is None or page.after is None:
+        return '', ()
+    created_at, post_id = page.after
+    column = f"{alias}.{id_column}"
+    sql = f" {keyword} ({alias}.created_at < %s OR ({alias}.created_at = %s AND {column} < %s))"
+    return sql, (created_at, created_at, post_id)
+
+
+def split_page(rows, page):
+    """Trims the look-ahead row fetched past the limit and returns (rows, next_cursor)."""
+    if len(rows) <= page.limit:
+        return rows, None
+    rows = rows[:page.limit]
+    return rows, encode_cursor(rows[-1])
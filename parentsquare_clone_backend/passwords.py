@@ -0,0 +1,110 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+# bcrypt only looks at the first 72 bytes; older bcrypt releases truncated
+# silently and newer ones raise, so truncate to keep existing hashes valid.
+MAX_PASSWORD_BYTES = 72
+
+
+def _encode(password):
+    return password.encode('utf-8')[:MAX_PASSWORD_BYTES]
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(_encode(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(password_hash, password):
+    try:
+        return bcrypt.checkpw(_encode(password), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed hash in the database: treat it as a failed login.
+        return False
+
+
+def hash_cost(password_hash):
+    """Returns the cost factor of a '$2b$12$...' bcrypt hash, or None if malformed."""
+    parts = password_hash.split('$')
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a dedicated bounded executor.
+
+    With the default 'process' executor, password work runs in separate
+    processes, outside the GIL, and at most `max_workers` bcrypt
+    operations run at once. Request threads only wait on the result.
+    'thread' and 'inline' modes exist for environments where process
+    pools are unavailable. `observe`, if given, is called with the
+    wall-clock seconds of every hash or verify call.
+    """
+
+    def __init__(self, rounds=12, max_workers=2, executor='process', observe=None):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.executor_kind = executor
+        self.observe = observe
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created lazily so importing the app never forks, and with 'spawn'
+        # so workers don't inherit the server's threads and sockets.
+        with self._lock:
+            if self._executor is None:
+                if self.executor_kind == 'process':
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context('spawn'))
+                elif self.executor_kind == 'thread':
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='bcrypt')
+            return self._executor
+
+    def _run(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            if self.executor_kind == 'inline':
+                return fn(*args)
+            return self._get_executor().submit(fn, *args).result()
+        finally:
+            self._observe(started)
+
+    def _observe(self, started):
+        if self.observe is not None:
+            self.observe(time.perf_counter() - started)
+
+    def hash(self, password):
+        """Returns a bcrypt hash of `password` at the configured cost."""
+        return self._run(_hash_password, password, self.rounds)
+
+    def hash_many(self, passwords):
+        """Hashes several passwords in parallel across the executor's workers."""
+        started = time.perf_counter()
+        try:
+            if self.executor_kind == 'inline':
+                return [_hash_password(password, self.rounds) for password in passwords]
+            return list(self._get_executor().map(_hash_password, passwords, [self.rounds] * len(passwords)))
+        finally:
+            self._observe(started)
+
+    def verify(self, password_hash, password):
+        """Checks `password` against a stored bcrypt hash."""
+        return self._run(_check_password, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if a stored hash was made with a different cost than configured."""
+        return hash_cost(password_hash) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
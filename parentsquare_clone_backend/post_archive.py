@@ -0,0 +1,162 @@
+"""Hot/cold post storage: old posts move out of the live feed tables.
+
+Posts older than the retention horizon are moved, in small batches, from
+Posts to PostsArchive, and their FeedInbox rows are dropped. So the
+tables every feed reads stay the size of the current school year, however
+much history piles up. Each batch is one short transaction: copy, delete
+the inbox rows, delete from Posts, commit.
+
+Posts are archived oldest first, so every archived post sorts after every
+live one in feed order. That lets a historical feed read the live tables
+first and go on into the archive only once they run out (see
+fetch_with_archive in app.py). Archiving is idempotent, so several
+processes can run it at once.
+
+The horizon is either ARCHIVE_AFTER_DAYS before now or, with
+ARCHIVE_SCHOOL_YEAR_START ('MM-DD'), the start of the current school year.
+Posts.created_at is compared as naive UTC.
+"""
+import datetime
+import threading
+import time
+
+# Request args that ask a feed for archived posts too.
+ARCHIVED_ARG = 'archived'
+
+
+def parse_school_year_start(value):
+    """Parses 'MM-DD' into (month, day), or None for an empty value.
+
+    The date must exist every year, so 02-29 is refused.
+    """
+    if not value:
+        return None
+    try:
+        month, day = (int(part) for part in value.split('-'))
+        datetime.date(2001, month, day)
+    except ValueError:
+        raise ValueError(f'Invalid ARCHIVE_SCHOOL_YEAR_START {value!r}, expected MM-DD that exists every year')
+    return month, day
+
+
+def archive_horizon(now, after_days=0, school_year_start=None):
+    """The created_at before which posts are archived, or None if archiving is off.
+
+    `school_year_start` is a (month, day); the horizon is then its latest
+    occurrence on or before `now`, so last year's posts go at once when a
+    new school year starts. Otherwise it is `after_days` before `now`.
+    """
+    if school_year_start:
+        month, day = school_year_start
+        start = now.replace(month=month, day=day, hour=0, minute=0, second=0, microsecond=0)
+        return start if start <= now else start.replace(year=start.year - 1)
+    if after_days > 0:
+        return now - datetime.timedelta(days=after_days)
+    return None
+
+
+def include_archived(args):
+    """True if a feed request asked for archived posts with ?archived=true."""
+    return args.get(ARCHIVED_ARG, '').lower() in ('true', '1', 'yes')
+
+
+def archive_batch(connection, horizon, batch_size=500):
+    """Moves up to `batch_size` of the oldest posts created before `horizon`; returns their rows.
+
+    Each returned row has the post's id and class_id.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, class_id FROM Posts WHERE created_at < %s ORDER BY created_at, id LIMIT %s",
+                       (horizon, batch_size))
+        rows = cursor.fetchall()
+        if rows:
+            ids = [row['id'] for row in rows]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"""
+                INSERT IGNORE INTO PostsArchive (id, title, content, user_id, class_id, created_at)
+                SELECT id, title, content, user_id, class_id, created_at FROM Posts WHERE id IN ({placeholders})
+            """, ids)
+            cursor.execute(f"DELETE FROM FeedInbox WHERE post_id IN ({placeholders})", ids)
+            cursor.execute(f"DELETE FROM Posts WHERE id IN ({placeholders})", ids)
+    connection.commit()
+    return rows
+
+
+class Archiver:
+    """Moves posts past the horizon into PostsArchive in a background thread.
+
+    `pools` are the shard primaries. `horizon` is called once per pass and
+    returns the cutoff (None skips the pass). Every batch is committed on
+    its own, with `pause` seconds between batches so a large first run
+    doesn't crowd out requests. `on_archived` gets each batch's rows after
+    it commits.
+    """
+
+    def __init__(self, pools, horizon, interval=3600.0, batch_size=500, pause=0.1, on_archived=None, log=None):
+        self.pools = list(pools)
+        self.horizon = horizon
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.on_archived = on_archived
+        self.log = log
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'batches': 0, 'posts_archived': 0, 'errors': 0}
+
+    def start(self):
+        """Starts the background thread once; later calls do nothing."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='post-archiver', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                with self._lock:
+                    self._stats['errors'] += 1
+                if self.log is not None:
+                    self.log(f'Post archiving failed: {e}')
+            time.sleep(self.interval)
+
+    def run_once(self):
+        """Archives everything past the horizon on every shard; returns how many posts moved."""
+        horizon = self.horizon()
+        moved = 0
+        if horizon is not None:
+            for pool in self.pools:
+                moved += self._archive_pool(pool, horizon)
+        with self._lock:
+            self._stats['runs'] += 1
+        return moved
+
+    def _archive_pool(self, pool, horizon):
+        moved = 0
+        while True:
+            connection = pool.acquire()
+            try:
+                rows = archive_batch(connection, horizon, self.batch_size)
+            except Exception:
+                connection.rollback()
+                pool.release(connection, discard=True)
+                raise
+            pool.release(connection)
+            if not rows:
+                return moved
+            moved += len(rows)
+            with self._lock:
+                self._stats['batches'] += 1
+                self._stats['posts_archived'] += len(rows)
+            if self.on_archived is not None:
+                self.on_archived(rows)
+            if len(rows) < self.batch_size:
+                return moved
+            time.sleep(self.pause)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,295 @@
+"""Real-time post events for the Server-Sent Events stream.
+
+create_post and delete_post publish an event for the post's class. The
+EventBroker fans each event out to the subscribers whose classes include
+it. Every subscriber has a bounded buffer: one that falls behind is cut
+off instead of holding up the publisher. Its client then reconnects with
+Last-Event-ID and catches up from the broker's replay log. A client whose
+Last-Event-ID is older than the replay log gets a 'resync' event and
+reloads its feed.
+
+Event ids and delivery between processes come from a pluggable backend:
+
+    LocalBackend     one process; ids come from a counter.
+    DatabaseBackend  several workers; events go through the PostEvents
+                     table (migrations/0003_post_events) and its
+                     AUTO_INCREMENT ids. Each worker polls the table once
+                     per interval, whatever its number of subscribers.
+"""
+import datetime
+import itertools
+import json
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+
+Event = namedtuple('Event', ['id', 'type', 'class_id', 'data'])
+
+logger = logging.getLogger(__name__)
+
+
+def _timestamp(value):
+    """A TIMESTAMP column as a datetime; the SQLite stand-in returns strings."""
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def format_event(event):
+    """Renders an event in the text/event-stream wire format."""
+    return f'id: {event.id}\nevent: {event.type}\ndata: {event.data}\n\n'
+
+
+class Subscription:
+    """One stream's view of the broker: its classes and a bounded event buffer."""
+
+    def __init__(self, class_ids, max_buffer):
+        self.class_ids = frozenset(class_ids)
+        self.max_buffer = max_buffer
+        self.needs_resync = False
+        self.overflowed = False
+        self._buffer = deque()
+        self._ready = threading.Condition()
+
+    def deliver(self, event):
+        """Queues an event without ever blocking the publisher."""
+        with self._ready:
+            if self.overflowed:
+                return
+            if len(self._buffer) >= self.max_buffer:
+                # Too slow: drop the subscriber. Its client resumes from
+                # the replay log via Last-Event-ID.
+                self.overflowed = True
+                self._buffer.clear()
+            else:
+                self._buffer.append(event)
+            self._ready.notify()
+
+    def next_batch(self, timeout):
+        """Waits up to `timeout` seconds and returns the buffered events (maybe none)."""
+        with self._ready:
+            if not self._buffer and not self.overflowed:
+                self._ready.wait(timeout)
+            events = list(self._buffer)
+            self._buffer.clear()
+            return events
+
+
+class EventBroker:
+    """Routes published post events to the subscribers of the post's class."""
+
+    def __init__(self, backend, buffer_size=100, replay_size=1000):
+        self.backend = backend
+        self.buffer_size = buffer_size
+        self._replay = deque(maxlen=replay_size)
+        # Events up to this id are no longer in the replay log.
+        self._replay_floor = None
+        self._subscribers = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stats = {'published': 0, 'delivered': 0, 'overflows': 0, 'resyncs': 0, 'listener_errors': 0}
+
+    def _ensure_started(self):
+        # Started on first use so importing the app never touches the database.
+        if self._replay_floor is None:
+            with self._start_lock:
+                if self._replay_floor is None:
+                    floor = self.backend.start(self._dispatch)
+                    with self._lock:
+                        self._replay_floor = floor
+
+    def start(self):
+        """Starts receiving events now rather than on first publish or subscribe."""
+        self._ensure_started()
+
+    def publish(self, event_type, class_id, data):
+        """Publishes an event; `data` must be JSON-serializable."""
+        self._ensure_started()
+        self.backend.publish(event_type, class_id, json.dumps(data, default=str))
+
+    def subscribe(self, class_ids, last_event_id=None):
+        """Registers a subscription, pre-filled with the events after `last_event_id`."""
+        self._ensure_started()
+        subscription = Subscription(class_ids, self.buffer_size)
+        with self._lock:
+            if last_event_id is not None:
+                newest = self._replay[-1].id if self._replay else self._replay_floor
+                if last_event_id < self._replay_floor or last_event_id > newest:
+                    subscription.needs_resync = True
+                    self._stats['resyncs'] += 1
+                else:
+                    for event in self._replay:
+                        if event.id > last_event_id and event.class_id in subscription.class_ids:
+                            subscription._buffer.append(event)
+            for class_id in subscription.class_ids:
+                self._subscribers.setdefault(class_id, set()).add(subscription)
+        return subscription
+
+    def add_listener(self, listener):
+        """Calls `listener(event)` for every event, from any process, in id order."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for class_id in subscription.class_ids:
+                subscribers = self._subscribers.get(class_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[class_id]
+            if subscription.overflowed:
+                self._stats['overflows'] += 1
+
+    def _dispatch(self, event):
+        """Called by the backend, in id order, for every event from any process."""
+        with self._lock:
+            if len(self._replay) == self._replay.maxlen:
+                self._replay_floor = self._replay[0].id
+            self._replay.append(event)
+            subscribers = list(self._subscribers.get(event.class_id, ()))
+            self._stats['published'] += 1
+            self._stats['delivered'] += len(subscribers)
+        for subscription in subscribers:
+            subscription.deliver(event)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception:
+                # A broken listener must not stop delivery to the streams.
+                logger.exception('Post event listener %r failed on event %s', listener, event.id)
+                with self._lock:
+                    self._stats['listener_errors'] += 1
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['subscribers'] = len({s for subs in self._subscribers.values() for s in subs})
+        return snapshot
+
+    def close(self):
+        self.backend.stop()
+
+
+# -----------------
+# Backends
+# -----------------
+class LocalBackend:
+    """Delivers events within this process only.
+
+    Ids start from the current time in microseconds, so a client resuming
+    with an id from before a restart is detected and resynced.
+    """
+
+    def __init__(self):
+        self._ids = None
+        self._dispatch = None
+        self._lock = threading.Lock()
+
+    def start(self, dispatch):
+        first_id = time.time_ns() // 1000
+        self._ids = itertools.count(first_id)
+        self._dispatch = dispatch
+        return first_id - 1
+
+    def publish(self, event_type, class_id, data):
+        # The lock keeps the replay log in id order.
+        with self._lock:
+            self._dispatch(Event(next(self._ids), event_type, class_id, data))
+
+    def stop(self):
+        pass
+
+
+class DatabaseBackend:
+    """Shares events between worker processes through the PostEvents table.
+
+    AUTO_INCREMENT ids can commit out of order, so the poller holds back
+    at a missing id. A publish commits right after its insert, so once a
+    later id has been committed for `in_flight_window` seconds (by the
+    database's clock) the missing one was rolled back, and the poller
+    moves on. Rows older than the newest `retain` are pruned.
+    """
+
+    def __init__(self, pool, poll_interval=0.5, in_flight_window=1.0, retain=10000):
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.in_flight_window = in_flight_window
+        self.retain = retain
+        self._last_id = None
+        self._gap_since = None
+        self._dispatch = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, dispatch):
+        self._dispatch = dispatch
+        connection = self.pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT COALESCE(MAX(id), 0) AS last_id FROM PostEvents")
+                self._last_id = cursor.fetchone()['last_id']
+        finally:
+            self.pool.release(connection)
+        self._thread = threading.Thread(target=self._run, name='post-events-poller', daemon=True)
+        self._thread.start()
+        return self._last_id
+
+    def publish(self, event_type, class_id, data):
+        connection = self.pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("INSERT INTO PostEvents (event_type, class_id, payload) VALUES (%s, %s, %s)",
+                               (event_type, class_id, data))
+            connection.commit()
+        finally:
+            self.pool.release(connection)
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        polls = 0
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+                polls += 1
+                if polls % 1000 == 0:
+                    self.prune()
+            except Exception:
+                # Keep polling; a database blip must not end delivery for good.
+                pass
+
+    def poll(self):
+        connection = self.pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, event_type, class_id, payload, created_at, CURRENT_TIMESTAMP AS db_now
+                    FROM PostEvents WHERE id > %s ORDER BY id LIMIT 500
+                """, (self._last_id,))
+                rows = cursor.fetchall()
+        finally:
+            self.pool.release(connection)
+
+        now = time.monotonic()
+        for row in rows:
+            if row['id'] != self._last_id + 1:
+                if self._gap_since is None:
+                    # When the id after the gap committed, on our clock. TIMESTAMPs
+                    # have whole seconds, so its age may read up to a second high.
+                    age = (_timestamp(row['db_now']) - _timestamp(row['created_at'])).total_seconds() - 1
+                    self._gap_since = now - max(0.0, age)
+                if now - self._gap_since < self.in_flight_window:
+                    break
+            self._gap_since = None
+            self._last_id = row['id']
+            self._dispatch(Event(row['id'], row['event_type'], row['class_id'], row['payload']))
+
+    def prune(self):
+        connection = self.pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM PostEvents WHERE id <= %s", (self._last_id - self.retain,))
+            connection.commit()
+        finally:
+            self.pool.release(connection)
@@ -0,0 +1,160 @@
+"""EXPLAIN plan check for every SQL statement the app runs.
+
+Statements are discovered from the source of the app's modules, so a new
+query is checked without having to be registered anywhere. Each one is
+EXPLAINed against the configured database and the plans are written out
+for review. A hot statement (anything on a request path) fails the check
+when MySQL would read a table with a full scan (access type ALL).
+
+Plans depend on table statistics, so run this against a database with
+representative data rather than an empty schema.
+"""
+import ast
+import os
+import re
+from collections import namedtuple
+
+import feed_inbox
+import read_receipts
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_MODULES = ('app.py', 'feed_inbox.py', 'access_codes.py', 'roster_import.py', 'post_events.py',
+               'notifications.py', 'search_index.py', 'admission.py', 'shards.py', 'attachments.py', 'post_archive.py',
+               'read_receipts.py')
+
+# Maintenance-only code and periodic cache loads, allowed to scan whole tables.
+COLD_SCOPES = {'backfill', 'check_consistency', 'RECIPIENT_POSTS_SQL', 'SHARD_MAP_SQL', 'SCHOOL_TABLES',
+               'sync_school', 'delete_school_rows', '_school_rows', '_delete_keys', '_insert_rows', 'reserve_id_range',
+               'shards_init', 'archive_status'}
+# Templates only ever run filtered; their rendered forms are in dynamic_statements().
+TEMPLATE_SCOPES = {'CLASS_RECIPIENTS_SQL', 'EXISTING_POSTS_SQL'}
+# Feed templates read `{posts_table}`: live Posts, or PostsArchive for history.
+POSTS_TABLES = ('Posts', 'PostsArchive')
+
+Statement = namedtuple('Statement', ['name', 'sql', 'hot'])
+
+_SQL_START = re.compile(r'^\s*(SELECT\s|INSERT\s+(IGNORE\s+)?INTO\s|UPDATE\s+\w+\s+SET\s|DELETE\s+FROM\s)', re.IGNORECASE)
+_FORMAT_FIELD = re.compile(r'\{(\w+)\}')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*$', re.IGNORECASE)
+# Sample value for every %s; a string so indexed VARCHAR columns stay sargable.
+SAMPLE_PARAM = '1'
+# LIMIT and OFFSET take an int: MySQL rejects a quoted '1' there as a syntax error.
+SAMPLE_LIMIT = 20
+_NUMERIC_PLACEHOLDER = re.compile(r'\b(LIMIT|OFFSET)\s+(%s\s*,\s*)?$', re.IGNORECASE)
+_PLACEHOLDER = re.compile(r'%s')
+
+
+class _StatementFinder(ast.NodeVisitor):
+    """Collects SQL string literals with the name of the function or constant they sit in."""
+
+    def __init__(self, module):
+        self.module = module
+        self.scope = [module]
+        self.found = []
+
+    def _visit_scoped(self, node, name):
+        self.scope.append(name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    def visit_FunctionDef(self, node):
+        self._visit_scoped(node, node.name)
+
+    def visit_Assign(self, node):
+        if len(self.scope) == 1 and isinstance(node.targets[0], ast.Name):
+            self._visit_scoped(node, node.targets[0].id)
+        else:
+            self.generic_visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, str) and _SQL_START.match(node.value):
+            sql = node.value
+            if '{page_filter}' in sql:
+                # Feed templates run paged on the hot path.
+                sql += ' LIMIT %s'
+            for table in POSTS_TABLES if '{posts_table}' in sql else POSTS_TABLES[:1]:
+                self._add(node, _FORMAT_FIELD.sub('', sql.replace('{posts_table}', table)))
+
+    def visit_JoinedStr(self, node):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            elif parts and _IN_LIST.search(parts[-1]):
+                parts.append('%s, %s, %s')
+            elif parts and parts[-1].rstrip().endswith('('):
+                # An interpolated subquery; covered by dynamic_statements().
+                return
+            else:
+                parts.append('')
+        sql = ''.join(parts)
+        if _SQL_START.match(sql):
+            self._add(node, sql)
+
+    def _add(self, node, sql):
+        scope = self.scope[-1]
+        if scope in TEMPLATE_SCOPES:
+            return
+        self.found.append(Statement(f'{self.module}:{scope}:{node.lineno}', sql, scope not in COLD_SCOPES))
+
+
+def discover_statements(base_dir=BASE_DIR, modules=APP_MODULES):
+    """Returns every SQL statement literal in the app's modules."""
+    statements = []
+    for module in modules:
+        with open(os.path.join(base_dir, module), encoding='utf-8') as f:
+            finder = _StatementFinder(module)
+            finder.visit(ast.parse(f.read()))
+        statements.extend(finder.found)
+    return statements
+
+
+def dynamic_statements():
+    """Statements assembled at runtime that the source scan can't render."""
+    return [
+        Statement('feed_inbox:fan_out_statement(post_id)', feed_inbox.fan_out_statement(post_id=1)[0], True),
+        Statement('feed_inbox:fan_out_statement(user_id)', feed_inbox.fan_out_statement(user_id=1)[0], True),
+        Statement('read_receipts:post_counts_statement',
+                  read_receipts.post_counts_statement([{'id': 1, 'class_id': 1}])[0], True),
+        Statement('read_receipts:class_recipient_counts_statement',
+                  read_receipts.class_recipient_counts_statement(1, 1)[0], True),
+        Statement('read_receipts:class_read_counts_statement',
+                  read_receipts.class_read_counts_statement(1, 1)[0], True),
+        Statement('read_receipts:unread_statement', read_receipts.unread_statement(1, 1)[0], True),
+        *(Statement(f'read_receipts:EXISTING_POSTS_SQL[{index}]', sql.format(ids='%s, %s, %s'), True)
+          for index, sql in enumerate(read_receipts.EXISTING_POSTS_SQL)),
+    ]
+
+
+def sample_params(sql):
+    """Sample values to EXPLAIN `sql` with, one per %s placeholder."""
+    return tuple(SAMPLE_LIMIT if _NUMERIC_PLACEHOLDER.search(sql, 0, match.start()) else SAMPLE_PARAM
+                 for match in _PLACEHOLDER.finditer(sql))
+
+
+def full_scans(plan):
+    """Returns the real tables a plan reads with a full table scan."""
+    return sorted({row['table'] for row in plan
+                   if row.get('type') == 'ALL' and row.get('table') and not row['table'].startswith('<')})
+
+
+def check_plans(connection, statements=None):
+    """EXPLAINs every statement; returns (plans, regressions)."""
+    if statements is None:
+        statements = discover_statements() + dynamic_statements()
+
+    plans, regressions = [], []
+    with connection.cursor() as cursor:
+        for statement in statements:
+            params = sample_params(statement.sql)
+            entry = {'name': statement.name, 'hot': statement.hot, 'sql': ' '.join(statement.sql.split())}
+            try:
+                cursor.execute('EXPLAIN ' + statement.sql, params)
+                entry['plan'] = cursor.fetchall()
+                entry['full_scans'] = full_scans(entry['plan'])
+            except Exception as e:
+                entry['error'] = str(e)
+            plans.append(entry)
+            if statement.hot and (entry.get('full_scans') or entry.get('error')):
+                regressions.append(entry)
+    return plans, regressions
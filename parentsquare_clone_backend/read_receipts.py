@@ -0,0 +1,306 @@
+"""Read receipts: which parents and students have seen each post.
+
+Every feed page a parent or student loads counts as a read of the posts on
+it. Writing a row per read would turn each feed read into a write, so
+ReadBuffer collects reads in memory instead, coalesced per (post, user),
+and a background thread writes them as one bulk upsert per shard once
+`flush_size` pairs are pending or `flush_interval` seconds have passed.
+The buffer holds at most `max_pending` pairs. Reads of new pairs past that
+are dropped and counted, so a slow database never makes a feed wait or the
+process grow. close() writes out whatever is left at shutdown. Reads of
+a post deleted before they are written are skipped.
+
+Reports are therefore up to `flush_interval` seconds behind. A post's
+recipients are the users whose feed shows it, by the feed's rules:
+students with a login in its class and their parents. Times are naive UTC.
+"""
+import datetime
+import threading
+
+# Rows per executemany; pymysql sends each chunk as one multi-row INSERT.
+WRITE_CHUNK_SIZE = 1000
+
+UPSERT_READS_SQL = """
+    INSERT INTO PostReads (post_id, user_id, first_read_at, last_read_at, read_count)
+    VALUES (%s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE last_read_at = VALUES(last_read_at), read_count = read_count + VALUES(read_count)
+"""
+
+# Share locks on the posts a flush writes reads for: a delete_post running
+# meanwhile waits for the flush, then deletes its rows with the post's.
+EXISTING_POSTS_SQL = (
+    "SELECT id FROM Posts WHERE id IN ({ids}) LOCK IN SHARE MODE",
+    "SELECT id FROM PostsArchive WHERE id IN ({ids}) LOCK IN SHARE MODE",
+)
+
+# Every (class, user) whose feed shows the class's posts. The filters go on
+# se.class_id, the same in both halves.
+CLASS_RECIPIENTS_SQL = """
+    SELECT se.class_id AS class_id, s.user_id AS user_id
+    FROM StudentEnrollments se
+    JOIN Students s ON s.id = se.student_id
+    WHERE s.user_id IS NOT NULL{student_filter}
+    UNION
+    SELECT se.class_id AS class_id, psl.parent_user_id AS user_id
+    FROM StudentEnrollments se
+    JOIN ParentStudentLinks psl ON psl.student_id = se.student_id
+    WHERE TRUE{parent_filter}
+"""
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def read_rate(readers, recipients):
+    return round(readers / recipients, 4) if recipients else None
+
+
+# -----------------
+# Write Path
+# -----------------
+def _existing_posts(cursor, post_ids):
+    """The live or archived posts among `post_ids`, share-locked until the transaction ends."""
+    found = set()
+    for sql in EXISTING_POSTS_SQL:
+        cursor.execute(sql.format(ids=_placeholders(post_ids)), post_ids)
+        found.update(row['id'] for row in cursor.fetchall())
+    return found
+
+
+class ReadBuffer:
+    """Reads waiting to be written, keyed by (shard, post_id, user_id).
+
+    `pools` maps shard names to their primaries' pools. Each pending pair
+    holds its first and last read time and how many reads it stands for.
+    """
+
+    def __init__(self, pools, flush_size=1000, flush_interval=5.0, max_pending=100000, log=None):
+        self.pools = pools
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.log = log
+        self._pending = {}
+        self._lock = threading.Lock()
+        # One flush at a time, so a pair's writes keep their order.
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+        self._stats = {'reads': 0, 'coalesced': 0, 'dropped': 0, 'flushes': 0, 'rows_written': 0,
+                       'deleted_posts': 0, 'errors': 0}
+
+    def record(self, shard, user_id, post_ids):
+        """Counts one read of each post by the user; never touches the database."""
+        now = _utcnow()
+        with self._lock:
+            for post_id in post_ids:
+                key = (shard, post_id, user_id)
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry[1] = now
+                    entry[2] += 1
+                    self._stats['coalesced'] += 1
+                elif len(self._pending) < self.max_pending:
+                    self._pending[key] = [now, now, 1]
+                else:
+                    self._stats['dropped'] += 1
+            self._stats['reads'] += len(post_ids)
+            full = len(self._pending) >= self.flush_size
+            start = self._thread is None and not self._closed
+            if start:
+                self._thread = threading.Thread(target=self._run, name='read-receipts', daemon=True)
+        if start:
+            self._thread.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                if self.log is not None:
+                    self.log(f'Writing read receipts failed: {e}')
+
+    def flush(self):
+        """Writes every pending read now; returns how many rows were upserted.
+
+        A shard that fails keeps its reads pending for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            by_shard = {}
+            for (shard, post_id, user_id), (first, last, count) in sorted(pending.items()):
+                by_shard.setdefault(shard, []).append((post_id, user_id, first, last, count))
+
+            written = skipped = 0
+            for shard, rows in by_shard.items():
+                try:
+                    count = self._write(self.pools[shard], rows)
+                    written += count
+                    skipped += len(rows) - count
+                except Exception as e:
+                    self._requeue(shard, rows)
+                    with self._lock:
+                        self._stats['errors'] += 1
+                    if self.log is not None:
+                        self.log(f'Writing {len(rows)} read receipts to {shard} failed: {e}')
+            with self._lock:
+                self._stats['flushes'] += 1
+                self._stats['rows_written'] += written
+                self._stats['deleted_posts'] += skipped
+            return written
+
+    def _write(self, pool, rows):
+        """Upserts the rows of posts that still exist; returns how many that was."""
+        written = 0
+        connection = pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                for start in range(0, len(rows), WRITE_CHUNK_SIZE):
+                    chunk = rows[start:start + WRITE_CHUNK_SIZE]
+                    existing = _existing_posts(cursor, sorted({row[0] for row in chunk}))
+                    chunk = [row for row in chunk if row[0] in existing]
+                    if chunk:
+                        cursor.executemany(UPSERT_READS_SQL, chunk)
+                        written += len(chunk)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            pool.release(connection, discard=True)
+            raise
+        pool.release(connection)
+        return written
+
+    def _requeue(self, shard, rows):
+        with self._lock:
+            for post_id, user_id, first, last, count in rows:
+                key = (shard, post_id, user_id)
+                entry = self._pending.get(key)
+                if entry is not None:
+                    entry[0] = min(entry[0], first)
+                    entry[2] += count
+                elif len(self._pending) < self.max_pending:
+                    self._pending[key] = [first, last, count]
+                else:
+                    self._stats['dropped'] += count
+
+    def close(self):
+        """Stops the background thread and writes out the remaining reads."""
+        self._closed = True
+        self._wake.set()
+        return self.flush()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = len(self._pending)
+        return snapshot
+
+
+# -----------------
+# Reports
+# -----------------
+def recipients_statement(class_filter='', params=()):
+    """CLASS_RECIPIENTS_SQL narrowed by `class_filter` on se.class_id, with params."""
+    sql = CLASS_RECIPIENTS_SQL.format(student_filter=class_filter, parent_filter=class_filter)
+    return sql, tuple(params) * 2
+
+
+def school_recipients_statement(school_id, class_id=None):
+    class_filter = " AND se.class_id IN (SELECT id FROM Classes WHERE school_id = %s)"
+    params = [school_id]
+    if class_id is not None:
+        class_filter += " AND se.class_id = %s"
+        params.append(class_id)
+    return recipients_statement(class_filter, params)
+
+
+def post_counts_statement(posts):
+    """Recipients and readers of each of `posts` (dicts with id and class_id)."""
+    class_ids = sorted({post['class_id'] for post in posts})
+    recipients, params = recipients_statement(f" AND se.class_id IN ({_placeholders(class_ids)})", class_ids)
+    post_ids = [post['id'] for post in posts]
+    return f"""
+        SELECT p.id AS post_id, COUNT(r.user_id) AS recipients, COUNT(pr.user_id) AS readers
+        FROM Posts p
+        JOIN ({recipients}) r ON r.class_id = p.class_id
+        LEFT JOIN PostReads pr ON pr.post_id = p.id AND pr.user_id = r.user_id
+        WHERE p.id IN ({_placeholders(post_ids)})
+        GROUP BY p.id
+    """, params + tuple(post_ids)
+
+
+def class_recipient_counts_statement(school_id, class_id=None):
+    recipients, params = school_recipients_statement(school_id, class_id)
+    return f"SELECT r.class_id, COUNT(*) AS recipients FROM ({recipients}) r GROUP BY r.class_id", params
+
+
+def class_read_counts_statement(school_id, class_id=None):
+    """Posts per class, and reads of them by users who are still recipients."""
+    recipients, params = school_recipients_statement(school_id, class_id)
+    class_filter = " AND c.id = %s" if class_id is not None else ""
+    return f"""
+        SELECT c.id AS class_id, c.class_name, COUNT(DISTINCT p.id) AS posts, COUNT(r.user_id) AS readers
+        FROM Classes c
+        LEFT JOIN Posts p ON p.class_id = c.id
+        LEFT JOIN PostReads pr ON pr.post_id = p.id
+        LEFT JOIN ({recipients}) r ON r.class_id = c.id AND r.user_id = pr.user_id
+        WHERE c.school_id = %s{class_filter}
+        GROUP BY c.id, c.class_name
+        ORDER BY c.class_name, c.id
+    """, params + (school_id,) + ((class_id,) if class_id is not None else ())
+
+
+def unread_statement(post_id, class_id):
+    recipients, params = recipients_statement(" AND se.class_id = %s", [class_id])
+    return f"""
+        SELECT u.id, u.first_name, u.last_name, u.email, u.role
+        FROM ({recipients}) r
+        JOIN Users u ON u.id = r.user_id
+        LEFT JOIN PostReads pr ON pr.post_id = %s AND pr.user_id = r.user_id
+        WHERE pr.user_id IS NULL
+        ORDER BY u.last_name, u.first_name, u.id
+    """, params + (post_id,)
+
+
+def post_read_counts(cursor, posts):
+    """{post_id: (recipients, readers)} for a page of posts, in one query."""
+    if not posts:
+        return {}
+    cursor.execute(*post_counts_statement(posts))
+    return {row['post_id']: (row['recipients'], row['readers']) for row in cursor.fetchall()}
+
+
+def class_read_rates(cursor, school_id, class_id=None):
+    """Read rates of the school's classes: reads over posts times recipients."""
+    cursor.execute(*class_recipient_counts_statement(school_id, class_id))
+    recipients = {row['class_id']: row['recipients'] for row in cursor.fetchall()}
+    cursor.execute(*class_read_counts_statement(school_id, class_id))
+    classes = []
+    for row in cursor.fetchall():
+        deliveries = row['posts'] * recipients.get(row['class_id'], 0)
+        classes.append({'class_id': row['class_id'], 'class_name': row['class_name'], 'posts': row['posts'],
+                        'recipients': recipients.get(row['class_id'], 0), 'reads': row['readers'],
+                        'read_rate': read_rate(row['readers'], deliveries)})
+    return classes
+
+
+def unread_recipients(cursor, post_id, class_id):
+    """Returns (recipient count, [recipients who haven't read the post])."""
+    recipients, params = recipients_statement(" AND se.class_id = %s", [class_id])
+    cursor.execute(f"SELECT COUNT(*) AS recipients FROM ({recipients}) r", params)
+    total = cursor.fetchone()['recipients']
+    cursor.execute(*unread_statement(post_id, class_id))
+    return total, cursor.fetchall()
@@ -0,0 +1,261 @@
+"""Bulk roster import for a school: teachers, classes and students.
+
+Records arrive as CSV or NDJSON and are parsed lazily, so the upload is
+never held in memory. They are processed in chunks: each chunk is
+validated with a handful of set-based lookups, written with executemany
+and committed as its own transaction. Every input row gets an entry in
+the result report.
+
+Record types and their fields:
+
+    teacher  first_name, last_name, email, password
+    class    class_name, teacher_email
+    student  first_name, last_name, parent_email, class_name
+
+Classes may reference teachers, and students classes, created earlier in
+the same file.
+"""
+import codecs
+import csv
+import json
+from itertools import islice
+
+from access_codes import generate_unique_access_codes
+
+REQUIRED_FIELDS = {
+    'teacher': ('first_name', 'last_name', 'email', 'password'),
+    'class': ('class_name', 'teacher_email'),
+    'student': ('first_name', 'last_name', 'parent_email', 'class_name'),
+}
+
+
+# -----------------
+# Parsing
+# -----------------
+def parse_csv(stream):
+    """Yields (row_number, record, error) for each data row of a CSV stream."""
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8'))
+    for row_number, record in enumerate(reader, start=1):
+        yield row_number, {key.strip(): value for key, value in record.items() if key}, None
+
+
+def parse_ndjson(stream):
+    """Yields (row_number, record, error) for each non-blank NDJSON line."""
+    row_number = 0
+    for line in codecs.iterdecode(stream, 'utf-8'):
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(record, dict):
+            yield row_number, None, 'Each line must be a JSON object'
+            continue
+        yield row_number, record, None
+
+
+# -----------------
+# Import
+# -----------------
+def _field(record, name):
+    return str(record.get(name) or '').strip()
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+class RosterImport:
+    """Imports parsed roster records for one school."""
+
+    def __init__(self, connection, school_id, hasher, chunk_size=500, registered_elsewhere=None):
+        self.connection = connection
+        self.school_id = school_id
+        self.hasher = hasher
+        self.chunk_size = chunk_size
+        # Returns which of a list of emails other databases (shards) have users for.
+        self.registered_elsewhere = registered_elsewhere
+        self.results = []
+        # Natural keys created by earlier chunks of this file, to catch duplicates.
+        self._seen_emails = set()
+        self._seen_class_names = set()
+
+    def run(self, rows):
+        """Imports every (row_number, record, error) and returns the per-row report."""
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+        return self.results
+
+    def summary(self):
+        counts = {'total': len(self.results), 'created': 0, 'failed': 0}
+        for result in self.results:
+            counts['created' if result['status'] == 'created' else 'failed'] += 1
+        return counts
+
+    def _import_chunk(self, chunk):
+        by_type = {record_type: [] for record_type in REQUIRED_FIELDS}
+        chunk_results = []
+
+        for row_number, record, error in chunk:
+            result = {'row': row_number, 'status': 'error'}
+            chunk_results.append(result)
+            if error:
+                result['message'] = error
+                continue
+
+            record_type = _field(record, 'type').lower()
+            result['type'] = record_type
+            if record_type not in REQUIRED_FIELDS:
+                result['message'] = 'Unknown record type'
+                continue
+            missing = [name for name in REQUIRED_FIELDS[record_type] if not _field(record, name)]
+            if missing:
+                result['message'] = f"Missing required fields: {', '.join(missing)}"
+                continue
+            by_type[record_type].append((record, result))
+
+        # Results are only marked created, and the chunk's keys only count
+        # as taken, once the chunk has committed.
+        pending, emails, class_names = [], set(), set()
+        try:
+            teachers = self._prepare_teachers(by_type['teacher'], emails)
+            with self.connection.cursor() as cursor:
+                pending += self._insert_teachers(cursor, teachers)
+                pending += self._import_classes(cursor, by_type['class'], class_names)
+                pending += self._import_students(cursor, by_type['student'])
+            self.connection.commit()
+        except Exception as e:
+            self.connection.rollback()
+            for result in chunk_results:
+                result.setdefault('message', f'Chunk failed and was rolled back: {e}')
+            self.results.extend(chunk_results)
+            return
+
+        self._seen_emails |= emails
+        self._seen_class_names |= class_names
+        for result, details in pending:
+            result['status'] = 'created'
+            result.update(details)
+        self.results.extend(chunk_results)
+
+    def _prepare_teachers(self, rows, claimed):
+        """Picks the teachers whose email is free and hashes their passwords.
+
+        Runs before the chunk's write transaction opens, so bcrypt never
+        holds its locks. An email taken in between fails the insert, and
+        with it the chunk.
+        """
+        emails = [_field(record, 'email') for record, _ in rows]
+        if not emails:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT email FROM Users WHERE email IN ({_placeholders(emails)})", emails)
+            existing = {row['email'] for row in cursor.fetchall()}
+        # End the read before hashing.
+        self.connection.rollback()
+        if self.registered_elsewhere is not None:
+            existing |= self.registered_elsewhere(emails)
+
+        accepted = []
+        for (record, result), email in zip(rows, emails):
+            if email in existing or email in self._seen_emails or email in claimed:
+                result['message'] = 'Email already registered'
+                continue
+            claimed.add(email)
+            accepted.append((record, result, email))
+        hashes = self.hasher.hash_many([_field(record, 'password') for record, _, _ in accepted]) if accepted else []
+        return [(record, result, email, password_hash)
+                for (record, result, email), password_hash in zip(accepted, hashes)]
+
+    def _insert_teachers(self, cursor, teachers):
+        if not teachers:
+            return []
+        sql = "INSERT INTO Users (first_name, last_name, email, password_hash, role, school_id) VALUES (%s, %s, %s, %s, %s, %s)"
+        cursor.executemany(sql, [
+            (_field(record, 'first_name'), _field(record, 'last_name'), email, password_hash, 'teacher', self.school_id)
+            for record, _, email, password_hash in teachers
+        ])
+        return [(result, {'email': email}) for _, result, email, _ in teachers]
+
+    def _import_classes(self, cursor, rows, claimed):
+        if not rows:
+            return []
+        teacher_emails = sorted({_field(record, 'teacher_email') for record, _ in rows})
+        cursor.execute(
+            f"SELECT id, email FROM Users WHERE role = 'teacher' AND school_id = %s AND email IN ({_placeholders(teacher_emails)})",
+            [self.school_id] + teacher_emails)
+        teacher_ids = {row['email']: row['id'] for row in cursor.fetchall()}
+
+        class_names = sorted({_field(record, 'class_name') for record, _ in rows})
+        cursor.execute(
+            f"SELECT class_name FROM Classes WHERE school_id = %s AND class_name IN ({_placeholders(class_names)})",
+            [self.school_id] + class_names)
+        existing = {row['class_name'] for row in cursor.fetchall()}
+
+        accepted = []
+        for record, result in rows:
+            class_name = _field(record, 'class_name')
+            teacher_id = teacher_ids.get(_field(record, 'teacher_email'))
+            if teacher_id is None:
+                result['message'] = 'Teacher not found in this school'
+            elif class_name in existing or class_name in self._seen_class_names or class_name in claimed:
+                result['message'] = 'Class already exists'
+            else:
+                claimed.add(class_name)
+                accepted.append((result, class_name, teacher_id))
+        if not accepted:
+            return []
+
+        cursor.executemany(
+            "INSERT INTO Classes (class_name, teacher_id, school_id) VALUES (%s, %s, %s)",
+            [(class_name, teacher_id, self.school_id) for _, class_name, teacher_id in accepted])
+        return [(result, {'class_name': class_name}) for result, class_name, _ in accepted]
+
+    def _import_students(self, cursor, rows):
+        if not rows:
+            return []
+        class_names = sorted({_field(record, 'class_name') for record, _ in rows})
+        cursor.execute(
+            f"SELECT id, class_name FROM Classes WHERE school_id = %s AND class_name IN ({_placeholders(class_names)})",
+            [self.school_id] + class_names)
+        class_ids = {}
+        for row in cursor.fetchall():
+            # A name shared by two classes can't be resolved unambiguously.
+            class_ids[row['class_name']] = None if row['class_name'] in class_ids else row['id']
+
+        accepted = []
+        for record, result in rows:
+            class_name = _field(record, 'class_name')
+            if class_name not in class_ids:
+                result['message'] = 'Class not found in this school'
+            elif class_ids[class_name] is None:
+                result['message'] = 'Class name is ambiguous in this school'
+            else:
+                accepted.append((record, result, class_ids[class_name]))
+        if not accepted:
+            return []
+
+        # Students are inserted one statement at a time because their ids
+        # are needed below and multi-row inserts don't guarantee
+        # consecutive auto-increment values.
+        student_ids = []
+        for record, _, _ in accepted:
+            cursor.execute("INSERT INTO Students (first_name, last_name, school_id) VALUES (%s, %s, %s)",
+                           (_field(record, 'first_name'), _field(record, 'last_name'), self.school_id))
+            student_ids.append(cursor.lastrowid)
+
+        codes = generate_unique_access_codes(cursor, len(accepted))
+        cursor.executemany("INSERT INTO StudentEnrollments (student_id, class_id) VALUES (%s, %s)",
+                           [(student_id, class_id) for student_id, (_, _, class_id) in zip(student_ids, accepted)])
+        cursor.executemany("INSERT INTO AccessCodes (code, student_id, parent_email) VALUES (%s, %s, %s)",
+                           [(code, student_id, _field(record, 'parent_email'))
+                            for code, student_id, (record, _, _) in zip(codes, student_ids, accepted)])
+        return [(result, {'student_id': student_id, 'access_code': code})
+                for (_, result, _), student_id, code in zip(accepted, student_ids, codes)]
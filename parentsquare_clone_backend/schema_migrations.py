@@ -0,0 +1,135 @@
+"""Versioned schema migrations.
+
+Migrations live in migrations/ as pairs of plain SQL scripts named
+NNNN_description.up.sql and NNNN_description.down.sql, or, when a change
+depends on what the database already holds, as a module NNNN_description.py
+defining upgrade(cursor) and downgrade(cursor). Applied versions are
+recorded in the SchemaMigrations table. MySQL commits DDL implicitly,
+so a migration that fails halfway must be fixed by hand before re-running.
+"""
+import importlib.util
+import os
+import re
+from collections import namedtuple
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+Migration = namedtuple('Migration', ['version', 'name', 'up_path', 'down_path'])
+
+_FILENAME = re.compile(r'^(\d{4})_(\w+)\.(up|down)\.sql$')
+_MODULE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class MigrationError(Exception):
+    """Raised for a missing, duplicated or unknown migration."""
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """Returns every migration in `directory`, ordered by version."""
+    found = {}
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename) or _MODULE.match(filename)
+        if not match:
+            continue
+        version, name = int(match.group(1)), match.group(2)
+        # A module is both the up and the down step.
+        directions = match.groups()[2:] or ('up', 'down')
+        entry = found.setdefault(version, {'name': name})
+        if entry['name'] != name or any(direction in entry for direction in directions):
+            raise MigrationError(f'Conflicting files for migration {version:04d}')
+        for direction in directions:
+            entry[direction] = os.path.join(directory, filename)
+
+    migrations = []
+    for version in sorted(found):
+        entry = found[version]
+        if 'up' not in entry or 'down' not in entry:
+            raise MigrationError(f'Migration {version:04d} needs both an up and a down script')
+        migrations.append(Migration(version, entry['name'], entry['up'], entry['down']))
+    return migrations
+
+
+def split_statements(sql):
+    """Splits a script on semicolons that end a line, dropping '--' comments."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    statements = re.split(r';\s*(?:\n|$)', '\n'.join(lines))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def _run_script(cursor, path, direction):
+    if path.endswith('.py'):
+        name = os.path.splitext(os.path.basename(path))[0]
+        spec = importlib.util.spec_from_file_location(f'migration_{name}', path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        (module.upgrade if direction == 'up' else module.downgrade)(cursor)
+        return
+    with open(path, encoding='utf-8') as f:
+        for statement in split_statements(f.read()):
+            cursor.execute(statement)
+
+
+def ensure_version_table(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS SchemaMigrations (
+                version INT NOT NULL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    connection.commit()
+
+
+def applied_versions(connection):
+    ensure_version_table(connection)
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT version FROM SchemaMigrations ORDER BY version")
+        return [row['version'] for row in cursor.fetchall()]
+
+
+def upgrade(connection, target=None, directory=MIGRATIONS_DIR, log=print):
+    """Applies pending migrations up to `target` (default: the latest)."""
+    applied = set(applied_versions(connection))
+    done = []
+    for migration in discover(directory):
+        if migration.version in applied or (target is not None and migration.version > target):
+            continue
+        log(f'Applying {migration.version:04d}_{migration.name}')
+        with connection.cursor() as cursor:
+            _run_script(cursor, migration.up_path, 'up')
+            cursor.execute("INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s)",
+                           (migration.version, migration.name))
+        connection.commit()
+        done.append(migration.version)
+    return done
+
+
+def downgrade(connection, target, directory=MIGRATIONS_DIR, log=print):
+    """Reverts applied migrations newer than `target`, newest first."""
+    applied = set(applied_versions(connection))
+    done = []
+    for migration in reversed(discover(directory)):
+        if migration.version not in applied or migration.version <= target:
+            continue
+        log(f'Reverting {migration.version:04d}_{migration.name}')
+        with connection.cursor() as cursor:
+            _run_script(cursor, migration.down_path, 'down')
+            cursor.execute("DELETE FROM SchemaMigrations WHERE version = %s", (migration.version,))
+        connection.commit()
+        done.append(migration.version)
+    return done
+
+
+def stamp(connection, version, directory=MIGRATIONS_DIR):
+    """Marks migrations up to `version` as applied without running them."""
+    known = {migration.version: migration for migration in discover(directory)}
+    if version not in known:
+        raise MigrationError(f'Unknown migration {version:04d}')
+    applied = set(applied_versions(connection))
+    with connection.cursor() as cursor:
+        for migration_version, migration in sorted(known.items()):
+            if migration_version <= version and migration_version not in applied:
+                cursor.execute("INSERT INTO SchemaMigrations (version, name) VALUES (%s, %s)",
+                               (migration.version, migration.name))
+    connection.commit()
@@ -0,0 +1,395 @@
+"""In-memory inverted index over post titles and contents for /api/search.
+
+Each worker process holds its own index. It is built from the Posts and
+PostsArchive tables in id-ordered batches the first time it is needed,
+then kept current from the post event broker: every post_created and
+post_deleted, from any worker when EVENTS_BACKEND=database, is applied as
+it is dispatched. Archiving moves a post between tables but keeps it
+searchable, so the index ignores it.
+
+Postings are parallel arrays of post ids and term weights, sorted by post
+id, so a million posts fit in a few hundred megabytes. Each class also
+keeps a sorted array of its post ids. A query starts from whichever is
+shorter, the rarest term's postings or the caller's classes' posts, and
+narrows that set by each other term with C-level set intersection or, when
+the term is far more common, binary search. Per-post class ids and lengths live in
+arrays indexed by post id, one pair per shard id range (see shards.py), so
+sharded ids far apart cost no memory in between; class 0 marks a post that
+is absent or deleted. Deleted posts leave their postings behind and
+are skipped at query time until the next rebuild.
+
+Queries match every term, the last one as a prefix ("field trip fo"),
+and are ranked with BM25. Title words count TITLE_WEIGHT times.
+"""
+import base64
+import heapq
+import json
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left, insort
+
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidPageRequest
+from shards import SHARD_ID_BITS
+
+TITLE_WEIGHT = 3
+MIN_PREFIX = 2
+MAX_PREFIX_TERMS = 50
+BM25_K1 = 1.2
+BM25_B = 0.75
+REBUILD_BATCH_SIZE = 5000
+# Postings up to this many times longer than the candidate set are
+# intersected by scanning rather than by binary search per candidate.
+SCAN_FACTOR = 20
+BLOCK_MASK = (1 << SHARD_ID_BITS) - 1
+
+# Live and archived posts as one id-ordered stream. A single statement reads
+# one snapshot, so a post archived during a rebuild is seen exactly once.
+REBUILD_SQL = """
+    SELECT id, class_id, title, content FROM (
+        SELECT * FROM (SELECT id, class_id, title, content FROM Posts WHERE id > %s ORDER BY id LIMIT %s) live
+        UNION ALL
+        SELECT * FROM (SELECT id, class_id, title, content FROM PostsArchive WHERE id > %s ORDER BY id LIMIT %s) archived
+    ) posts ORDER BY id LIMIT %s
+"""
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+STOPWORDS = frozenset('a an and are as at be by for from has have in is it of on or that the this to was we will with you your'.split())
+
+
+def tokenize(text):
+    return [token for token in _TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def parse_query(text):
+    """Returns (exact terms, prefix term or None) for a search string."""
+    tokens = _TOKEN.findall(text.lower())
+    if not tokens:
+        return [], None
+    # The last word may still be being typed; stopwords are dropped from the rest.
+    exact = [token for token in tokens[:-1] if token not in STOPWORDS]
+    last = tokens[-1]
+    if len(last) < MIN_PREFIX:
+        return exact, None
+    if last in STOPWORDS and exact:
+        return exact, None
+    return exact, last
+
+
+def encode_search_cursor(score, post_id):
+    raw = json.dumps([score, post_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_search_cursor(token):
+    try:
+        score, post_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return float(score), int(post_id)
+    except (ValueError, TypeError):
+        raise InvalidPageRequest('Invalid cursor')
+
+
+def parse_search_args(args):
+    """Returns (query text, limit, after) from request args."""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise InvalidPageRequest('limit must be an integer')
+    if limit < 1:
+        raise InvalidPageRequest('limit must be at least 1')
+    token = args.get('cursor')
+    return args.get('q', ''), min(limit, MAX_PAGE_SIZE), decode_search_cursor(token) if token else None
+
+
+class _Postings:
+    __slots__ = ('post_ids', 'weights')
+
+    def __init__(self):
+        self.post_ids = array('I')
+        self.weights = array('H')
+
+    def add(self, post_id, weight):
+        if not self.post_ids or self.post_ids[-1] < post_id:
+            self.post_ids.append(post_id)
+            self.weights.append(weight)
+        else:
+            # Events from other workers can arrive slightly out of id order.
+            index = bisect_left(self.post_ids, post_id)
+            self.post_ids.insert(index, post_id)
+            self.weights.insert(index, weight)
+
+    def weight_of(self, post_id):
+        index = bisect_left(self.post_ids, post_id)
+        if index < len(self.post_ids) and self.post_ids[index] == post_id:
+            return self.weights[index]
+        return 0
+
+
+def _intersect(post_ids, entry):
+    """The members of `post_ids` (a set or set-like view) that appear in `entry`'s postings."""
+    if len(entry.post_ids) <= SCAN_FACTOR * len(post_ids):
+        # Scanning the postings runs in C; it wins unless they are far longer.
+        return set(post_ids).intersection(entry.post_ids) if not isinstance(post_ids, set) \
+            else post_ids.intersection(entry.post_ids)
+    return {post_id for post_id in post_ids if entry.weight_of(post_id)}
+
+
+class SearchIndex:
+    """Ranked, permission-filtered full-text search over posts.
+
+    `pools` are the connection pools the index is rebuilt from, one per shard.
+    """
+
+    def __init__(self, pools, batch_size=REBUILD_BATCH_SIZE):
+        self.pools = list(pools)
+        self.batch_size = batch_size
+        self._terms = {}
+        self._sorted_terms = []
+        self._class_posts = {}
+        # Indexed by post_id >> SHARD_ID_BITS, then by post_id & BLOCK_MASK.
+        self._class_of = []
+        self._length = []
+        self._live = 0
+        self._total_length = 0
+        # Ids deleted while a rebuild was loading them.
+        self._deleted_during_build = set()
+        self._state = 'empty'
+        self._lock = threading.RLock()
+        self._stats = {'queries': 0, 'added': 0, 'deleted': 0, 'rebuilds': 0}
+
+    # -----------------
+    # Building
+    # -----------------
+    @property
+    def ready(self):
+        return self._state == 'ready'
+
+    def ensure_built(self, background=True):
+        """Starts the rebuild on first use; returns True once the index can answer queries."""
+        if self._state == 'ready':
+            return True
+        with self._lock:
+            if self._state == 'ready':
+                return True
+            if self._state == 'building':
+                return False
+            self._state = 'building'
+        if background:
+            threading.Thread(target=self.rebuild, name='search-index-rebuild', daemon=True).start()
+            return False
+        self.rebuild()
+        return True
+
+    def rebuild(self):
+        """Loads every live and archived post from every shard, then marks the index ready."""
+        with self._lock:
+            self._state = 'building'
+        try:
+            for pool in self.pools:
+                self._load(pool)
+        except Exception:
+            with self._lock:
+                self._state = 'empty'
+            raise
+        with self._lock:
+            self._deleted_during_build.clear()
+            self._state = 'ready'
+            self._stats['rebuilds'] += 1
+
+    def _load(self, pool):
+        last_id = 0
+        while True:
+            connection = pool.acquire()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute(REBUILD_SQL, (last_id, self.batch_size) * 2 + (self.batch_size,))
+                    rows = cursor.fetchall()
+            finally:
+                pool.release(connection)
+            if not rows:
+                return
+            with self._lock:
+                for row in rows:
+                    if row['id'] not in self._deleted_during_build:
+                        self._add(row['id'], row['class_id'], row['title'], row['content'])
+            last_id = rows[-1]['id']
+
+    # -----------------
+    # Updates
+    # -----------------
+    def add(self, post_id, class_id, title, content):
+        with self._lock:
+            self._add(post_id, class_id, title, content)
+
+    def delete(self, post_id):
+        with self._lock:
+            if self._state == 'building':
+                self._deleted_during_build.add(post_id)
+            if self._class_at(post_id):
+                block, offset = post_id >> SHARD_ID_BITS, post_id & BLOCK_MASK
+                self._class_of[block][offset] = 0
+                self._live -= 1
+                self._total_length -= self._length[block][offset]
+                self._stats['deleted'] += 1
+
+    def apply_event(self, event):
+        """Broker listener: applies post_created and post_deleted events."""
+        if event.type == 'post_created':
+            data = json.loads(event.data)
+            self.add(data['id'], data['class_id'], data['title'], data['content'])
+        elif event.type == 'post_deleted':
+            self.delete(json.loads(event.data)['id'])
+
+    def _class_at(self, post_id):
+        """The class of an indexed post, or 0."""
+        block, offset = post_id >> SHARD_ID_BITS, post_id & BLOCK_MASK
+        if block < len(self._class_of) and offset < len(self._class_of[block]):
+            return self._class_of[block][offset]
+        return 0
+
+    def _add(self, post_id, class_id, title, content):
+        if self._class_at(post_id):
+            return  # Already indexed: the rebuild and an event both saw it.
+        weights = {}
+        for token in tokenize(title or ''):
+            weights[token] = weights.get(token, 0) + TITLE_WEIGHT
+        for token in tokenize(content or ''):
+            weights[token] = weights.get(token, 0) + 1
+        for term, weight in weights.items():
+            postings = self._terms.get(term)
+            if postings is None:
+                postings = self._terms[term] = _Postings()
+                insort(self._sorted_terms, term)
+            postings.add(post_id, min(weight, 65535))
+        class_posts = self._class_posts.get(class_id)
+        if class_posts is None:
+            class_posts = self._class_posts[class_id] = array('I')
+        if not class_posts or class_posts[-1] < post_id:
+            class_posts.append(post_id)
+        else:
+            class_posts.insert(bisect_left(class_posts, post_id), post_id)
+
+        block, offset = post_id >> SHARD_ID_BITS, post_id & BLOCK_MASK
+        while len(self._class_of) <= block:
+            self._class_of.append(array('I'))
+            self._length.append(array('H'))
+        class_of, lengths = self._class_of[block], self._length[block]
+        if offset >= len(class_of):
+            grow = offset + 1 - len(class_of) + 1024
+            class_of.extend(array('I', bytes(4 * grow)))
+            lengths.extend(array('H', bytes(2 * grow)))
+        length = min(sum(weights.values()), 65535)
+        class_of[offset] = class_id
+        lengths[offset] = length
+        self._live += 1
+        self._total_length += length
+        self._stats['added'] += 1
+
+    # -----------------
+    # Queries
+    # -----------------
+    def _prefix_terms(self, prefix):
+        """The indexed terms starting with `prefix`, most common first."""
+        index = bisect_left(self._sorted_terms, prefix)
+        matches = []
+        while index < len(self._sorted_terms) and self._sorted_terms[index].startswith(prefix):
+            matches.append(self._sorted_terms[index])
+            index += 1
+        matches.sort(key=lambda term: -len(self._terms[term].post_ids))
+        return matches[:MAX_PREFIX_TERMS]
+
+    def search(self, text, class_ids, limit=DEFAULT_PAGE_SIZE, after=None):
+        """Returns ([(post_id, score), ...], next (score, post_id) or None) within `class_ids`."""
+        exact, prefix = parse_query(text)
+        allowed = set(class_ids)
+        with self._lock:
+            self._stats['queries'] += 1
+            if not allowed or (not exact and prefix is None):
+                return [], None
+            postings = [self._terms.get(term) for term in exact]
+            if any(entry is None for entry in postings):
+                return [], None
+            prefix_postings = [self._terms[term] for term in self._prefix_terms(prefix)] if prefix else []
+            if prefix and not prefix_postings:
+                return [], None
+
+            scored = self._score(postings, prefix_postings, allowed)
+
+        if after is not None:
+            after_score, after_id = after
+            scored = [(score, post_id) for score, post_id in scored
+                      if score < after_score or (score == after_score and post_id < after_id)]
+        top = heapq.nlargest(limit + 1, scored)
+        results = [(post_id, score) for score, post_id in top[:limit]]
+        next_after = top[limit - 1] if len(top) > limit else None
+        return results, next_after
+
+    def _score(self, postings, prefix_postings, allowed):
+        """BM25 over the allowed posts containing every exact term and one of the prefix terms.
+
+        Candidates start from the rarest term's postings or from the
+        allowed classes' posts, whichever is shorter: a parent's three
+        classes beat a common word's postings by orders of magnitude.
+        """
+        average_length = self._total_length / self._live if self._live else 1.0
+        total = max(self._live, 1)
+        blocks, length_blocks = self._class_of, self._length
+
+        def idf(entry):
+            df = len(entry.post_ids)
+            return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+        def norm(post_id):
+            length = length_blocks[post_id >> SHARD_ID_BITS][post_id & BLOCK_MASK]
+            return BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+
+        exact = sorted(postings, key=lambda entry: len(entry.post_ids))
+        class_posts = [self._class_posts[class_id] for class_id in allowed if class_id in self._class_posts]
+        by_class = sum(len(posts) for posts in class_posts)
+
+        if exact and len(exact[0].post_ids) < by_class:
+            candidates = {post_id for post_id in exact[0].post_ids
+                          if blocks[post_id >> SHARD_ID_BITS][post_id & BLOCK_MASK] in allowed}
+            rest = exact[1:]
+        else:
+            candidates = set().union(*class_posts)
+            rest = exact
+        for entry in rest:
+            candidates = _intersect(candidates, entry)
+            if not candidates:
+                return []
+
+        scores = {}
+        if exact:
+            terms = [(entry.weight_of, idf(entry) * (BM25_K1 + 1)) for entry in exact]
+            for post_id in candidates:
+                if blocks[post_id >> SHARD_ID_BITS][post_id & BLOCK_MASK] not in allowed:
+                    continue
+                post_norm = norm(post_id)
+                score = 0.0
+                for weight_of, term_idf in terms:
+                    weight = weight_of(post_id)
+                    score += term_idf * weight / (weight + post_norm)
+                scores[post_id] = score
+            candidates = scores.keys()
+        if prefix_postings:
+            # Each post scores its best-matching expansion of the prefix.
+            best = {}
+            for entry in prefix_postings:
+                term_idf = idf(entry) * (BM25_K1 + 1)
+                for post_id in _intersect(candidates, entry):
+                    if blocks[post_id >> SHARD_ID_BITS][post_id & BLOCK_MASK] not in allowed:
+                        continue
+                    weight = entry.weight_of(post_id)
+                    score = term_idf * weight / (weight + norm(post_id))
+                    if score > best.get(post_id, 0.0):
+                        best[post_id] = score
+            scores = {post_id: scores.get(post_id, 0.0) + score for post_id, score in best.items()}
+        return [(round(score, 6), post_id) for post_id, score in scores.items()]
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({'posts': self._live, 'terms': len(self._terms), 'ready': int(self._state == 'ready')})
+        return snapshot
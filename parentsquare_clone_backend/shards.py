@@ -0,0 +1,367 @@
+"""Sharding by school: each school's rows live in one of several databases.
+
+Every shard has the full schema. The 'default' shard is the database the
+app was always configured with; it also holds the SchoolShards map, which
+says where each school lives. Schools without a row are on the default
+shard, so an unsharded deployment needs no rows at all.
+
+Ids stay unique across the district because each shard numbers new rows
+from its own range (shard n from n * SHARD_ID_SPAN), so a school keeps its
+ids when it moves and caches, tokens and the search index never see a
+collision. A signed INT id leaves room for 16 shards.
+
+move_school() moves a school while it stays online: reads never stop, and
+writes are refused with a 503 only while the last changes are copied.
+"""
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_SHARD = 'default'
+SHARD_ID_BITS = 27
+SHARD_ID_SPAN = 1 << SHARD_ID_BITS
+MAX_SHARDS = 16
+
+# Tables whose AUTO_INCREMENT ids come from the shard's range.
+ID_TABLES = ('Schools', 'Users', 'Students', 'Classes', 'StudentEnrollments', 'ParentStudentLinks',
+             'AccessCodes', 'Posts', 'NotificationOutbox', 'NotificationDeliveries', 'PostAttachments')
+
+# Every row a school owns: (table, alias, key columns, query selecting the rows as alias.*).
+SCHOOL_TABLES = (
+    ('Schools', 'sc', ('id',), "SELECT sc.* FROM Schools sc WHERE sc.id = %s"),
+    ('Users', 'u', ('id',), "SELECT u.* FROM Users u WHERE u.school_id = %s"),
+    ('Students', 's', ('id',), "SELECT s.* FROM Students s WHERE s.school_id = %s"),
+    ('Classes', 'c', ('id',), "SELECT c.* FROM Classes c WHERE c.school_id = %s"),
+    ('StudentEnrollments', 'se', ('id',), """
+        SELECT se.* FROM StudentEnrollments se JOIN Classes c ON c.id = se.class_id WHERE c.school_id = %s
+    """),
+    ('ParentStudentLinks', 'psl', ('id',), """
+        SELECT psl.* FROM ParentStudentLinks psl JOIN Students s ON s.id = psl.student_id WHERE s.school_id = %s
+    """),
+    ('AccessCodes', 'ac', ('id',), """
+        SELECT ac.* FROM AccessCodes ac JOIN Students s ON s.id = ac.student_id WHERE s.school_id = %s
+    """),
+    ('Posts', 'p', ('id',), "SELECT p.* FROM Posts p JOIN Classes c ON c.id = p.class_id WHERE c.school_id = %s"),
+    ('PostsArchive', 'a', ('id',), """
+        SELECT a.* FROM PostsArchive a JOIN Classes c ON c.id = a.class_id WHERE c.school_id = %s
+    """),
+    ('FeedInbox', 'fi', ('user_id', 'created_at', 'post_id'), """
+        SELECT fi.* FROM FeedInbox fi JOIN Users u ON u.id = fi.user_id WHERE u.school_id = %s
+    """),
+    ('FeedInboxStatus', 'fs', ('user_id',), """
+        SELECT fs.* FROM FeedInboxStatus fs JOIN Users u ON u.id = fs.user_id WHERE u.school_id = %s
+    """),
+    ('NotificationOutbox', 'o', ('id',), "SELECT o.* FROM NotificationOutbox o WHERE o.school_id = %s"),
+    ('NotificationDeliveries', 'd', ('id',), "SELECT d.* FROM NotificationDeliveries d WHERE d.school_id = %s"),
+    ('PostAttachments', 'pa', ('id',), "SELECT pa.* FROM PostAttachments pa WHERE pa.school_id = %s"),
+    ('PostReads', 'pr', ('post_id', 'user_id'), """
+        SELECT pr.* FROM PostReads pr JOIN Users u ON u.id = pr.user_id WHERE u.school_id = %s
+    """),
+)
+# Rows read, and written, per statement while a school is copied or deleted.
+SYNC_BATCH_SIZE = 1000
+
+SHARD_MAP_SQL = "SELECT school_id, shard, state FROM SchoolShards"
+
+Placement = namedtuple('Placement', ['shard', 'frozen'])
+
+
+class SchoolMoving(Exception):
+    """A write reached a school whose rows are being copied to another shard."""
+
+
+def parse_shard_config(value):
+    """Parses DB_SHARDS, "name=primary[,replica...];name=...", into {name: (primary, [replicas])}."""
+    config = {}
+    for entry in filter(None, (entry.strip() for entry in (value or '').split(';'))):
+        name, _, hosts = entry.partition('=')
+        hosts = [host.strip() for host in hosts.split(',') if host.strip()]
+        name = name.strip()
+        if not name or not hosts or name == DEFAULT_SHARD or name in config:
+            raise ValueError(f'Invalid DB_SHARDS entry {entry!r}')
+        config[name] = (hosts[0], hosts[1:])
+    if len(config) + 1 > MAX_SHARDS:
+        raise ValueError(f'At most {MAX_SHARDS} shards fit in the id space')
+    return config
+
+
+def shard_id_start(index):
+    """The first id the shard at `index` (0 for the default shard) hands out."""
+    return index * SHARD_ID_SPAN + 1
+
+
+def reserve_id_range(connection, index):
+    """Points every id table's AUTO_INCREMENT at the shard's range; a no-op once rows are in it."""
+    start = shard_id_start(index)
+    with connection.cursor() as cursor:
+        for table in ID_TABLES:
+            cursor.execute(f"SELECT MAX(id) AS max_id FROM {table}")
+            max_id = cursor.fetchone()['max_id'] or 0
+            if max_id < start:
+                cursor.execute(f"ALTER TABLE {table} AUTO_INCREMENT = {int(start)}")
+    connection.commit()
+
+
+class ShardMap:
+    """Which shard each school lives on, cached per process from the SchoolShards table.
+
+    The map is reloaded from the directory (the default shard's pool) at
+    most every `ttl` seconds. Whoever changes it waits that long before
+    relying on every process having seen the change.
+    """
+
+    def __init__(self, directory_pool, shards, ttl=5.0):
+        self.directory_pool = directory_pool
+        self.shards = list(shards)
+        self.ttl = ttl
+        self._placements = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._stats = {'reloads': 0}
+
+    @property
+    def sharded(self):
+        return len(self.shards) > 1
+
+    def lookup(self, school_id):
+        """Returns the Placement (shard, frozen) of a school."""
+        if not self.sharded or school_id is None:
+            return Placement(DEFAULT_SHARD, False)
+        placements = self._current()
+        return placements.get(school_id) or Placement(DEFAULT_SHARD, False)
+
+    def _current(self):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._placements = self._load()
+                self._loaded_at = time.monotonic()
+                self._stats['reloads'] += 1
+            return self._placements
+
+    def _load(self):
+        connection = self.directory_pool.acquire()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(SHARD_MAP_SQL)
+                rows = cursor.fetchall()
+            connection.commit()
+        finally:
+            self.directory_pool.release(connection)
+        return {row['school_id']: Placement(row['shard'], row['state'] == 'frozen') for row in rows}
+
+    def placements(self):
+        """{school_id: Placement} for every mapped school."""
+        return dict(self._current()) if self.sharded else {}
+
+    def placement_for_new_school(self):
+        """The shard with the fewest schools, for a school being registered."""
+        if not self.sharded:
+            return DEFAULT_SHARD
+        counts = dict.fromkeys(self.shards, 0)
+        for placement in self._current().values():
+            if placement.shard in counts:
+                counts[placement.shard] += 1
+        return min(self.shards, key=lambda shard: counts[shard])
+
+    def assign(self, school_id, shard, state='active', connection=None):
+        """Records where a school lives; visible to every process within `ttl` seconds.
+
+        Pass `connection`, a connection to the default shard, to make the
+        change part of its transaction; the caller then commits it.
+        """
+        if shard not in self.shards:
+            raise ValueError(f'Unknown shard {shard!r}')
+        if not self.sharded:
+            return
+        if connection is not None:
+            self._write(connection, school_id, shard, state)
+        else:
+            connection = self.directory_pool.acquire()
+            try:
+                self._write(connection, school_id, shard, state)
+                connection.commit()
+            except Exception:
+                connection.rollback()
+                raise
+            finally:
+                self.directory_pool.release(connection)
+        with self._lock:
+            self._loaded_at = None
+
+    def _write(self, connection, school_id, shard, state):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM SchoolShards WHERE school_id = %s", (school_id,))
+            cursor.execute("INSERT INTO SchoolShards (school_id, shard, state) VALUES (%s, %s, %s)",
+                           (school_id, shard, state))
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['shards'] = len(self.shards)
+            snapshot['mapped_schools'] = len(self._placements)
+            snapshot['frozen_schools'] = sum(1 for placement in self._placements.values() if placement.frozen)
+        return snapshot
+
+
+# -----------------
+# Moving a school
+# -----------------
+def _key(row, keys):
+    return tuple(row[key] for key in keys)
+
+
+def _school_rows(cursor, alias, keys, query, school_id, batch_size):
+    """Yields a school's rows of one table in key order, reading `batch_size` at a time.
+
+    Each batch resumes after the last key of the one before (keyset
+    paging), so no statement reads more than a batch however big the
+    school is. The row-value comparison is spelled out term by term,
+    which MySQL can turn into an index range.
+    """
+    order = ', '.join(f'{alias}.{key}' for key in keys)
+    last = None
+    while True:
+        sql, params = query, [school_id]
+        if last is not None:
+            terms = []
+            for i, key in enumerate(keys):
+                terms.append(' AND '.join([f'{alias}.{earlier} = %s' for earlier in keys[:i]] + [f'{alias}.{key} > %s']))
+                params += list(last[:i + 1])
+            sql += ' AND (' + ' OR '.join(f'({term})' for term in terms) + ')'
+        cursor.execute(f"{sql} ORDER BY {order} LIMIT %s", params + [batch_size])
+        rows = cursor.fetchall()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = _key(rows[-1], keys)
+
+
+def _delete_keys(cursor, table, keys, doomed):
+    where = ' AND '.join(f'{key} = %s' for key in keys)
+    cursor.executemany(f"DELETE FROM {table} WHERE {where}", doomed)
+
+
+def _insert_rows(cursor, table, rows):
+    columns = list(rows[0])
+    cursor.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+        [tuple(row[column] for column in columns) for row in rows])
+
+
+def _apply(cursor, table, keys, stale, missing):
+    """Writes one batch of differences and empties the lists; returns the rows written."""
+    count = len(stale) + len(missing)
+    if stale:
+        _delete_keys(cursor, table, keys, stale)
+    if missing:
+        _insert_rows(cursor, table, missing)
+    stale.clear()
+    missing.clear()
+    return count
+
+
+def sync_school(source, target, school_id, batch_size=SYNC_BATCH_SIZE):
+    """Makes the target's copy of a school's rows match the source; returns rows written per table.
+
+    Only differences are written: missing and changed rows are (re)inserted
+    and rows the source no longer has are deleted, so a second pass after
+    writes are frozen copies just what changed since the first. Both sides
+    are read in key order, `batch_size` rows at a time, and merged like two
+    sorted lists, so memory stays flat however big the school is.
+    """
+    written = {}
+    # Read from fresh snapshots, not ones left open by an earlier pass.
+    source.commit()
+    target.commit()
+    with source.cursor() as source_cursor, target.cursor() as target_cursor, target.cursor() as write_cursor:
+        for table, alias, keys, query in SCHOOL_TABLES:
+            wanted = _school_rows(source_cursor, alias, keys, query, school_id, batch_size)
+            present = _school_rows(target_cursor, alias, keys, query, school_id, batch_size)
+            stale, missing = [], []
+            written[table] = 0
+            want, have = next(wanted, None), next(present, None)
+            while want is not None or have is not None:
+                want_key = None if want is None else _key(want, keys)
+                have_key = None if have is None else _key(have, keys)
+                if have is None or (want is not None and want_key < have_key):
+                    missing.append(want)
+                    want = next(wanted, None)
+                elif want is None or have_key < want_key:
+                    stale.append(have_key)
+                    have = next(present, None)
+                else:
+                    if want != have:
+                        stale.append(have_key)
+                        missing.append(want)
+                    want, have = next(wanted, None), next(present, None)
+                if len(stale) + len(missing) >= batch_size:
+                    written[table] += _apply(write_cursor, table, keys, stale, missing)
+            written[table] += _apply(write_cursor, table, keys, stale, missing)
+    target.commit()
+    return written
+
+
+def delete_school_rows(connection, school_id, batch_size=SYNC_BATCH_SIZE):
+    """Deletes every row a school owns from one shard, dependents first, a batch at a time."""
+    with connection.cursor() as read_cursor, connection.cursor() as write_cursor:
+        for table, alias, keys, query in reversed(SCHOOL_TABLES):
+            doomed = []
+            for row in _school_rows(read_cursor, alias, keys, query, school_id, batch_size):
+                doomed.append(_key(row, keys))
+                if len(doomed) >= batch_size:
+                    _delete_keys(write_cursor, table, keys, doomed)
+                    doomed = []
+            if doomed:
+                _delete_keys(write_cursor, table, keys, doomed)
+    connection.commit()
+
+
+def move_school(shard_map, pools, school_id, target, keep_source=False, log=print):
+    """Moves a school's rows to the `target` shard while it stays online.
+
+    1. Copies the rows while the school keeps serving reads and writes.
+    2. Freezes its writes, waits until every process has seen that, then
+       copies whatever changed during step 1.
+    3. Points the map at the target, waits again so no process still reads
+       the source, and deletes the source's rows unless `keep_source`.
+    `pools` maps shard names to their primaries' pools.
+    """
+    source = shard_map.lookup(school_id).shard
+    if target not in pools:
+        raise ValueError(f'Unknown shard {target!r}')
+    if source == target:
+        log(f'School {school_id} is already on {target}')
+        return
+    settle = shard_map.ttl + 1
+
+    source_connection, target_connection = pools[source].acquire(), pools[target].acquire()
+    try:
+        with source_connection.cursor() as cursor:
+            cursor.execute("SELECT id FROM Schools WHERE id = %s", (school_id,))
+            if cursor.fetchone() is None:
+                raise ValueError(f'School {school_id} is not on {source}')
+        source_connection.commit()
+
+        copied = sync_school(source_connection, target_connection, school_id)
+        log(f'Copied {sum(copied.values())} rows from {source} to {target}')
+
+        shard_map.assign(school_id, source, state='frozen')
+        log(f'Writes frozen; waiting {settle:.0f}s for every process to notice')
+        time.sleep(settle)
+        try:
+            caught_up = sync_school(source_connection, target_connection, school_id)
+        except Exception:
+            shard_map.assign(school_id, source)
+            raise
+        log(f'Copied {sum(caught_up.values())} rows changed meanwhile')
+
+        shard_map.assign(school_id, target)
+        log(f'School {school_id} now lives on {target}')
+        if keep_source:
+            return
+        time.sleep(settle)
+        delete_school_rows(source_connection, school_id)
+        log(f'Deleted the old rows from {source}')
+    finally:
+        pools[source].release(source_connection)
+        pools[target].release(target_connection)
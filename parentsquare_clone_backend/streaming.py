@@ -0,0 +1,75 @@
+import pymysql.cursors
+from flask import Response, current_app, stream_with_context
+
+CHUNK_SIZE = 64 * 1024
+FETCH_SIZE = 500
+
+
+class RowStream:
+    """Rows of a query read through an unbuffered server-side cursor.
+
+    The query runs as soon as the stream is created, so SQL errors still
+    reach the view's error handling; rows are pulled from MySQL only as the
+    response is written out.
+    """
+
+    def __init__(self, connection, query, params=(), fetch_size=FETCH_SIZE):
+        self.fetch_size = fetch_size
+        self.cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+        self.cursor.execute(query, params)
+
+    def __iter__(self):
+        try:
+            while True:
+                rows = self.cursor.fetchmany(self.fetch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            self.cursor.close()
+
+
+def _chunked(pieces, chunk_size=CHUNK_SIZE):
+    """Joins small string pieces into chunks of roughly `chunk_size` characters."""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def iter_json_array(rows, dumps):
+    """Encodes rows as a JSON array, one element at a time."""
+    yield '['
+    for index, row in enumerate(rows):
+        yield dumps(row) if index == 0 else ',' + dumps(row)
+    yield ']\n'
+
+
+def iter_ndjson(rows, dumps):
+    """Encodes rows as newline-delimited JSON."""
+    for row in rows:
+        yield dumps(row) + '\n'
+
+
+def wants_ndjson(request):
+    return (request.args.get('format') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+
+def stream_rows_response(rows, ndjson=False):
+    """Streams rows as a JSON array (or NDJSON) without materializing the list."""
+    json_provider = current_app.json
+
+    def dumps(row):
+        return json_provider.dumps(row, separators=(',', ':'))
+
+    if ndjson:
+        body, mimetype = iter_ndjson(rows, dumps), 'application/x-ndjson'
+    else:
+        body, mimetype = iter_json_array(rows, dumps), 'application/json'
+    return Response(stream_with_context(_chunked(body)), mimetype=mimetype)
@@ -0,0 +1,74 @@
+"""Runs the app against a seeded SQLite district (see local_db.py).
+
+The app reads its configuration when it is imported, so the environment
+is set here, before any test imports it.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+WORKDIR = tempfile.mkdtemp(prefix='vircommuter-tests-')
+os.environ.update(DB_BACKEND='sqlite', SQLITE_PATH=os.path.join(WORKDIR, 'district.sqlite3'),
+                  SECRET_KEY='test-only-secret-key-with-enough-length!!', BCRYPT_LOG_ROUNDS='4',
+                  PASSWORD_HASHER_EXECUTOR='inline', ADMISSION_ENABLED='false', METRICS_ENABLED='false',
+                  NOTIFY_FILE_PATH=os.path.join(WORKDIR, 'notifications.jsonl'),
+                  ATTACHMENT_DIR=os.path.join(WORKDIR, 'attachments'), ATTACHMENT_GC_INTERVAL='0',
+                  ARCHIVE_INTERVAL='0', READ_FLUSH_SECONDS='3600')
+
+# Two schools, each with two teachers of two classes.
+TEST_DISTRICT = (2, 2, 2, 4, 3, 0.5, 1.0)
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app as app_module
+    yield app_module
+    app_module.read_buffer.close()
+    app_module.db_router.close()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def district(app_module):
+    """Migrates the database and seeds it; returns the datagen manifest."""
+    import schema_migrations
+    from benchmarks import datagen
+
+    connection = app_module.connect_to_database()
+    schema_migrations.upgrade(connection, log=lambda message: None)
+    manifest = datagen.generate_district(connection, datagen.DistrictSpec(*TEST_DISTRICT),
+                                         password_hash=app_module.passwords.hash(datagen.PASSWORD),
+                                         log=lambda message: None)
+    connection.close()
+    return manifest
+
+
+@pytest.fixture
+def client(app_module, district):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    """Returns `login(email)`, which signs in and returns the request headers."""
+    from benchmarks import datagen
+
+    def login(email):
+        response = client.post('/api/login', json={'email': email, 'password': datagen.PASSWORD})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    return login
+
+
+@pytest.fixture
+def db(app_module, district):
+    """A connection of its own, for arranging and checking rows outside the app."""
+    connection = app_module.connect_to_database()
+    yield connection
+    connection.close()
@@ -0,0 +1,48 @@
+import pytest
+
+import admission
+
+
+@pytest.fixture(params=['memory', 'database'])
+def buckets(request, app_module, district, db):
+    if request.param == 'memory':
+        yield admission.MemoryBuckets()
+        return
+    yield admission.DatabaseBuckets(app_module.db_pool)
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM RateLimitBuckets")
+    db.commit()
+
+
+def controller(buckets):
+    # Buckets that hardly refill while the test runs.
+    return admission.AdmissionController(buckets, [admission.Lane('auth')], ip_rate=0.001, ip_burst=3,
+                                         email_rate=0.001, email_burst=1)
+
+
+def test_rejected_email_leaves_the_ip_budget_alone(buckets):
+    control = controller(buckets)
+    assert control.admit(None, '10.0.0.1', 'parent@example.org') is None
+    for _ in range(5):
+        assert control.admit(None, '10.0.0.1', 'parent@example.org')[0] == 'email'
+    # The IP paid for the first attempt only.
+    assert control.admit(None, '10.0.0.1', 'other@example.org') is None
+    assert control.admit(None, '10.0.0.1', 'third@example.org') is None
+    assert control.admit(None, '10.0.0.1', 'fourth@example.org')[0] == 'ip'
+    assert control.stats()['shed_email'] == 5
+
+
+def test_long_email_gets_a_bucket_that_fits_the_key_column(buckets, db):
+    control = controller(buckets)
+    email = 'x' * 300 + '@example.org'
+    assert control.admit(None, '10.0.0.2', email) is None
+    assert control.admit(None, '10.0.0.2', email)[0] == 'email'
+    assert control.admit(None, '10.0.0.2', 'y' * 300 + '@example.org') is None
+    assert control.stats()['bucket_errors'] == 0
+
+    if isinstance(buckets, admission.DatabaseBuckets):
+        with db.cursor() as cursor:
+            cursor.execute("SELECT bucket_key FROM RateLimitBuckets")
+            keys = [row['bucket_key'] for row in cursor.fetchall()]
+        assert len(keys) == 3
+        assert max(len(key) for key in keys) <= admission.MAX_KEY_LENGTH
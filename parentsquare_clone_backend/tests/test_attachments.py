@@ -0,0 +1,62 @@
+import hashlib
+import io
+import os
+import time
+
+import pytest
+
+import attachments
+
+CONTENT = b'permission slip'
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def orphan(app_module, district, db, tmp_path):
+    """A stored blob whose last reference went away a while ago; returns (store, collector)."""
+    store = attachments.BlobStore(str(tmp_path))
+    path = store.path(SHA256)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(CONTENT)
+    os.utime(path, (time.time() - 60, time.time() - 60))
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO AttachmentBlobs (sha256, size, ref_count, updated_at) VALUES (%s, %s, 0, %s)",
+                       (SHA256, len(CONTENT), time.time() - 60))
+    db.commit()
+    yield store, attachments.GarbageCollector(store, app_module.db_pool, [], grace=10)
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM AttachmentBlobs WHERE sha256 = %s", (SHA256,))
+    db.commit()
+
+
+def test_collector_deletes_an_unreferenced_blob(orphan):
+    store, collector = orphan
+    assert collector.collect() == (0, 1)
+    assert os.listdir(os.path.dirname(store.path(SHA256))) == []
+
+
+def test_upload_racing_the_collector_keeps_its_blob(orphan, app_module, monkeypatch):
+    store, collector = orphan
+    real_stat, uploads = os.stat, []
+
+    def upload():
+        # What upload_attachment does: count the reference, then keep the file.
+        temp_path, sha256, size = store.receive(io.BytesIO(CONTENT), 1024)
+        attachments.update_references(app_module.db_pool, attachments.add_references, [(sha256, size)])
+        store.keep(temp_path, sha256)
+        uploads.append(sha256)
+
+    def racing_stat(path, *args, **kwargs):
+        # The upload lands right after the collector has looked at the blob.
+        result = real_stat(path, *args, **kwargs)
+        if not uploads and str(path).startswith(store.path(SHA256)):
+            upload()
+        return result
+    monkeypatch.setattr(os, 'stat', racing_stat)
+
+    assert collector.collect() == (0, 0)
+    assert uploads == [SHA256]
+    with open(store.path(SHA256), 'rb') as f:
+        assert f.read() == CONTENT
+    assert os.listdir(os.path.dirname(store.path(SHA256))) == [SHA256]
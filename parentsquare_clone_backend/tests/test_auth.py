@@ -0,0 +1,110 @@
+import re
+
+import bcrypt
+import jwt
+import pytest
+
+import local_db
+import passwords
+from benchmarks import datagen
+
+USERS_QUERY = re.compile(r'\bFROM\s+Users\b', re.IGNORECASE)
+
+
+def users_queries(statements):
+    return [sql for sql in statements if USERS_QUERY.search(sql)]
+
+
+def test_gated_read_runs_no_users_query(app_module, client, district, login):
+    headers = login(district['users']['parent'][0])
+    app_module.user_profiles.clear()
+    with local_db.capture_queries() as statements:
+        response = client.get('/api/parent/posts?limit=5', headers=headers)
+    assert response.status_code == 200
+    assert statements
+    assert users_queries(statements) == []
+
+
+def test_gated_write_runs_no_users_query(app_module, client, district, login):
+    teacher = district['users']['teacher'][0]
+    headers = login(teacher)
+    app_module.user_profiles.clear()
+    with local_db.capture_queries() as statements:
+        response = client.post('/api/teacher/create_post', headers=headers, json={
+            'title': 'Auth test', 'content': 'No profile lookups', 'class_id': district['teacher_classes'][teacher][0]})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    assert users_queries(statements) == []
+
+
+def test_forged_token_is_rejected(app_module, client, district, login):
+    headers = login(district['users']['teacher'][0])
+    claims = jwt.decode(headers['Authorization'].split()[1], options={'verify_signature': False})
+    claims['role'] = 'school_admin'
+    forged = jwt.encode(claims, 'not-the-secret-key-but-just-as-long-!!!!', algorithm='HS256')
+    response = client.get('/api/admin/posts', headers={'Authorization': f'Bearer {forged}'})
+    assert response.status_code == 422
+
+
+def test_token_for_another_role_is_rejected(client, district, login):
+    headers = login(district['users']['teacher'][0])
+    assert client.get('/api/admin/posts', headers=headers).status_code == 403
+    assert client.get('/api/parent/posts', headers=headers).status_code == 403
+
+
+def test_token_without_claims_uses_current_role(app_module, client, district, db):
+    """Tokens minted before role and school_id were signed in fall back to the Users row."""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT id FROM Users WHERE email = %s", (district['users']['teacher'][0],))
+        teacher_id = cursor.fetchone()['id']
+    with app_module.app.app_context():
+        token = app_module.create_access_token(identity=str(teacher_id))
+    headers = {'Authorization': f'Bearer {token}'}
+    app_module.user_profiles.clear()
+    assert client.get('/api/admin/posts', headers=headers).status_code == 403
+    assert client.get('/api/protected', headers=headers).status_code == 200
+
+
+@pytest.fixture
+def stale_hash(db, district):
+    """Gives a parent a hash at a cost other than the configured one; returns their email and id."""
+    email = district['users']['parent'][-1]
+    with db.cursor() as cursor:
+        cursor.execute("SELECT id, password_hash FROM Users WHERE email = %s", (email,))
+        user = cursor.fetchone()
+        stale = bcrypt.hashpw(datagen.PASSWORD.encode('utf-8'), bcrypt.gensalt(5)).decode('utf-8')
+        cursor.execute("UPDATE Users SET password_hash = %s WHERE id = %s", (stale, user['id']))
+    db.commit()
+    yield email, user['id']
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE Users SET password_hash = %s WHERE id = %s", (user['password_hash'], user['id']))
+    db.commit()
+
+
+def stored_hash(db, user_id):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT password_hash FROM Users WHERE id = %s", (user_id,))
+        password_hash = cursor.fetchone()['password_hash']
+    db.commit()
+    return password_hash
+
+
+def test_login_rehashes_at_the_configured_cost(app_module, db, login, stale_hash):
+    email, user_id = stale_hash
+    login(email)
+    password_hash = stored_hash(db, user_id)
+    assert passwords.hash_cost(password_hash) == app_module.app.config['BCRYPT_LOG_ROUNDS']
+    assert app_module.passwords.verify(password_hash, datagen.PASSWORD)
+    login(email)
+
+
+def test_failed_rehash_never_fails_login(app_module, caplog, db, login, monkeypatch, stale_hash):
+    email, user_id = stale_hash
+    before = stored_hash(db, user_id)
+
+    def hash_unavailable(password):
+        raise RuntimeError('bcrypt pool is down')
+    monkeypatch.setattr(app_module.passwords, 'hash', hash_unavailable)
+
+    login(email)
+    assert stored_hash(db, user_id) == before
+    assert f'Failed to rehash password for user {user_id}' in caplog.text
@@ -0,0 +1,57 @@
+import pytest
+from benchmarks import datagen
+
+
+@pytest.fixture
+def admission(app_module):
+    """Turns admission control on; tests set lane limits on the returned controller."""
+    control = app_module.admission_control
+    limits = {name: lane.limit for name, lane in control.lanes.items()}
+    control.buckets.clear()
+    app_module.app.config['ADMISSION_ENABLED'] = True
+    yield control
+    app_module.app.config['ADMISSION_ENABLED'] = False
+    for name, lane in control.lanes.items():
+        lane.limit = limits[name]
+
+
+def login_with_dashboard(client, email):
+    response = client.post('/api/login', json={'email': email, 'password': datagen.PASSWORD, 'include_dashboard': True})
+    assert response.status_code == 200
+    return response.get_json()['dashboard']
+
+
+def test_dashboard_reads_are_admitted_to_the_read_lane(client, district, admission):
+    read = admission.lanes['read']
+    read.limit, read.in_flight = 1, 1
+    try:
+        dashboard = login_with_dashboard(client, district['users']['parent'][0])
+    finally:
+        read.in_flight = 0
+    assert [call['status'] for call in dashboard] == [429]
+    assert admission.stats()['in_flight_auth'] == 0
+
+
+def test_login_gives_back_its_auth_slot_before_the_dashboard(client, district, admission, monkeypatch):
+    admission.lanes['auth'].limit = 1
+    admitted = []
+    admit = admission.admit
+
+    def recording_admit(lane, ip=None, email=None):
+        admitted.append((lane, admission.lanes['auth'].in_flight))
+        return admit(lane, ip, email)
+    monkeypatch.setattr(admission, 'admit', recording_admit)
+
+    dashboard = login_with_dashboard(client, district['users']['student'][0])
+    assert [call['status'] for call in dashboard] == [200, 200]
+    assert admitted == [('auth', 0), ('read', 0), ('read', 0)]
+
+
+def test_batch_runs_same_lane_calls_in_its_own_slot(client, district, login, admission):
+    headers = login(district['users']['student'][0])
+    admission.lanes['read'].limit = 1
+    response = client.post('/api/batch', headers=headers, json={'requests': [
+        {'path': '/api/student/dashboard'}, {'path': '/api/student/posts?limit=3'}]})
+    assert response.status_code == 200
+    assert [call['status'] for call in response.get_json()['responses']] == [200, 200]
+    assert admission.stats()['in_flight_read'] == 0
@@ -0,0 +1,57 @@
+import threading
+
+from db_pool import ConnectionPool
+
+
+class FakeConnection:
+    def __init__(self):
+        self.pinging = threading.Event()
+        self.answer = threading.Event()
+        self.alive = True
+        self.closed = False
+
+    def ping(self, reconnect=False):
+        self.pinging.set()
+        self.answer.wait(5)
+        if not self.alive:
+            raise ConnectionError('gone away')
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_slow_health_check_does_not_block_other_checkouts():
+    pool = ConnectionPool(FakeConnection, max_size=2, health_check_interval=0)
+    slow = pool.acquire()
+    pool.release(slow)
+
+    checked = []
+    thread = threading.Thread(target=lambda: checked.append(pool.acquire()))
+    thread.start()
+    assert slow.pinging.wait(5)
+    # The ping is still waiting on the server; the pool stays usable meanwhile.
+    other = pool.acquire(timeout=1)
+    assert other is not slow and not checked
+    pool.release(other)
+    assert pool.stats()['size'] == 2
+
+    slow.answer.set()
+    thread.join(5)
+    assert checked == [slow]
+
+
+def test_failed_health_check_discards_the_connection():
+    pool = ConnectionPool(FakeConnection, max_size=1, health_check_interval=0)
+    dead = pool.acquire()
+    pool.release(dead)
+    dead.alive = False
+    dead.answer.set()
+
+    fresh = pool.acquire(timeout=1)
+    assert fresh is not dead and dead.closed
+    stats = pool.stats()
+    assert stats['health_check_failures'] == 1
+    assert stats['size'] == 1 and stats['in_use'] == 1
@@ -0,0 +1,38 @@
+import time
+
+from benchmarks import datagen
+from db_router import PrimaryPins
+
+
+def test_pin_holds_on_another_worker_for_its_user_only(monkeypatch):
+    token = PrimaryPins('secret', window=5).issue(7)
+    other_worker = PrimaryPins('secret', window=5)
+    assert other_worker.is_pinned(token, 7)
+    assert not other_worker.is_pinned(token, 8)
+    assert not other_worker.is_pinned(token[:-2], 7)
+    assert not PrimaryPins('another secret', window=5).is_pinned(token, 7)
+
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 10)
+    assert not other_worker.is_pinned(token, 7)
+    assert other_worker.stats() == {'issued': 0, 'honored': 1, 'rejected': 3}
+
+
+def test_reads_carrying_the_pin_go_to_the_primary(app_module, client, district, monkeypatch):
+    response = client.post('/api/login', json={'email': district['users']['school_admin'][0],
+                                               'password': datagen.PASSWORD})
+    token = response.headers['X-Read-Primary']
+    authorization = f"Bearer {response.get_json()['access_token']}"
+
+    read_only = []
+    acquire = app_module.db_router.acquire
+
+    def recording_acquire(read_only_request=False):
+        read_only.append(read_only_request)
+        return acquire(read_only_request)
+    monkeypatch.setattr(app_module.db_router, 'acquire', recording_acquire)
+
+    for headers in ({}, {'X-Read-Primary': token}):
+        response = client.get('/api/admin/read_receipts', headers={'Authorization': authorization, **headers})
+        assert response.status_code == 200
+    assert read_only == [True, False]
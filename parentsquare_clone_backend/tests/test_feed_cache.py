@@ -0,0 +1,148 @@
+import local_db
+import pytest
+from db_pool import ConnectionPool
+from feed_cache import ALL_POSTS_SCOPE, FeedCache, class_scope
+from post_events import DatabaseBackend, EventBroker
+
+FEED_URLS = {'parent': '/api/parent/posts?limit=5', 'student': '/api/student/posts?limit=5',
+             'school_admin': '/api/admin/posts?limit=5'}
+
+# Users whose feed shows a class's posts, by role.
+CLASS_READERS_SQL = {
+    'parent': """
+        SELECT l.parent_user_id AS user_id FROM ParentStudentLinks l
+        JOIN StudentEnrollments se ON se.student_id = l.student_id WHERE se.class_id = %s
+    """,
+    'student': """
+        SELECT s.user_id FROM Students s
+        JOIN StudentEnrollments se ON se.student_id = s.id WHERE se.class_id = %s AND s.user_id IS NOT NULL
+    """,
+}
+
+
+def query(db, sql, params):
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    db.commit()
+    return rows
+
+
+def class_readers(db, class_id, role):
+    """Returns the emails of `role` users who do and don't see the class's posts."""
+    readers = {row['user_id'] for row in query(db, CLASS_READERS_SQL[role], (class_id,))}
+    users = query(db, "SELECT id, email FROM Users WHERE role = %s ORDER BY id", (role,))
+    return ([user['email'] for user in users if user['id'] in readers],
+            [user['email'] for user in users if user['id'] not in readers])
+
+
+def school_admin_of(db, class_id):
+    return query(db, """
+        SELECT u.email FROM Users u JOIN Classes c ON c.school_id = u.school_id
+        WHERE c.id = %s AND u.role = 'school_admin'
+    """, (class_id,))[0]['email']
+
+
+@pytest.fixture
+def class_a(district):
+    teacher = district['users']['teacher'][0]
+    return teacher, district['teacher_classes'][teacher][0]
+
+
+def create_post(client, login, teacher, class_id):
+    response = client.post('/api/teacher/create_post', headers=login(teacher),
+                           json={'title': 'Cache test', 'content': 'Body', 'class_id': class_id})
+    assert response.status_code == 201
+    return response.get_json()['post_id']
+
+
+def cached_etag(client, headers, url):
+    """Loads a feed page so it is cached; returns its ETag."""
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200
+    return response.headers['ETag']
+
+
+def revalidate(client, headers, url, etag):
+    """Requests a page with If-None-Match; returns the response and the SQL it ran."""
+    with local_db.capture_queries() as statements:
+        response = client.get(url, headers={**headers, 'If-None-Match': etag})
+    return response, statements
+
+
+def test_create_post_bumps_only_its_class_and_the_district(app_module, client, login, class_a):
+    teacher, class_id = class_a
+    before = dict(app_module.post_feeds._versions)
+    create_post(client, login, teacher, class_id)
+    after = app_module.post_feeds._versions
+    assert {scope for scope in after if after[scope] != before.get(scope, 0)} == {'all', f'class:{class_id}'}
+
+
+@pytest.mark.parametrize('role', ['parent', 'student'])
+def test_write_invalidates_only_the_class_readers_feeds(client, db, login, class_a, role):
+    teacher, class_id = class_a
+    inside, outside = class_readers(db, class_id, role)
+    inside, outside = login(inside[0]), login(outside[0])
+    url = FEED_URLS[role]
+    inside_etag, outside_etag = cached_etag(client, inside, url), cached_etag(client, outside, url)
+
+    post_id = create_post(client, login, teacher, class_id)
+    # Another class's readers still revalidate from the cache, without a query.
+    response, statements = revalidate(client, outside, url, outside_etag)
+    assert response.status_code == 304 and statements == []
+    # The class's readers hold a stale ETag and get the new page.
+    response, _ = revalidate(client, inside, url, inside_etag)
+    assert response.status_code == 200 and response.headers['ETag'] != inside_etag
+    assert post_id in [post['id'] for post in response.get_json()['posts']]
+    inside_etag = response.headers['ETag']
+
+    response = client.delete(f'/api/admin/delete_post/{post_id}', headers=login(school_admin_of(db, class_id)))
+    assert response.status_code == 200
+    response, statements = revalidate(client, outside, url, outside_etag)
+    assert response.status_code == 304 and statements == []
+    response, _ = revalidate(client, inside, url, inside_etag)
+    assert response.status_code == 200 and response.headers['ETag'] != inside_etag
+    assert post_id not in [post['id'] for post in response.get_json()['posts']]
+
+
+def test_district_feed_is_invalidated_by_any_class_write(client, db, login, class_a):
+    teacher, class_id = class_a
+    admin = login(school_admin_of(db, class_id))
+    url = FEED_URLS['school_admin']
+    etag = cached_etag(client, admin, url)
+    assert revalidate(client, admin, url, etag)[0].status_code == 304
+
+    create_post(client, login, teacher, class_id)
+    response, _ = revalidate(client, admin, url, etag)
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+@pytest.fixture
+def workers(app_module, district):
+    """Two workers' feed caches, listening to events shared through the database."""
+    pool = ConnectionPool(app_module.connect_to_database, max_size=2)
+    workers = []
+    for _ in range(2):
+        # Polled by hand; the background thread never wakes up.
+        backend = DatabaseBackend(pool, poll_interval=3600, in_flight_window=0)
+        broker, cache = EventBroker(backend), FeedCache()
+        broker.add_listener(cache.apply_event)
+        broker.start()
+        workers.append((backend, broker, cache))
+    yield workers
+    for _, broker, _ in workers:
+        broker.close()
+    pool.close()
+
+
+@pytest.mark.parametrize('event_type', ['post_created', 'post_deleted', 'posts_archived'])
+def test_post_event_invalidates_another_workers_cache(workers, event_type):
+    (_, writer, _), (reader_backend, _, reader_cache) = workers
+    reader_cache.put('class 1', reader_cache.snapshot([ALL_POSTS_SCOPE, class_scope(1)]), b'[]')
+    reader_cache.put('class 2', reader_cache.snapshot([class_scope(2)]), b'[]')
+
+    writer.publish(event_type, 1, {'id': 1, 'class_id': 1})
+    assert reader_cache.get('class 1') is not None
+    reader_backend.poll()
+    assert reader_cache.get('class 1') is None
+    assert reader_cache.get('class 2') is not None
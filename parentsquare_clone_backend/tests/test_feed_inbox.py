@@ -0,0 +1,142 @@
+import pytest
+
+import feed_inbox
+
+CONSISTENT = {'missing': [], 'extra': []}
+
+
+def query(db, sql, params=()):
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    db.commit()
+    return rows
+
+
+def check(db, user_id=None):
+    report = feed_inbox.check_consistency(db, user_id=user_id)
+    db.commit()
+    return report
+
+
+def inbox(db, user_id):
+    return {row['post_id'] for row in query(db, "SELECT post_id FROM FeedInbox WHERE user_id = %s", (user_id,))}
+
+
+def delete_post(client, login, district, post_id):
+    for admin in district['users']['school_admin']:
+        if client.delete(f'/api/admin/delete_post/{post_id}', headers=login(admin)).status_code == 200:
+            return
+    raise AssertionError(f'no admin could delete post {post_id}')
+
+
+def test_create_and_delete_keep_inboxes_consistent(client, db, district, login):
+    teacher = district['users']['teacher'][0]
+    class_id = district['teacher_classes'][teacher][0]
+    response = client.post('/api/teacher/create_post', headers=login(teacher),
+                           json={'title': 'Picture day', 'content': 'Wear a smile', 'class_id': class_id})
+    assert response.status_code == 201
+    post_id = response.get_json()['post_id']
+
+    expected_sql, params = feed_inbox._recipient_posts(post_id=post_id)
+    recipients = {row['user_id'] for row in query(db, expected_sql, params)}
+    assert recipients
+    assert {row['user_id'] for row in query(db, "SELECT user_id FROM FeedInbox WHERE post_id = %s",
+                                            (post_id,))} == recipients
+    assert check(db) == CONSISTENT
+
+    delete_post(client, login, district, post_id)
+    assert query(db, "SELECT user_id FROM FeedInbox WHERE post_id = %s", (post_id,)) == []
+    assert check(db) == CONSISTENT
+
+
+@pytest.fixture
+def access_code(db, district):
+    """An unused code for the first student; removes the parent it registers afterwards."""
+    student_id = query(db, "SELECT MIN(id) AS id FROM Students")[0]['id']
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO AccessCodes (code, student_id, parent_email) VALUES ('INBOX-TEST', %s, %s)",
+                       (student_id, 'newparent@example.org'))
+    db.commit()
+    yield 'INBOX-TEST', student_id
+    with db.cursor() as cursor:
+        cursor.execute("SELECT id FROM Users WHERE email = 'newparent@example.org'")
+        for row in cursor.fetchall():
+            cursor.execute("DELETE FROM FeedInbox WHERE user_id = %s", (row['id'],))
+            cursor.execute("DELETE FROM FeedInboxStatus WHERE user_id = %s", (row['id'],))
+            cursor.execute("DELETE FROM ParentStudentLinks WHERE parent_user_id = %s", (row['id'],))
+            cursor.execute("DELETE FROM Users WHERE id = %s", (row['id'],))
+        cursor.execute("DELETE FROM AccessCodes WHERE code = 'INBOX-TEST'")
+    db.commit()
+
+
+def test_registered_parent_starts_with_a_ready_inbox(client, db, access_code):
+    code, student_id = access_code
+    response = client.post('/api/parent/register', json={
+        'first_name': 'New', 'last_name': 'Parent', 'email': 'newparent@example.org',
+        'password': 'correct horse battery', 'access_code': code})
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+    parent_id = query(db, "SELECT id FROM Users WHERE email = 'newparent@example.org'")[0]['id']
+    with db.cursor() as cursor:
+        assert feed_inbox.inbox_ready(cursor, parent_id)
+    db.commit()
+    child_posts = {row['id'] for row in query(db, """
+        SELECT p.id FROM Posts p JOIN StudentEnrollments se ON se.class_id = p.class_id
+        WHERE se.student_id = %s
+    """, (student_id,))}
+    assert child_posts and inbox(db, parent_id) == child_posts
+    assert check(db, user_id=parent_id) == CONSISTENT
+
+
+@pytest.mark.parametrize('role', ['student', 'parent'])
+def test_inbox_and_join_serve_the_same_feed(app_module, client, db, district, login, role):
+    email = district['users'][role][0]
+    user_id = query(db, "SELECT id FROM Users WHERE email = %s", (email,))[0]['id']
+    headers = login(email)
+
+    def feed():
+        app_module.post_feeds.clear()
+        response = client.get(f'/api/{role}/posts?limit=100', headers=headers)
+        assert response.status_code == 200
+        return response.get_json()
+
+    from_inbox = feed()
+    with db.cursor() as cursor:
+        feed_inbox.set_status(cursor, user_id, 'rebuilding')
+    db.commit()
+    try:
+        from_join = feed()
+    finally:
+        with db.cursor() as cursor:
+            feed_inbox.set_status(cursor, user_id, 'ready')
+        db.commit()
+    assert from_inbox['posts'] and from_inbox == from_join
+
+
+def test_backfill_rebuilds_every_inbox_and_check_repairs_drift(app_module, db, district):
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM FeedInbox")
+        cursor.execute("DELETE FROM FeedInboxStatus")
+    db.commit()
+
+    messages = []
+    total = feed_inbox.backfill(db, batch_size=3, log=messages.append)
+    assert messages[-1] == f'Rebuilt {total}/{total} inboxes'
+    assert query(db, "SELECT COUNT(*) AS n FROM FeedInboxStatus WHERE status = 'ready'")[0]['n'] == total
+    expected_sql, params = feed_inbox._recipient_posts()
+    expected = query(db, f"SELECT COUNT(*) AS n FROM ({expected_sql}) e", params)[0]['n']
+    assert query(db, "SELECT COUNT(*) AS n FROM FeedInbox")[0]['n'] == expected
+    assert check(db) == CONSISTENT
+
+    row = query(db, "SELECT user_id, post_id FROM FeedInbox ORDER BY user_id, post_id LIMIT 1")[0]
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM FeedInbox WHERE user_id = %s AND post_id = %s", (row['user_id'], row['post_id']))
+    db.commit()
+    assert check(db) == {'missing': [(row['user_id'], row['post_id'])], 'extra': []}
+
+    runner = app_module.app.test_cli_runner()
+    assert runner.invoke(args=['feed-inbox', 'check']).exit_code == 1
+    result = runner.invoke(args=['feed-inbox', 'check', '--repair'])
+    assert result.exit_code == 0 and 'Rebuilt 1 inboxes' in result.output
+    assert check(db) == CONSISTENT
@@ -0,0 +1,53 @@
+import pytest
+
+import local_db
+import schema_migrations
+
+
+def index_names(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%%'")
+        return {row['name'] for row in cursor.fetchall()}
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    """The core tables as they were made by hand: no indexes, no migration history.
+
+    Returns the connection and the indexes 0001 would have created.
+    """
+    connection = local_db.connect(str(tmp_path / 'legacy.sqlite3'))
+    schema_migrations.upgrade(connection, target=1, log=lambda message: None)
+    core_indexes = index_names(connection)
+    with connection.cursor() as cursor:
+        for name in core_indexes:
+            cursor.execute(f"DROP INDEX {name}")
+        cursor.execute("DROP TABLE SchemaMigrations")
+        cursor.execute("INSERT INTO Schools (id, name) VALUES (1, 'Legacy Elementary')")
+        cursor.executemany("INSERT INTO Users (email, password_hash, first_name, last_name, role, school_id) "
+                           "VALUES (%s, 'x', 'A', 'B', 'parent', 1)",
+                           [('ann@example.org',), ('bob@example.org',)])
+    connection.commit()
+    yield connection, core_indexes
+    connection.close()
+
+
+def test_upgrade_adds_missing_core_indexes(legacy):
+    connection, core_indexes = legacy
+    assert index_names(connection) == set()
+    schema_migrations.upgrade(connection, log=lambda message: None)
+    assert core_indexes <= index_names(connection)
+    assert schema_migrations.upgrade(connection, log=lambda message: None) == []
+
+
+def test_duplicate_emails_stop_the_upgrade_before_any_index(legacy):
+    connection, core_indexes = legacy
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE Users SET email = 'ann@example.org'")
+    connection.commit()
+
+    with pytest.raises(schema_migrations.MigrationError, match='ann@example.org'):
+        schema_migrations.upgrade(connection, log=lambda message: None)
+    connection.rollback()
+    assert not core_indexes & index_names(connection)
+    assert 10 not in schema_migrations.applied_versions(connection)
@@ -0,0 +1,128 @@
+import datetime
+import json
+
+import pytest
+
+import notifications
+
+# A class where one parent has two enrolled children.
+SIBLING_CLASS_SQL = """
+    SELECT se.class_id, l.parent_user_id FROM ParentStudentLinks l
+    JOIN StudentEnrollments se ON se.student_id = l.student_id
+    GROUP BY se.class_id, l.parent_user_id HAVING COUNT(*) > 1
+    ORDER BY se.class_id LIMIT 1
+"""
+
+
+def query(db, sql, params=()):
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    db.commit()
+    return rows
+
+
+def as_datetime(value):
+    """A DATETIME column as a datetime; the SQLite stand-in returns strings."""
+    return datetime.datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+@pytest.fixture
+def outbox(district, db):
+    """Queues a post's notifications in an otherwise empty outbox; returns the sibling class's details."""
+    def clear():
+        with db.cursor() as cursor:
+            cursor.execute("DELETE FROM NotificationDeliveries")
+            cursor.execute("DELETE FROM NotificationOutbox")
+        db.commit()
+
+    clear()
+    sibling = query(db, SIBLING_CLASS_SQL)[0]
+    post = query(db, "SELECT MIN(p.id) AS id, c.school_id FROM Posts p JOIN Classes c ON c.id = p.class_id "
+                     "WHERE p.class_id = %s GROUP BY c.school_id", (sibling['class_id'],))[0]
+    parents = query(db, """
+        SELECT DISTINCT u.email FROM ParentStudentLinks l
+        JOIN StudentEnrollments se ON se.student_id = l.student_id
+        JOIN Users u ON u.id = l.parent_user_id
+        WHERE se.class_id = %s
+    """, (sibling['class_id'],))
+    with db.cursor() as cursor:
+        notifications.enqueue_post(cursor, post['id'], sibling['class_id'], post['school_id'])
+    db.commit()
+    yield {'parent_user_id': sibling['parent_user_id'], 'emails': sorted(row['email'] for row in parents)}
+    clear()
+
+
+def worker(app_module, transport, **options):
+    return notifications.NotificationWorker(app_module.db_pool, transport, log=lambda message: None, **options)
+
+
+def deliveries(db):
+    return query(db, "SELECT user_id, status, attempts, next_attempt_at, last_error FROM NotificationDeliveries")
+
+
+class DownTransport:
+    """An SMTP server that refuses every connection."""
+
+    def send_batch(self, messages):
+        raise ConnectionRefusedError('smtp down')
+
+
+def test_parent_of_two_children_in_the_class_gets_one_notice(app_module, db, outbox, tmp_path):
+    sink = tmp_path / 'sent.jsonl'
+    notifier = worker(app_module, notifications.FileTransport(str(sink)))
+    assert notifier.expand_outbox() == 1
+    assert notifier.deliver_batch() == len(outbox['emails'])
+
+    sent = [json.loads(line) for line in sink.read_text().splitlines()]
+    assert sorted(message['email'] for message in sent) == outbox['emails']
+    assert [row['user_id'] for row in deliveries(db)].count(outbox['parent_user_id']) == 1
+    assert notifier.stats()['sent'] == len(outbox['emails'])
+
+
+def test_transport_failure_backs_off_then_gives_up(app_module, db, outbox):
+    notifier = worker(app_module, DownTransport(), max_attempts=3, backoff_seconds=30)
+    notifier.expand_outbox()
+    recipients = len(outbox['emails'])
+
+    for attempt in (1, 2):
+        started = notifications._utcnow()
+        assert notifier.deliver_batch() == recipients
+        rows = deliveries(db)
+        assert {(row['status'], row['attempts']) for row in rows} == {('pending', attempt)}
+        assert all('smtp down' in row['last_error'] for row in rows)
+        backoff = datetime.timedelta(seconds=30 * 2 ** (attempt - 1))
+        assert all(abs(as_datetime(row['next_attempt_at']) - started - backoff) <= datetime.timedelta(seconds=2)
+                   for row in rows)
+        # Let the backoff run out.
+        with db.cursor() as cursor:
+            cursor.execute("UPDATE NotificationDeliveries SET next_attempt_at = %s", (started,))
+        db.commit()
+
+    assert notifier.deliver_batch() == recipients
+    assert {(row['status'], row['attempts']) for row in deliveries(db)} == {('failed', 3)}
+    assert notifier.deliver_batch() == 0
+    stats = notifier.stats()
+    assert (stats['retried'], stats['failed'], stats['sent']) == (2 * recipients, recipients, 0)
+
+
+def test_school_rate_limit_defers_without_an_attempt(app_module, db, outbox, tmp_path):
+    limiter = notifications.SchoolRateLimiter(rate=0.01, burst=1)
+    notifier = worker(app_module, notifications.FileTransport(str(tmp_path / 'sent.jsonl')), rate_limiter=limiter)
+    notifier.expand_outbox()
+    started = notifications._utcnow()
+    assert notifier.deliver_batch() == 1
+
+    rows = deliveries(db)
+    deferred = [row for row in rows if row['status'] == 'pending']
+    assert len(deferred) == len(outbox['emails']) - 1 > 0
+    assert all(row['attempts'] == 0 and as_datetime(row['next_attempt_at']) > started for row in deferred)
+    assert notifier.stats()['rate_limited'] == len(deferred)
+
+
+def test_token_bucket_is_per_school():
+    limiter = notifications.SchoolRateLimiter(rate=1, burst=2)
+    granted, wait = limiter.take(1, 5)
+    assert granted == 2 and 0.9 < wait <= 1.0
+    assert limiter.take(1, 1)[0] == 0
+    assert limiter.take(2, 5)[0] == 2
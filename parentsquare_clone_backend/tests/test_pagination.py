@@ -0,0 +1,53 @@
+import datetime
+
+import pytest
+
+import pagination
+from pagination import InvalidPageRequest, Page
+
+
+def post(post_id, created_at='2026-09-01 08:00:00'):
+    return {'id': post_id, 'created_at': created_at}
+
+
+def test_cursor_round_trips_the_sort_key():
+    created_at = datetime.datetime(2026, 9, 1, 8, 30, 15)
+    token = pagination.encode_cursor(post(42, created_at))
+    assert pagination.decode_cursor(token) == ('2026-09-01 08:30:15', 42)
+    assert pagination.parse_page_args({'cursor': token}) == Page(pagination.DEFAULT_PAGE_SIZE, ('2026-09-01 08:30:15', 42))
+
+
+@pytest.mark.parametrize('token', ['bogus', 'W10=', pagination.encode_cursor(post('x')), '!!!!'])
+def test_invalid_cursor_is_rejected(token):
+    with pytest.raises(InvalidPageRequest):
+        pagination.decode_cursor(token)
+
+
+def test_limit_is_capped_and_validated():
+    assert pagination.parse_page_args({}) == Page(pagination.DEFAULT_PAGE_SIZE, None)
+    assert pagination.parse_page_args({'limit': '5'}).limit == 5
+    assert pagination.parse_page_args({'limit': '100000'}).limit == pagination.MAX_PAGE_SIZE
+    for limit in ('0', '-3', 'ten'):
+        with pytest.raises(InvalidPageRequest):
+            pagination.parse_page_args({'limit': limit})
+
+
+def test_paginate_false_opts_out():
+    assert pagination.parse_page_args({'paginate': 'false', 'limit': 'ten'}) is None
+
+
+def test_split_page_sets_the_cursor_only_when_more_rows_follow():
+    rows = [post(post_id) for post_id in (5, 4, 3)]
+    assert pagination.split_page(rows, Page(3, None)) == (rows, None)
+
+    page_rows, token = pagination.split_page(rows, Page(2, None))
+    assert page_rows == rows[:2]
+    assert pagination.decode_cursor(token) == ('2026-09-01 08:00:00', 4)
+
+
+def test_keyset_filter_continues_after_the_cursor():
+    assert pagination.keyset_filter(None) == ('', ())
+    assert pagination.keyset_filter(Page(10, None)) == ('', ())
+    sql, params = pagination.keyset_filter(Page(10, ('2026-09-01 08:00:00', 4)), alias='f', id_column='post_id')
+    assert sql == " AND (f.created_at < %s OR (f.created_at = %s AND f.post_id < %s))"
+    assert params == ('2026-09-01 08:00:00', '2026-09-01 08:00:00', 4)
@@ -0,0 +1,113 @@
+import pytest
+
+import feed_inbox
+import local_db
+
+# A parent with two children enrolled in the same class.
+SIBLING_FAMILY_SQL = """
+    SELECT l.parent_user_id, u.email, se.class_id FROM ParentStudentLinks l
+    JOIN StudentEnrollments se ON se.student_id = l.student_id
+    JOIN Users u ON u.id = l.parent_user_id
+    GROUP BY l.parent_user_id, u.email, se.class_id HAVING COUNT(*) > 1
+    ORDER BY l.parent_user_id LIMIT 1
+"""
+
+CHILD_POSTS_SQL = """
+    SELECT p.id FROM Posts p JOIN StudentEnrollments se ON se.class_id = p.class_id
+    WHERE se.student_id = %s
+"""
+
+
+def query(db, sql, params=()):
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    db.commit()
+    return rows
+
+
+@pytest.fixture
+def family(app_module, db, district):
+    """The sibling family, with the second child also enrolled in a class of their own.
+
+    Returns the parent's email and id, the shared class and each child's post ids.
+    """
+    family = query(db, SIBLING_FAMILY_SQL)[0]
+    children = [row['student_id'] for row in query(
+        db, "SELECT student_id FROM ParentStudentLinks WHERE parent_user_id = %s ORDER BY student_id",
+        (family['parent_user_id'],))]
+    other_class = query(db, """
+        SELECT MIN(id) AS id FROM Classes WHERE id NOT IN (
+            SELECT se.class_id FROM StudentEnrollments se
+            JOIN ParentStudentLinks l ON l.student_id = se.student_id
+            WHERE l.parent_user_id = %s)
+    """, (family['parent_user_id'],))[0]['id']
+
+    def enroll(sql):
+        with db.cursor() as cursor:
+            cursor.execute(sql, (children[-1], other_class))
+            feed_inbox.rebuild_inbox(cursor, family['parent_user_id'])
+        db.commit()
+        app_module.post_feeds.clear()
+
+    enroll("INSERT INTO StudentEnrollments (student_id, class_id) VALUES (%s, %s)")
+    yield {'email': family['email'], 'id': family['parent_user_id'], 'shared_class': family['class_id'],
+           'posts': {child: {row['id'] for row in query(db, CHILD_POSTS_SQL, (child,))} for child in children}}
+    enroll("DELETE FROM StudentEnrollments WHERE student_id = %s AND class_id = %s")
+
+
+def feed(client, headers, **args):
+    query = '&'.join(f'{key}={value}' for key, value in dict(limit=100, **args).items())
+    response = client.get(f'/api/parent/posts?{query}', headers=headers)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+
+@pytest.fixture(params=['inbox', 'join'])
+def path(request, app_module, db, family):
+    """Serves the parent's feed from their inbox, or from the join while the inbox isn't ready."""
+    if request.param == 'join':
+        with db.cursor() as cursor:
+            feed_inbox.set_status(cursor, family['id'], 'rebuilding')
+        db.commit()
+        app_module.post_feeds.clear()
+    yield request.param
+    with db.cursor() as cursor:
+        feed_inbox.rebuild_inbox(cursor, family['id'])
+    db.commit()
+    app_module.post_feeds.clear()
+
+
+def test_a_class_shared_by_siblings_shows_each_post_once(client, login, family, path):
+    first, second = family['posts']
+    headers = login(family['email'])
+    with local_db.capture_queries() as statements:
+        posts = feed(client, headers)['posts']
+    assert any('FROM FeedInbox f' in sql for sql in statements) == (path == 'inbox')
+    ids = [post['id'] for post in posts]
+    assert len(ids) == len(set(ids))
+    assert set(ids) == family['posts'][first] | family['posts'][second]
+
+    shared = [post for post in posts if post['class_id'] == family['shared_class']]
+    assert shared and all(post['student_ids'] == [first, second] for post in shared)
+
+
+def test_student_filter_shows_only_that_childs_classes(client, login, family, path):
+    headers = login(family['email'])
+    for child, expected in family['posts'].items():
+        page = feed(client, headers, student_id=child)
+        assert {post['id'] for post in page['posts']} == expected
+        assert all(child in post['student_ids'] for post in page['posts'])
+    first, second = family['posts']
+    assert family['posts'][first] < family['posts'][second]
+
+
+def test_student_filter_rejects_other_families_children(client, db, login, family):
+    stranger = query(db, "SELECT MIN(student_id) AS id FROM ParentStudentLinks WHERE parent_user_id <> %s "
+                         "AND student_id NOT IN (SELECT student_id FROM ParentStudentLinks WHERE parent_user_id = %s)",
+                     (family['id'], family['id']))[0]['id']
+    headers = login(family['email'])
+    response = client.get(f'/api/parent/posts?student_id={stranger}', headers=headers)
+    assert response.status_code == 404
+    assert response.get_json()['message'] == 'Student is not linked to this parent.'
+    assert client.get('/api/parent/posts?student_id=abc', headers=headers).status_code == 400
@@ -0,0 +1,46 @@
+import bcrypt
+import pytest
+
+import passwords
+
+
+@pytest.fixture
+def hasher():
+    return passwords.PasswordHasher(rounds=4, executor='inline')
+
+
+def test_hash_verifies_and_records_its_cost(hasher):
+    password_hash = hasher.hash('correct horse')
+    assert passwords.hash_cost(password_hash) == 4
+    assert hasher.verify(password_hash, 'correct horse')
+    assert not hasher.verify(password_hash, 'wrong horse')
+
+
+def test_only_hashes_at_another_cost_need_a_rehash(hasher):
+    assert not hasher.needs_rehash(hasher.hash('correct horse'))
+    assert hasher.needs_rehash(bcrypt.hashpw(b'correct horse', bcrypt.gensalt(5)).decode('utf-8'))
+    assert hasher.needs_rehash('not-a-bcrypt-hash')
+
+
+def test_malformed_hash_fails_verification(hasher):
+    assert passwords.hash_cost('not-a-bcrypt-hash') is None
+    assert not hasher.verify('not-a-bcrypt-hash', 'correct horse')
+
+
+def test_passwords_longer_than_72_bytes_still_verify(hasher):
+    long_password = 'é' * 50
+    password_hash = hasher.hash(long_password)
+    assert hasher.verify(password_hash, long_password)
+    assert hasher.verify(password_hash, long_password[:36])
+
+
+def test_every_call_is_observed():
+    timings = []
+    hasher = passwords.PasswordHasher(rounds=4, executor='thread', max_workers=2, observe=timings.append)
+    try:
+        password_hash = hasher.hash('correct horse')
+        assert hasher.verify(password_hash, 'correct horse')
+        assert all(hasher.verify(h, 'p') for h in hasher.hash_many(['p', 'p']))
+    finally:
+        hasher.shutdown()
+    assert len(timings) == 5 and all(seconds >= 0 for seconds in timings)
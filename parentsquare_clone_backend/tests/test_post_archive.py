@@ -0,0 +1,100 @@
+import datetime
+import json
+import time
+
+import pytest
+
+import local_db
+import post_archive
+import search_index
+from feed_cache import ALL_POSTS_SCOPE, class_scope
+
+# No such post: archiving it touches caches and events only.
+MISSING_POST_ID = 10 ** 8
+
+
+@pytest.mark.parametrize('value', ['02-29', '02-30', '13-01', '8/1'])
+def test_school_year_start_must_exist_every_year(value):
+    with pytest.raises(ValueError):
+        post_archive.parse_school_year_start(value)
+
+
+def test_horizon_is_the_latest_school_year_start():
+    start = post_archive.parse_school_year_start('08-01')
+    assert post_archive.archive_horizon(datetime.datetime(2027, 3, 1, 12), school_year_start=start) == \
+        datetime.datetime(2026, 8, 1)
+    assert post_archive.archive_horizon(datetime.datetime(2028, 2, 29, 12), school_year_start=(2, 28)) == \
+        datetime.datetime(2028, 2, 28)
+
+
+def feed_queries(client, headers):
+    """Loads a parent's feed page; returns the SQL it ran (none from the cache) and its first class."""
+    with local_db.capture_queries() as statements:
+        response = client.get('/api/parent/posts?limit=5', headers=headers)
+    assert response.status_code == 200
+    return statements, response.get_json()['posts'][0]['class_id']
+
+
+def test_archive_event_from_another_worker_invalidates_cached_feeds(app_module, client, district, login):
+    headers = login(district['users']['parent'][0])
+    _, class_id = feed_queries(client, headers)
+    assert feed_queries(client, headers)[0] == []
+
+    # As DatabaseBackend delivers another worker's batch: this process published nothing.
+    app_module.post_events.publish('posts_archived', class_id, {'class_id': class_id, 'ids': [MISSING_POST_ID]})
+    assert feed_queries(client, headers)[0] != []
+
+
+def test_archiver_publishes_one_event_per_class(app_module):
+    rows = [{'id': MISSING_POST_ID, 'class_id': 1}, {'id': MISSING_POST_ID + 1, 'class_id': 2},
+            {'id': MISSING_POST_ID + 2, 'class_id': 1}]
+    subscription = app_module.post_events.subscribe([1, 2])
+    before = dict(app_module.post_feeds.snapshot([ALL_POSTS_SCOPE, class_scope(1), class_scope(2)]))
+    try:
+        app_module.publish_archived_posts(rows)
+        events = subscription.next_batch(timeout=0)
+    finally:
+        app_module.post_events.unsubscribe(subscription)
+
+    assert [(event.type, event.class_id, json.loads(event.data)['ids']) for event in events] == [
+        ('posts_archived', 1, [MISSING_POST_ID, MISSING_POST_ID + 2]),
+        ('posts_archived', 2, [MISSING_POST_ID + 1])]
+    after = dict(app_module.post_feeds.snapshot(before))
+    assert all(after[scope] > version for scope, version in before.items())
+
+
+def search(client, headers, text):
+    for _ in range(100):
+        response = client.get(f'/api/search?q={text}', headers=headers)
+        if response.status_code != 503:
+            break
+        time.sleep(0.05)
+    assert response.status_code == 200
+    return [post['id'] for post in response.get_json()['posts']]
+
+
+def test_archived_posts_stay_searchable_until_deleted(app_module, client, db, district, login):
+    teacher = district['users']['teacher'][0]
+    class_id = district['teacher_classes'][teacher][0]
+    headers = login(teacher)
+    response = client.post('/api/teacher/create_post', headers=headers,
+                           json={'title': 'Zebracrossing drill', 'content': 'Bring a coat', 'class_id': class_id})
+    assert response.status_code == 201
+    post_id = response.get_json()['post_id']
+
+    with db.cursor() as cursor:
+        cursor.execute("UPDATE Posts SET created_at = %s WHERE id = %s", (datetime.datetime(2000, 1, 1), post_id))
+    db.commit()
+    rows = post_archive.archive_batch(db, datetime.datetime(2000, 1, 2))
+    assert [row['id'] for row in rows] == [post_id]
+    app_module.publish_archived_posts(rows)
+    assert search(client, headers, 'zebracrossing') == [post_id]
+
+    # A rebuilt index reads the archive too.
+    rebuilt = search_index.SearchIndex([app_module.db_pool])
+    rebuilt.rebuild()
+    assert [found for found, _ in rebuilt.search('zebracrossing', [class_id])[0]] == [post_id]
+
+    admin = login(district['users']['school_admin'][0])
+    assert client.delete(f'/api/admin/delete_post/{post_id}', headers=admin).status_code == 200
+    assert search(client, headers, 'zebracrossing') == []
@@ -0,0 +1,80 @@
+import re
+
+import pymysql.converters
+import query_plans
+
+QUOTED_NUMBER = re.compile(r"\b(LIMIT|OFFSET)\s+('|\d+\s*,\s*')", re.IGNORECASE)
+
+
+def render(sql):
+    """The statement as pymysql sends it to MySQL with the sample params."""
+    return sql % tuple(pymysql.converters.escape_item(value, 'utf8mb4') for value in query_plans.sample_params(sql))
+
+
+def test_sample_sql_has_no_quoted_limit():
+    statements = query_plans.discover_statements() + query_plans.dynamic_statements()
+    limited = [statement for statement in statements if re.search(r'\bLIMIT\s+%s', statement.sql, re.IGNORECASE)]
+    assert limited
+    for statement in limited:
+        rendered = render(statement.sql)
+        assert not QUOTED_NUMBER.search(rendered), (statement.name, rendered)
+
+
+def test_sample_params_quote_everything_else():
+    sql = "SELECT id FROM Users WHERE email = %s AND id IN (%s, %s) ORDER BY id LIMIT %s, %s"
+    assert query_plans.sample_params(sql) == ('1', '1', '1', 20, 20)
+    assert render(sql).endswith("email = '1' AND id IN ('1', '1') ORDER BY id LIMIT 20, 20")
+
+
+def test_hot_statements_explain_without_errors(db):
+    _, regressions = query_plans.check_plans(db)
+    assert [entry['name'] for entry in regressions] == []
+
+
+def mysql_plan(table, access, key=None):
+    """One row of MySQL's EXPLAIN output."""
+    return {'id': 1, 'select_type': 'SIMPLE', 'table': table, 'partitions': None, 'type': access,
+            'possible_keys': key, 'key': key, 'key_len': '1022' if key else None, 'ref': 'const' if key else None,
+            'rows': 1 if key else 5000, 'filtered': 100.0, 'Extra': None if key else 'Using where'}
+
+
+class ExplainConnection:
+    """Answers EXPLAIN like a MySQL server whose Users table has lost uq_users_email."""
+
+    def __init__(self):
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, sql, params=None):
+        if 'FROM Users WHERE email = %s' in sql:
+            self.plan = [mysql_plan('Users', 'ALL')]
+        else:
+            # Derived tables are materialized and scanned by design.
+            self.plan = [mysql_plan('<derived2>', 'ALL'), mysql_plan('Posts', 'ref', 'idx_posts_class_created')]
+
+    def fetchall(self):
+        return self.plan
+
+    def close(self):
+        self.closed = True
+
+
+def test_full_scan_on_a_request_path_fails_check_plans(app_module, monkeypatch, tmp_path):
+    connection = ExplainConnection()
+    monkeypatch.setattr(app_module, 'connect_to_database', lambda: connection)
+    output = tmp_path / 'plans.json'
+    result = app_module.app.test_cli_runner().invoke(args=['db', 'check-plans', '--output', str(output)])
+
+    assert result.exit_code == 1
+    assert 'REGRESSION app.py:login:' in result.output
+    assert 'full scan of Users' in result.output
+    assert connection.closed and output.exists()
+    assert query_plans.full_scans([mysql_plan('<derived2>', 'ALL'), mysql_plan('Posts', 'ref', 'k')]) == []
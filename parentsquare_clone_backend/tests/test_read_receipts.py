@@ -0,0 +1,128 @@
+import pytest
+
+import read_receipts
+import shards
+
+# A class where one parent has two enrolled children, so the parent is one recipient.
+SIBLING_CLASS_SQL = """
+    SELECT se.class_id FROM ParentStudentLinks l
+    JOIN StudentEnrollments se ON se.student_id = l.student_id
+    GROUP BY se.class_id, l.parent_user_id HAVING COUNT(*) > 1
+    ORDER BY se.class_id LIMIT 1
+"""
+
+# Everyone whose feed shows the class: students with a login and their parents.
+RECIPIENTS_SQL = """
+    SELECT s.user_id FROM Students s JOIN StudentEnrollments se ON se.student_id = s.id
+    WHERE se.class_id = %s AND s.user_id IS NOT NULL
+    UNION
+    SELECT l.parent_user_id FROM ParentStudentLinks l JOIN StudentEnrollments se ON se.student_id = l.student_id
+    WHERE se.class_id = %s
+"""
+
+
+def query(db, sql, params=()):
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    db.commit()
+    return rows
+
+
+@pytest.fixture
+def buffer(app_module, district):
+    """A buffer of its own that flushes only when told to."""
+    buffer = read_receipts.ReadBuffer({shards.DEFAULT_SHARD: app_module.db_pool}, flush_interval=3600, max_pending=3)
+    yield buffer
+    buffer.close()
+
+
+@pytest.fixture
+def post(db, district):
+    """A fresh post in a class with a two-child family; returns its id, class and recipients."""
+    class_id = query(db, SIBLING_CLASS_SQL)[0]['class_id']
+    with db.cursor() as cursor:
+        cursor.execute("INSERT INTO Posts (title, content, user_id, class_id) "
+                       "SELECT 'Reading log', 'Due Friday', teacher_id, id FROM Classes WHERE id = %s", (class_id,))
+        post_id = cursor.lastrowid
+    db.commit()
+    recipients = sorted(row['user_id'] for row in query(db, RECIPIENTS_SQL, (class_id, class_id)))
+    yield {'id': post_id, 'class_id': class_id, 'recipients': recipients}
+    with db.cursor() as cursor:
+        cursor.execute("DELETE FROM PostReads WHERE post_id = %s", (post_id,))
+        cursor.execute("DELETE FROM Posts WHERE id = %s", (post_id,))
+    db.commit()
+
+
+def school_of(db, class_id):
+    return query(db, "SELECT school_id FROM Classes WHERE id = %s", (class_id,))[0]['school_id']
+
+
+def reads(db, post_id):
+    return {row['user_id']: row['read_count'] for row in
+            query(db, "SELECT user_id, read_count FROM PostReads WHERE post_id = %s", (post_id,))}
+
+
+def test_repeat_reads_coalesce_into_one_row(buffer, db, post):
+    reader = post['recipients'][0]
+    for _ in range(3):
+        buffer.record(shards.DEFAULT_SHARD, reader, [post['id']])
+    assert buffer.stats()['pending'] == 1 and buffer.stats()['coalesced'] == 2
+    assert buffer.flush() == 1
+    assert reads(db, post['id']) == {reader: 3}
+
+    buffer.record(shards.DEFAULT_SHARD, reader, [post['id']])
+    buffer.flush()
+    assert reads(db, post['id']) == {reader: 4}
+
+
+def test_full_buffer_drops_new_pairs_but_still_counts_known_ones(buffer, db, post):
+    first, *others = post['recipients'][:4]
+    assert len(others) == 3
+    buffer.record(shards.DEFAULT_SHARD, first, [post['id']])
+    for user_id in others:
+        buffer.record(shards.DEFAULT_SHARD, user_id, [post['id']])
+    buffer.record(shards.DEFAULT_SHARD, first, [post['id']])
+    stats = buffer.stats()
+    assert (stats['pending'], stats['dropped'], stats['coalesced']) == (3, 1, 1)
+    buffer.flush()
+    assert reads(db, post['id']) == {first: 2, others[0]: 1, others[1]: 1}
+
+
+def test_close_writes_out_pending_reads(buffer, db, post):
+    buffer.record(shards.DEFAULT_SHARD, post['recipients'][0], [post['id']])
+    assert buffer.close() == 1
+    assert reads(db, post['id']) == {post['recipients'][0]: 1}
+
+
+def test_reads_of_a_deleted_post_are_not_written(app_module, buffer, client, db, district, login, post):
+    buffer.record(shards.DEFAULT_SHARD, post['recipients'][0], [post['id']])
+    admin = login(district['users']['school_admin'][0])
+    assert client.delete(f"/api/admin/delete_post/{post['id']}", headers=admin).status_code == 200
+
+    assert buffer.flush() == 0
+    assert reads(db, post['id']) == {}
+    assert buffer.stats()['deleted_posts'] == 1
+
+
+def test_report_counts_each_recipient_once(buffer, db, post):
+    outsider = query(db, "SELECT id FROM Users WHERE role = 'parent' AND id NOT IN (%s) ORDER BY id LIMIT 1"
+                     % ', '.join(str(user_id) for user_id in post['recipients']))[0]['id']
+    readers = post['recipients'][:2]
+    for user_id in readers + [outsider]:
+        buffer.record(shards.DEFAULT_SHARD, user_id, [post['id']])
+    buffer.flush()
+
+    with db.cursor() as cursor:
+        counts = read_receipts.post_read_counts(cursor, [post])
+        total, unread = read_receipts.unread_recipients(cursor, post['id'], post['class_id'])
+        rates = read_receipts.class_read_rates(cursor, school_of(db, post['class_id']), post['class_id'])
+    db.commit()
+
+    assert counts == {post['id']: (len(post['recipients']), 2)}
+    assert total == len(post['recipients'])
+    assert sorted(row['id'] for row in unread) == post['recipients'][2:]
+    [rate] = rates
+    assert rate['recipients'] == len(post['recipients'])
+    assert rate['reads'] >= 2
+    assert rate['read_rate'] == read_receipts.read_rate(rate['reads'], rate['posts'] * rate['recipients'])
@@ -0,0 +1,76 @@
+from roster_import import RosterImport
+
+SCHOOL_ID = 1
+
+
+class RecordingHasher:
+    """Fake hasher that notes whether a write transaction was open while it ran."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.in_transaction = []
+
+    def hash_many(self, passwords):
+        self.in_transaction.append(self.connection.raw.in_transaction)
+        return [f'hash:{password}' for password in passwords]
+
+
+class FailFirstStudents(RosterImport):
+    failed = False
+
+    def _import_students(self, cursor, rows):
+        if rows and not self.failed:
+            self.failed = True
+            raise RuntimeError('lost the connection')
+        return super()._import_students(cursor, rows)
+
+
+def teacher(email):
+    return {'type': 'teacher', 'first_name': 'Ada', 'last_name': 'Byron', 'email': email, 'password': 'pw'}
+
+
+def school_class(name, teacher_email):
+    return {'type': 'class', 'class_name': name, 'teacher_email': teacher_email}
+
+
+def student(class_name):
+    return {'type': 'student', 'first_name': 'Kid', 'last_name': 'Byron', 'parent_email': 'p@example.org',
+            'class_name': class_name}
+
+
+def rows(*records):
+    return [(number, record, None) for number, record in enumerate(records, start=1)]
+
+
+def test_rolled_back_chunk_does_not_claim_its_keys(db):
+    email, class_name = 'rollback-teacher@school1.example.org', 'Rollback Class'
+    importer = FailFirstStudents(db, SCHOOL_ID, RecordingHasher(db), chunk_size=3)
+    results = importer.run(rows(teacher(email), school_class(class_name, email), student(class_name),
+                                teacher(email), school_class(class_name, email), student(class_name)))
+
+    assert [result['status'] for result in results[:3]] == ['error'] * 3
+    assert all('rolled back' in result['message'] for result in results[:3])
+    # Nothing from the first chunk was written, so the same rows go in next time.
+    assert [result['status'] for result in results[3:]] == ['created'] * 3
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM Users WHERE email = %s", (email,))
+        assert cursor.fetchone()['n'] == 1
+    db.commit()
+
+
+def test_duplicates_are_still_caught_across_committed_chunks(db):
+    email, class_name = 'dup-teacher@school1.example.org', 'Dup Class'
+    importer = RosterImport(db, SCHOOL_ID, RecordingHasher(db), chunk_size=2)
+    results = importer.run(rows(teacher(email), school_class(class_name, email),
+                                teacher(email), school_class(class_name, email)))
+    assert [result['status'] for result in results] == ['created', 'created', 'error', 'error']
+    assert results[2]['message'] == 'Email already registered'
+    assert results[3]['message'] == 'Class already exists'
+
+
+def test_passwords_are_hashed_outside_the_write_transaction(db):
+    hasher = RecordingHasher(db)
+    importer = RosterImport(db, SCHOOL_ID, hasher, chunk_size=2)
+    importer.run(rows(school_class('Hash Class', 'teacher1@school1.example.org'),
+                      teacher('hash-1@school1.example.org'), teacher('hash-2@school1.example.org')))
+    assert hasher.in_transaction == [False, False]
@@ -0,0 +1,129 @@
+import time
+
+import pytest
+
+import search_index
+from pagination import InvalidPageRequest
+
+
+@pytest.fixture
+def index():
+    """An index of a few posts in classes 1 and 2, built without a database."""
+    index = search_index.SearchIndex([])
+    index.add(1, 1, 'Field trip', 'Bring a packed lunch for the bus')
+    index.add(2, 1, 'Lunch menu', 'Pizza on Friday, and the field trip bus leaves at nine')
+    index.add(3, 1, 'Bus', 'Bus bus bus: the bus schedule changes')
+    index.add(4, 2, 'Field day', 'Sports on the field all afternoon')
+    return index
+
+
+def ids(results):
+    return [post_id for post_id, _ in results[0]]
+
+
+def test_title_words_outrank_content_words(index):
+    assert ids(index.search('field trip', [1])) == [1, 2]
+
+
+def test_more_occurrences_rank_higher(index):
+    assert ids(index.search('bus', [1]))[0] == 3
+
+
+def test_last_word_matches_as_a_prefix(index):
+    assert ids(index.search('field tr', [1])) == [1, 2]
+    assert sorted(ids(index.search('sched', [1]))) == [3]
+    assert ids(index.search('schedx', [1])) == []
+
+
+def test_only_the_callers_classes_are_searched(index):
+    assert sorted(ids(index.search('field', [1, 2]))) == [1, 2, 4]
+    assert ids(index.search('field', [2])) == [4]
+    assert ids(index.search('field', [])) == []
+
+
+def test_pages_follow_the_score_and_id_cursor(index):
+    seen, after = [], None
+    while True:
+        results, after = index.search('bus', [1, 2], limit=1, after=after)
+        seen += [post_id for post_id, _ in results]
+        if after is None:
+            break
+        after = search_index.decode_search_cursor(search_index.encode_search_cursor(*after))
+    assert seen == ids(index.search('bus', [1, 2]))
+    assert len(seen) == len(set(seen)) == 3
+
+    with pytest.raises(InvalidPageRequest):
+        search_index.decode_search_cursor('not a cursor')
+
+
+def search(client, headers, text, **args):
+    query = '&'.join(f'{key}={value}' for key, value in dict(q=text, **args).items())
+    for _ in range(100):
+        response = client.get(f'/api/search?{query}', headers=headers)
+        if response.status_code != 503:
+            break
+        time.sleep(0.05)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def parent_classes(db, email):
+    with db.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT se.class_id FROM Users u
+            JOIN ParentStudentLinks l ON l.parent_user_id = u.id
+            JOIN StudentEnrollments se ON se.student_id = l.student_id
+            WHERE u.email = %s
+        """, (email,))
+        rows = cursor.fetchall()
+    db.commit()
+    return {row['class_id'] for row in rows}
+
+
+@pytest.fixture
+def posts_about_quokkas(client, db, district, login):
+    """A quokka post in each class; returns the parent, their class ids and {class_id: post_id}."""
+    parent = district['users']['parent'][0]
+    posted, created = {}, []
+    for teacher, class_ids in district['teacher_classes'].items():
+        headers = login(teacher)
+        for class_id in class_ids:
+            response = client.post('/api/teacher/create_post', headers=headers,
+                                   json={'title': 'Quokka visit', 'content': 'The zoo brings quokkas', 'class_id': class_id})
+            assert response.status_code == 201
+            posted[class_id] = response.get_json()['post_id']
+    yield parent, parent_classes(db, parent), posted
+    admin_headers = [login(admin) for admin in district['users']['school_admin']]
+    for post_id in posted.values():
+        for headers in admin_headers:
+            if client.delete(f'/api/admin/delete_post/{post_id}', headers=headers).status_code == 200:
+                break
+
+
+def test_parent_finds_only_their_childrens_classes(client, login, posts_about_quokkas):
+    parent, class_ids, posted = posts_about_quokkas
+    found = search(client, login(parent), 'quokka')
+    assert class_ids and len(posted) > len(class_ids)
+    assert sorted(post['id'] for post in found['posts']) == sorted(posted[class_id] for class_id in class_ids)
+    assert {post['class_id'] for post in found['posts']} == class_ids
+
+
+def test_search_pages_with_next_cursor(client, login, district, posts_about_quokkas):
+    _, _, posted = posts_about_quokkas
+    teacher = district['users']['teacher'][0]
+    headers = login(teacher)
+    expected = sorted(posted[class_id] for class_id in district['teacher_classes'][teacher])
+    assert len(expected) > 1
+
+    seen, cursor = [], None
+    while True:
+        page = search(client, headers, 'quokka', limit=1, **({'cursor': cursor} if cursor else {}))
+        assert len(page['posts']) <= 1
+        seen += [post['id'] for post in page['posts']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert sorted(seen) == expected
+
+    response = client.get('/api/search?q=quokka&cursor=bogus', headers=headers)
+    assert response.status_code == 400
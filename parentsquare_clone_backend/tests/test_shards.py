@@ -0,0 +1,71 @@
+import pytest
+
+import local_db
+import schema_migrations
+import shards
+
+BATCH = 3
+
+
+@pytest.fixture
+def target(district, tmp_path):
+    """An empty, migrated database to copy a school into."""
+    connection = local_db.connect(str(tmp_path / 'target.sqlite3'))
+    schema_migrations.upgrade(connection, log=lambda message: None)
+    yield connection
+    connection.close()
+
+
+def school_rows(connection, school_id):
+    rows = {}
+    with connection.cursor() as cursor:
+        for table, _, keys, query in shards.SCHOOL_TABLES:
+            cursor.execute(query, (school_id,))
+            rows[table] = sorted(cursor.fetchall(), key=lambda row: tuple(row[key] for key in keys))
+    connection.commit()
+    return rows
+
+
+def first_school(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT MIN(id) AS id FROM Schools")
+        return cursor.fetchone()['id']
+
+
+def test_sync_copies_a_school_in_key_ordered_batches(db, target):
+    school_id = first_school(db)
+    source = school_rows(db, school_id)
+    assert len(source['FeedInbox']) > BATCH and len(source['Users']) > BATCH
+
+    with local_db.capture_queries() as statements:
+        written = shards.sync_school(db, target, school_id, batch_size=BATCH)
+    assert school_rows(target, school_id) == source
+    assert written == {table: len(rows) for table, rows in source.items()}
+    reads = [sql for sql in statements if sql.lstrip().upper().startswith('SELECT')]
+    assert reads and all(sql.rstrip().endswith('LIMIT %s') for sql in reads)
+
+    assert sum(shards.sync_school(db, target, school_id, batch_size=BATCH).values()) == 0
+
+
+def test_sync_writes_only_the_differences(db, target):
+    school_id = first_school(db)
+    shards.sync_school(db, target, school_id, batch_size=BATCH)
+    inbox = school_rows(target, school_id)['FeedInbox']
+    with target.cursor() as cursor:
+        cursor.execute("UPDATE Posts SET title = 'edited' WHERE id = (SELECT MIN(id) FROM Posts)")
+        cursor.execute("DELETE FROM FeedInbox WHERE user_id = %s AND post_id = %s",
+                       (inbox[-1]['user_id'], inbox[-1]['post_id']))
+        cursor.execute("INSERT INTO FeedInbox (user_id, created_at, post_id) VALUES (%s, %s, %s)",
+                       (inbox[0]['user_id'], inbox[0]['created_at'], 10 ** 8))
+    target.commit()
+
+    written = shards.sync_school(db, target, school_id, batch_size=BATCH)
+    assert {table: count for table, count in written.items() if count} == {'Posts': 2, 'FeedInbox': 2}
+    assert school_rows(target, school_id) == school_rows(db, school_id)
+
+
+def test_delete_school_rows_in_batches(db, target):
+    school_id = first_school(db)
+    shards.sync_school(db, target, school_id, batch_size=BATCH)
+    shards.delete_school_rows(target, school_id, batch_size=BATCH)
+    assert all(not rows for rows in school_rows(target, school_id).values())
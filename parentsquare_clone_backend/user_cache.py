@@ -0,0 +1,58 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserProfileCache:
+    """A per-process LRU cache of user profiles with a time-to-live.
+
+    Entries are plain dicts (id, role, school_id, names, email); password
+    hashes are never cached.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def get(self, user_id):
+        """Returns the cached profile, or None if it is missing or stale."""
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return dict(entry[1])
+
+    def put(self, user_id, profile):
+        """Caches a profile, evicting the least recently used entry if full."""
+        key = str(user_id)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), dict(profile))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, user_id):
+        """Drops a user's profile; call whenever their Users row changes."""
+        with self._lock:
+            if self._entries.pop(str(user_id), None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = len(self._entries)
+        return snapshot
@@ -12,13 +12,28 @@ function showToast(message, type = 'success') {
     }, 5000);
 }
 
+// After a login or a write the server sends a short-lived X-Read-Primary
+// token; sending it back keeps our next reads on the database that has our write
+function authHeaders(headers = {}) {
+    headers['Authorization'] = `Bearer ${localStorage.getItem('accessToken')}`;
+    const readPrimary = localStorage.getItem('readPrimary');
+    if (readPrimary) headers['X-Read-Primary'] = readPrimary;
+    return headers;
+}
+
+function rememberReadPrimary(response) {
+    const token = response.headers.get('X-Read-Primary');
+    if (token) localStorage.setItem('readPrimary', token);
+}
+
 // Function to handle form submission and log in
 async function handleLogin(event) {
     event.preventDefault();
     const email = document.getElementById('email').value;
     const password = document.getElementById('password').value;
 
-    const loginData = { email: email, password: password };
+    // Ask for the first screen's data too, saving a round trip.
+    const loginData = { email: email, password: password, include_dashboard: true };
     const backendUrl = 'http://127.0.0.1:5000/api/login';
 
     try {
@@ -31,6 +46,7 @@ async function handleLogin(event) {
         const data = await response.json();
 
         if (response.ok) {
+            rememberReadPrimary(response);
             localStorage.setItem('accessToken', data.access_token);
             localStorage.setItem('userRole', data.user.role);
             localStorage.setItem('userId', data.user.id);
@@ -41,7 +57,7 @@ async function handleLogin(event) {
             console.log('User Role:', data.user.role);
 
             document.getElementById('logout-button').style.display = 'block';
-            renderDashboard(data.user.role);
+            renderDashboard(data.user.role, data.dashboard);
         } else {
             showToast(data.message, 'error');
         }
@@ -61,21 +77,18 @@ async function handleCreatePost(event) {
     const postData = { title, content, class_id: classId };
     
     const backendUrl = 'http://127.0.0.1:5000/api/teacher/create_post';
-    const accessToken = localStorage.getItem('accessToken');
 
     try {
         const response = await fetch(backendUrl, {
             method: 'POST',
-            headers: { 
-                'Content-Type': 'application/json',
-                'Authorization': `Bearer ${accessToken}`
-            },
+            headers: authHeaders({ 'Content-Type': 'application/json' }),
             body: JSON.stringify(postData)
         });
 
         const data = await response.json();
 
         if (response.ok) {
+            rememberReadPrimary(response);
             showToast('Post created successfully!', 'success');
             document.getElementById('post-form').reset();
         } else {
@@ -90,15 +103,15 @@ async function handleCreatePost(event) {
 // Function to handle post deletion for admins
 async function handleDeletePost(postId) {
     const backendUrl = `http://127.0.0.1:5000/api/admin/delete_post/${postId}`;
-    const accessToken = localStorage.getItem('accessToken');
 
     try {
         const response = await fetch(backendUrl, {
             method: 'DELETE',
-            headers: { 'Authorization': `Bearer ${accessToken}` }
+            headers: authHeaders()
         });
         
         if (response.ok) {
+            rememberReadPrimary(response);
             showToast(`Post deleted successfully.`, 'success');
             fetchPosts('school_admin'); 
         } else {
@@ -118,71 +131,154 @@ function formatTimestamp(timestamp) {
     return date.toLocaleDateString('en-US', options);
 }
 
-// Function to fetch and display posts for different roles
-async function fetchPosts(role) {
+// The list element each role's feed is rendered into
+function postsListId(role) {
+    if (role === 'school_admin') return 'admin-posts-list';
+    if (role === 'parent') return 'parent-posts-list';
+    return 'posts-list';
+}
+
+// A parent's children by id, from the last feed response
+let parentChildren = {};
+
+// Names of the children a parent's post concerns, e.g. "Priya, Sam"
+function childNames(post) {
+    return (post.student_ids || [])
+        .map(id => parentChildren[id] && parentChildren[id].first_name)
+        .filter(Boolean)
+        .join(', ');
+}
+
+// Builds the card for one post
+function renderPostCard(post, role) {
+    const postCard = document.createElement('div');
+    postCard.className = 'card';
+    postCard.dataset.postId = post.id;
+
+    let cardContent = `
+        <h4>${post.title}</h4>
+        <p>${post.content}</p>
+        <small>Posted by ${post.author_first_name} ${post.author_last_name} in ${post.class_name} on ${formatTimestamp(post.created_at)}</small>
+    `;
+
+    const forChildren = role === 'parent' ? childNames(post) : '';
+    if (forChildren) {
+        cardContent += `<small class="post-children">For ${forChildren}</small>`;
+    }
+
+    if (role === 'school_admin') {
+        cardContent += `<button class="delete-btn" onclick="handleDeletePost(${post.id})">Delete</button>`;
+    }
+
+    postCard.innerHTML = cardContent;
+    return postCard;
+}
+
+// Function to fetch and display posts for different roles, one page at a time
+async function fetchPosts(role, cursor = null) {
     let endpoint;
-    let listElementId;
+    const listElementId = postsListId(role);
     
     if (role === 'school_admin') {
         endpoint = 'http://127.0.0.1:5000/api/admin/posts';
-        listElementId = 'admin-posts-list';
     } else if (role === 'parent') {
         endpoint = 'http://127.0.0.1:5000/api/parent/posts';
-        listElementId = 'parent-posts-list';
     } else {
         endpoint = 'http://127.0.0.1:5000/api/student/posts';
-        listElementId = 'posts-list';
     }
 
-    const accessToken = localStorage.getItem('accessToken');
+    if (cursor) {
+        endpoint += `?cursor=${encodeURIComponent(cursor)}`;
+    }
+
     const postsList = document.getElementById(listElementId);
     
     if (!postsList) return;
     
-    postsList.innerHTML = '<p class="loading">Loading posts...</p>';
+    const existingLoadMore = postsList.querySelector('.load-more-btn');
+    if (existingLoadMore) existingLoadMore.remove();
+
+    if (!cursor) {
+        postsList.innerHTML = '<p class="loading">Loading posts...</p>';
+    }
 
     try {
         const response = await fetch(endpoint, {
             method: 'GET',
-            headers: { 'Authorization': `Bearer ${accessToken}` }
+            headers: authHeaders()
         });
         
-        const posts = await response.json();
-
-        if (response.ok) {
-            postsList.innerHTML = '';
-            if (posts.length === 0) {
-                postsList.innerHTML = '<p class="info">No posts to display.</p>';
-            } else {
-                posts.forEach(post => {
-                    const postCard = document.createElement('div');
-                    postCard.className = 'card';
-                    
-                    let cardContent = `
-                        <h4>${post.title}</h4>
-                        <p>${post.content}</p>
-                        <small>Posted by ${post.author_first_name} ${post.author_last_name} in ${post.class_name} on ${formatTimestamp(post.created_at)}</small>
-                    `;
-                    
-                    if (role === 'school_admin') {
-                        cardContent += `<button class="delete-btn" onclick="handleDeletePost(${post.id})">Delete</button>`;
-                    }
-                    
-                    postCard.innerHTML = cardContent;
-                    postsList.appendChild(postCard);
-                });
-            }
-        } else {
-            postsList.innerHTML = `<p class="error-message">Error fetching posts: ${posts.message}</p>`;
-        }
+        const data = await response.json();
+        renderPosts(role, postsList, response.ok, data, cursor);
     } catch (error) {
         postsList.innerHTML = '<p class="error-message">Network error fetching posts.</p>';
         console.error('Network error:', error);
     }
 }
 
-// Master function to render the correct dashboard
-function renderDashboard(role) {
+// Renders one page of a feed response into the role's list
+function renderPosts(role, postsList, ok, data, cursor = null) {
+    if (!ok) {
+        postsList.innerHTML = `<p class="error-message">Error fetching posts: ${data.message}</p>`;
+        return;
+    }
+
+    const posts = data.posts;
+    if (data.children) {
+        parentChildren = Object.fromEntries(data.children.map(child => [child.id, child]));
+    }
+    if (!cursor) {
+        postsList.innerHTML = '';
+    }
+    if (!cursor && posts.length === 0) {
+        postsList.innerHTML = '<p class="info">No posts to display.</p>';
+    } else {
+        posts.forEach(post => {
+            postsList.appendChild(renderPostCard(post, role));
+        });
+    }
+
+    if (data.next_cursor) {
+        const loadMoreButton = document.createElement('button');
+        loadMoreButton.className = 'action-button load-more-btn';
+        loadMoreButton.textContent = 'Load more';
+        loadMoreButton.addEventListener('click', () => fetchPosts(role, data.next_cursor));
+        postsList.appendChild(loadMoreButton);
+    }
+}
+
+// Live updates: new and deleted posts arrive over Server-Sent Events
+let postEvents = null;
+
+function subscribeToPostEvents(role) {
+    if (postEvents) postEvents.close();
+    const accessToken = localStorage.getItem('accessToken');
+    // EventSource reconnects on its own and resumes with Last-Event-ID.
+    postEvents = new EventSource(`http://127.0.0.1:5000/api/events?jwt=${encodeURIComponent(accessToken)}`);
+
+    postEvents.addEventListener('post_created', (event) => {
+        const postsList = document.getElementById(postsListId(role));
+        if (!postsList) return;
+        const post = JSON.parse(event.data);
+        if (postsList.querySelector(`[data-post-id="${post.id}"]`)) return;
+        const emptyMessage = postsList.querySelector('.info');
+        if (emptyMessage) emptyMessage.remove();
+        postsList.prepend(renderPostCard(post, role));
+    });
+
+    postEvents.addEventListener('post_deleted', (event) => {
+        const post = JSON.parse(event.data);
+        const postCard = document.querySelector(`[data-post-id="${post.id}"]`);
+        if (postCard) postCard.remove();
+    });
+
+    // Missed too many events to replay: reload the feed instead.
+    postEvents.addEventListener('resync', () => fetchPosts(role));
+}
+
+// Master function to render the correct dashboard; `dashboard` holds
+// the responses the login returned for it, if any
+function renderDashboard(role, dashboard = null) {
     document.querySelectorAll('.section').forEach(section => {
         section.style.display = 'none';
     });
@@ -198,13 +294,21 @@ function renderDashboard(role) {
     if (dashboardSection) {
         dashboardSection.style.display = 'block';
         if (role === 'student' || role === 'parent' || role === 'school_admin') {
-            fetchPosts(role);
+            const feed = dashboard && dashboard.find(result => result.path.endsWith('/posts'));
+            const postsList = document.getElementById(postsListId(role));
+            if (feed && postsList) {
+                renderPosts(role, postsList, feed.status === 200, feed.body);
+            } else {
+                fetchPosts(role);
+            }
+            subscribeToPostEvents(role);
         }
     }
 }
 
 // Function to handle logout
 function handleLogout() {
+    if (postEvents) postEvents.close();
     localStorage.clear();
     location.reload();
 }